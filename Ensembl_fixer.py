@@ -36,59 +36,87 @@ added some additional testing to make header line parsing more robust -PW 12/1/2
 """ 
 import os
 import sys
-import copy
 import re
 import argparse
+import functools
 import fasta_lib
 
                        
-def parse_ensembl_header_line(line, all_tags):
-    """Parses new format Ensembl FASTA header lines."""
-    original = line
+# set up the list of possible tags in header lines
+# this should probably be generalized somehow...
+ALL_TAGS = ['pep:', 'pep scaffold:', 'pep genescaffold:', 'pep chromosome:', 'pep contig:',
+            'pep reftig:', 'pep supercontig:', 'pep ultracontig:', 'pep group:',
+            'pep primary_assembly', 'gene:', 'transcript:', 'gene_biotype:',
+            'transcript_biotype:', 'gene_symbol:', 'description:']
+
+# the usual field order of Ensembl header lines, matched in one step
+# (lines that do not fit fall back to finding the tags one by one)
+HEADER_PATTERN = re.compile(r'pep(?: [a-z_]+)?:?\S*'
+                            r'(?: gene:(?P<gene>\S+))?'
+                            r'(?: transcript:(?P<transcript>\S+))?'
+                            r'(?: gene_biotype:\S+)?'
+                            r'(?: transcript_biotype:\S+)?'
+                            r'(?: gene_symbol:(?P<gene_symbol>\S+))?'
+                            r'(?: description:(?P<description>.*))?')
+NON_DIGITS = re.compile(r'\D')
+
+@functools.lru_cache(maxsize=None)
+def tag_pattern(all_tags):
+    """Compiles one regex that matches any of the header tags (a tuple)."""
+    return re.compile('|'.join([re.escape(tag) for tag in sorted(all_tags, key=len, reverse=True)]))
+
+@functools.lru_cache(maxsize=65536)
+def ensembl_number(stable_id):
+    """Ensembl gene or transcript ID as a number string (cached, isoforms share genes)."""
+    return str(float(NON_DIGITS.sub('', stable_id)))
+
+def parse_fields(line, all_tags):
+    """Returns dictionary of tag: value for any header line layout."""
     parsed = {}
-    tags = [x for x in all_tags if x in line]
-    if not tags:    # might get empty tags if DB already fixed
-        return line
-    
-    while line:
-        line = line.strip() # do some trimming
-        current_tag = tags.pop()    # get the next tag (from end to beginning)
-        line, current_value = line.split(current_tag) # split out the next element
-        parsed[current_tag] = current_value # save element in tag dictionary
+    matches = list(tag_pattern(tuple(all_tags)).finditer(line))
+    for i, match in enumerate(matches):
+        tag = match.group()
+        if tag == 'description:' or i == len(matches) - 1:
+            parsed[tag] = line[match.end():]
+            break
+        parsed[tag] = line[match.end():matches[i+1].start()].rstrip()
+    return parsed
+
+def parse_ensembl_header_line(line, all_tags=ALL_TAGS):
+    """Parses new format Ensembl FASTA header lines.
+    The description is always the last field (it can contain colons).
+    """
+    stripped = line.strip()
+    match = HEADER_PATTERN.fullmatch(stripped) if all_tags is ALL_TAGS else None
+    if match:
+        gene, transcript, symbol, description = match.group('gene', 'transcript', 'gene_symbol', 'description')
+    else:
+        parsed = parse_fields(stripped, all_tags)
+        if not parsed:    # might get empty tags if DB already fixed
+            return line
+        gene = parsed.get('gene:')
+        transcript = parsed.get('transcript:')
+        symbol = parsed.get('gene_symbol:')
+        description = parsed.get('description:')
         
     # build the desired description string
-    if 'description:' not in parsed:
-        parsed['description:'] = 'NO DESCRIPTION'
-    extra = ' ('
-    if 'gene:' in parsed and parsed['gene:']:
-        if parsed['gene:'].startswith('ENS'):
-            extra += 'g:' + str(float(re.sub("\D", "", parsed['gene:'])))
-        else:
-            extra += 'g:' + parsed['gene:']
-    if 'transcript:' in parsed and parsed['transcript:']:
-        if extra != ' (':
-            extra += ', '
-        if parsed['transcript:'].startswith('ENS'):
-            extra += 't:' + str(float(re.sub("\D", "", parsed['transcript:'])))
-        else:
-            extra += 't:' + parsed['transcript:']
-    if 'gene_symbol:' in parsed and parsed['gene_symbol:']:
-        symbol = parsed['gene_symbol:']
-        if extra != ' (':
-            extra += ', '
-        extra += 'gs:' + parsed['gene_symbol:']
-    if extra == ' (':
-        extra =  ''
-    else:
-        extra += ')'
-    
-    return parsed['description:'] + extra
+    if description is None:
+        description = 'NO DESCRIPTION'
+    extra = []
+    if gene:
+        extra.append('g:' + (ensembl_number(gene) if gene.startswith('ENS') else gene))
+    if transcript:
+        extra.append('t:' + (ensembl_number(transcript) if transcript.startswith('ENS') else transcript))
+    if symbol:
+        extra.append('gs:' + symbol)
+    if not extra:
+        return description
+    return description + ' (' + ', '.join(extra) + ')'
 
-def main(fasta_file, up_one=False):
-    """Processes one Ensembl fasta file - reformats description lines, checks things.
+def fixed_file_name(fasta_file, up_one=False):
+    """Makes the "_fixed.fasta" name for a new database (False if that fails).
     up_one determines where the new file is written.
     """
-    # create the new database name
     original_fasta_file = os.path.basename(fasta_file)
     new_fasta_file = original_fasta_file.replace('.fasta', '_fixed.fasta')
     if new_fasta_file == original_fasta_file:
@@ -103,109 +131,183 @@ def main(fasta_file, up_one=False):
         folder_name = os.path.dirname(os.path.dirname(fasta_file))
     else:
         folder_name = os.path.dirname(fasta_file)
-    new_fasta_file = os.path.join(folder_name, new_fasta_file)
+    return os.path.join(folder_name, new_fasta_file)
 
-    # initializations
-    proteins = []
-    accessions = {}
-    p = fasta_lib.Protein()
-    pcount = 0      # sequence count
-    dup_count = 0   # duplicate accession count
-    stop_count = 0  # "*"
-    gap_count = 0   # "-"
-    no_met = 0      # does not start with M
-    X_count = 0     # unknow AA
-    B_count = 0     # N or D
-    Z_count = 0     # Q or E
-    J_count = 0     # I or L
-    U_count = 0     # selenocysteine
-    
-    # set up the list of possible tags in header lines
-    # this should probably be generalized somehow...
-    all_tags = ['pep:', 'pep scaffold:', 'pep genescaffold:', 'pep chromosome:', 'pep contig:',
-                'pep reftig:', 'pep supercontig:', 'pep ultracontig:', 'pep group:',
-                'pep primary_assembly', 'gene:', 'transcript:', 'gene_biotype:',
-                'transcript_biotype:', 'gene_symbol:', 'description:']
-
-    # read the sequences into a list
-    f = fasta_lib.FastaReader(fasta_file)
-    while f.readNextProtein(p, check_for_errs=True):
-        pcount += 1
+class EnsemblFixer:
+    """Checks and fixes Ensembl proteins one at a time and keeps the counts.
+    methods:
+        fix: fixes description and sequence, returns False for duplicates
+        write: writes a fixed protein (skips empty sequences)
+        report: prints the counts
+    Accessions and sequences are remembered as digests (see DigestSet),
+    so memory does not grow with the size of the sequences.
+    """
+    def __init__(self):
+        self.accessions = fasta_lib.DigestSet()
+        self.sequences = fasta_lib.DigestSet()
+        self.pcount = 0      # sequence count
+        self.fixcount = 0    # sequences written
+        self.dup_count = 0   # duplicate accession count
+        self.redundant = 0   # repeated sequence count
+        self.stop_count = 0  # "*"
+        self.gap_count = 0   # "-"
+        self.no_met = 0      # does not start with M
+        self.X_count = 0     # unknow AA
+        self.B_count = 0     # N or D
+        self.Z_count = 0     # Q or E
+        self.J_count = 0     # I or L
+        self.U_count = 0     # selenocysteine
+        self.all_tags = ALL_TAGS
+
+    def fix(self, p):
+        """Fixes one protein, returns False if it is a duplicate."""
+        self.pcount += 1
         
         # check if accession already seen
-        if p.accession in accessions:
-            dup_count += 1
-            accessions[p.accession] += 1
+        if self.accessions.seen(p.accession):
+            self.dup_count += 1
             print('...WARNING: skipping duplicate accession:', p.accession)
-            continue
-        else:
-            accessions[p.accession] = 1
+            return False
         
         # clean up the description string
-        p.new_desc = parse_ensembl_header_line(p.description, all_tags)
+        p.new_desc = parse_ensembl_header_line(p.description, self.all_tags)
         
         # test for odd amino acids, stop codons, gaps
         if not p.sequence.startswith('M'):
-            no_met += 1
+            self.no_met += 1
             p.new_desc = p.new_desc + ' (No starting Met)'
         if '*' in p.sequence:
-            stop_count += 1
+            self.stop_count += 1
             cut = p.sequence.index('*')
             string = ' (Premature stop %s/%s)' % (cut, len(p.sequence))
             p.new_desc = p.new_desc + string
             p.sequence = p.sequence[:cut]
         if '-' in p.sequence:
-            gap_count += 1
+            self.gap_count += 1
             p.new_desc = p.new_desc + ' (has gaps)'
         if 'B' in p.sequence:
-            B_count += 1
+            self.B_count += 1
             p.new_desc = p.new_desc + ' (has B)'
         if 'Z' in p.sequence:
-            Z_count += 1
+            self.Z_count += 1
             p.new_desc = p.new_desc + ' (has Z)'
         if 'J' in p.sequence:
-            J_count += 1
+            self.J_count += 1
             p.new_desc = p.new_desc + ' (has J)'
         if 'U' in p.sequence:
-            U_count += 1
+            self.U_count += 1
             p.new_desc = p.new_desc + ' (has U)'
         if 'X' in p.sequence:
-            X_count += 1
+            self.X_count += 1
             p.new_desc = p.new_desc + ' (has unknown X)'
-        
-        # save the protein in list
-        proteins.append(copy.deepcopy(p))
+        return True
 
-    # open the new protein fasta file and write out the proteins
-    fixcount = 0
-    file_obj = open(new_fasta_file, 'w')
-    for p in proteins:
+    def write(self, p, file_obj):
+        """Writes a fixed protein to "file_obj"."""
         if len(p.sequence) > 0:
+            if self.sequences.seen(p.sequence):
+                self.redundant += 1
             p.printProtein(file_obj)
         else:
             print('   empty sequence (stop codon at start):', p.accession)
-        fixcount += 1
+        self.fixcount += 1
+
+    def report(self, fasta_file):
+        """Prints out the report of oddball characters."""
+        print("   Ensembl database:", os.path.basename(fasta_file))
+        print("   translations that do not start with Met:", self.no_met)
+        print("   translations that have premature stop codons:", self.stop_count)
+        print("   translations that contain gaps:", self.gap_count)
+        print("   translations that contain X (unknowns):", self.X_count)
+        print("   translations that contain B:", self.B_count)
+        print("   translations that contain Z:", self.Z_count)
+        print("   translations that contain J:", self.J_count)
+        print("   translations that contain U:", self.U_count)
+        print("   total number of input sequences was:", self.pcount)
+        print("   total number of sequences written was:", self.fixcount)
+        print("   number of duplicate accessions was:", self.dup_count)
+        print("   number of redundant sequences was:", self.redundant)
+    # end class
+
+class StreamFixer:
+    """Fixes an Ensembl FASTA file while its gzip data is still arriving.
+    Used as a Downloader sink: each downloaded block goes to "write", so the
+    fixed file is written at the same time as the raw archive.
+    methods:
+        write: parses and fixes the next block of compressed data
+        close: finishes the fixed file and prints the report
+        abort: closes and deletes a partly fixed file (failed download)
+    """
+    def __init__(self, fasta_file, up_one=False):
+        self.fasta_file = fasta_file
+        self.new_fasta_file = fixed_file_name(fasta_file, up_one)
+        self.fixer = EnsemblFixer()
+        self._file_obj = open(self.new_fasta_file, 'w')
+        self._parser = fasta_lib.FastaStreamParser(self._protein, compressed=fasta_file.endswith('.gz'),
+                                                   check_for_errs=True)
+
+    def _protein(self, p):
+        """Fixes and writes each protein as it is parsed."""
+        if self.fixer.fix(p):
+            self.fixer.write(p, self._file_obj)
+
+    def write(self, block):
+        """Takes the next block of (compressed) data."""
+        self._parser.feed(block)
+
+    def close(self):
+        """Finishes the fixed file, returns its name."""
+        self._parser.close()
+        self._file_obj.close()
+        self.fixer.report(self.fasta_file)
+        return self.new_fasta_file
+
+    def abort(self):
+        """Closes and deletes the partly fixed file."""
+        self._file_obj.close()
+        if os.path.exists(self.new_fasta_file):
+            os.remove(self.new_fasta_file)
+    # end class
+
+@fasta_lib.profile_entry
+def main(fasta_file, up_one=False):
+    """Processes one Ensembl fasta file - reformats description lines, checks things.
+    up_one determines where the new file is written.
+    """
+    # create the new database name
+    new_fasta_file = fixed_file_name(fasta_file, up_one)
+    if not new_fasta_file:
+        return False
+
+    # fix and write each protein as it is read (nothing is kept in memory)
+    metrics = fasta_lib.RunMetrics('Ensembl_fixer.py')
+    fixer = EnsemblFixer()
+    p = fasta_lib.Protein()
+    f = fasta_lib.FastaReader(fasta_file)
+    file_obj = open(new_fasta_file, 'w')
+    prot_read = 0
+    metrics.start_stage(os.path.basename(fasta_file), f)
+    while f.readNextProtein(p, check_for_errs=True):
+        prot_read += 1
+        if (prot_read % 500000) == 0:
+            metrics.progress(prot_read)
+        if fixer.fix(p):
+            fixer.write(p, file_obj)
+            if p.sequence:
+                metrics.add('records_written')
     file_obj.close()
+    metrics.end_stage(prot_read)
 
     # print(out the report of oddball characters
-    print("   Ensembl database:", os.path.basename(fasta_file))
-    print("   translations that do not start with Met:", no_met)
-    print("   translations that have premature stop codons:", stop_count)
-    print("   translations that contain gaps:", gap_count)
-    print("   translations that contain X (unknowns):", X_count)
-    print("   translations that contain B:", B_count)
-    print("   translations that contain Z:", Z_count)
-    print("   translations that contain J:", J_count)
-    print("   translations that contain U:", U_count)
-    print("   total number of input sequences was:", pcount)
-    print("   total number of sequences written was:", fixcount)
-    print("   number of duplicate accessions was:", dup_count)
+    fixer.report(fasta_file)
+    metrics.summary()
 
     return new_fasta_file
     # end
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # set up command line arguments
     parser = argparse.ArgumentParser(description='Checks Ensembl databases and fixes descriptions.')
     parser.add_argument('-v', '--version', action='version', version='%(prog)s version 1.1.1')
@@ -214,7 +316,7 @@ if __name__ == '__main__':
     args = parser.parse_args()
         
     if len(sys.argv) > 1:   # options set from command line
-        fasta_files = args.files
+        fasta_files = args.file
     else:   # options set to hardcoded defaults if interactive mode or no passed commands
         fasta_files = []
     
@@ -35,8 +35,6 @@ TODO:
 # debugging and edits -PW 8/10/2017
 # added a little to reporting species without databases. -PW 20200502
 
-# may need to check release in pickle versus current on FTP site
-
 # Built-in module imports
 from tkinter import *
 from tkinter.ttk import *
@@ -44,18 +42,13 @@ from tkinter import messagebox
 from tkinter import filedialog
 import os
 import sys
-import ftplib
-import re
-import urllib.request
-import pickle
 from datetime import datetime
 
 # Imports dependent on other files
 # This python file only uses built-in modules, no external downloads required
 try:
     import fasta_lib
-    import Ensembl_fixer
-    import reverse_fasta
+    import proteome_engine
 except ImportError:
     print("Could not import all files.")
     sys.exit()
@@ -87,253 +80,20 @@ class CheckBoxes(Frame):
         for var in self.vars:
             var.set(0)
             
-class AnimalEntry:
-    """Container for Ensembl proteome entries."""
-    def __init__(self, c_n, l_n, taxid, e_a, acc, g_m, v_d, r_d, p_a):
-        """Basic constructor - sets most attributes."""
-        self.common_name = c_n          # Species Common Name (string)
-        self.latin_name = l_n           # Species Latin Name (string)
-        self.tax_ID = taxid             # Taxonomy ID Number (int)
-        self.ensembl_assembly = e_a     # Ensembl assembly (string?)
-        self.accession = acc            # Ensembl accession
-        self.genebuild_method = g_m     # Gene build method
-        self.variation_database = v_d   # Variation database name
-        self.reg_database = r_d         # Regular database
-        self.pre_assembly = p_a         # Pre-assembly information
-        self.folder_name = ""           # Folder Name for each species
-        self.ftp_file_path = ""         # Species ftp download path
-
-    def _dump(self):
-        """Diagnostic dump"""
-        print('\ncommon name:', self.common_name)
-        print('latin name:', self.latin_name)
-        print('tax ID:', self.tax_ID)
-        print('assembly:', self.ensembl_assembly)
-        print('accession:', self.accession)
-        print('gene build method:', self.genebuild_method)
-        print('variation DB:', self.variation_database)
-        print('regular DB:', self.reg_database)
-        print('pre-assembly:', self.pre_assembly)
-        print('folder:', self.folder_name)
-        print('ftp file path:', self.ftp_file_path)
-
 # Build GUI
-class GUI:
-    """Main GUI class for application."""
+class GUI(proteome_engine.EnsemblEngine):
+    """Main GUI class for application.
+    The catalog, download, and processing logic is in proteome_engine.EnsemblEngine.
+    """
     def __init__(self, url, prot_path, text, headers, banned_list, script_location, default_contams):
         """Create object and set some state attributes."""
-        self.url = url                          # Url of Ensembl FTP site
-        self.ensembl_prot_path = prot_path      # Location of Ensembl databases
-        self.ensembl_ftp = os.path.dirname(prot_path)   # top level where databases are
-        self.ftp = None                         # FTP object (set in login method)
-        self.text = text                        # HTML text of webpage
-        self.raw_table = []                     # HTML text of just animals table
+        proteome_engine.EnsemblEngine.__init__(self, url, prot_path, text, banned_list,
+                                               script_location, default_contams)
         self.selected_entries = []              # List of selected AnimalEntry objects
-        self.animal_list = []                   # List of all AnimalEntry objects
-        self.banned_list = banned_list          # List of file identifiers to be omitted when downloading
-        self.release = ''                       # Ensembl release number
-        self.version = ''                       # string like "v89"
         self.headers = headers                  # Needed for columns in tables
         self.proteome_IDs = []                  # List of unique proteome IDs
-        self.script_location = script_location  # Script path location
-        self.contams_database = os.path.join(self.script_location, default_contams)
         self.selected_default = os.path.join(script_location, 'default_Ensembl_species.txt')     # typical default species file path
-        self.data = None                        # Holds unpickled information saved from last session
         self.quit_save_state = "not triggered"  # Trigger for updating defaults file on quit status
-        
-        # List of characters that cannot be in folder names
-        self.illegal_characters = r"[\\#%&{}/<>*?:]"
-
-    # Helper Class Functions
-    # FTP support
-    def login(self):
-        """Open an FTP connection and login."""
-        self.ftp = ftplib.FTP()
-        self.ftp.connect(str(self.url))
-        self.ftp.login()
-
-    def logout(self):
-        """Close the FTP connection."""
-        try:
-            self.ftp.quit()
-        except:
-            pass # we will get error if there is no FTP connection to close
-
-    # some parsing support        
-    def clean_common_name(self, name):
-        """Removes some odd characters from common names."""
-        p = re.compile(r"alt=\"(.*?)\"")
-        m = p.search(name)
-        return m.groups()[0]
-
-    def clean_latin_name(self, name):
-        """Removes some odd characters from latin names."""
-        p = re.compile(r"<i\b[^>]*>(.*?)</i>")
-        m = p.search(name)
-        return m.groups()[0]
-
-    def create_raw_table(self):
-        """Finds table boundaries in the HTML page."""
-        # Setup html file to find required information 
-        # Find start and end of h3 header block
-        TEXT = self.text
-        if "<td" in TEXT:
-            start_ind = TEXT.index("<td")
-        if "</table>" in TEXT:
-           end_ind = TEXT.index("</table>")
-
-        # Text Block that needs to be parsed
-        self.raw_table = TEXT[start_ind:end_ind]
-
-    # Ensembl Animal Entry support
-    def load_all_entries(self):
-        """Loads Ensembl proteome entries from pickle file.
-        If file does not exist or file is out-of-date, returns False.
-        """
-        # get the ccontents of current_README file
-        self.login()
-        self.ftp.cwd(self.ensembl_ftp)  # move into current_README file location
-        listing = []
-        self.ftp.retrlines('RETR current_README', listing.append)
-
-        # Get the current release version from current_README
-        for line in listing:
-            if "Ensembl Release" in line:
-                items = line.split()
-                release = int(items[items.index('Release') + 1])
-
-        # see if pickle file exists
-        if not os.path.exists(os.path.join(self.script_location, 'Ensembl_current_release.pickle')):
-            print('pickle file not present')
-            self.release = release
-            self.version = "v{}".format(self.release)
-            return False
-
-        # get data from pickle file
-        self.data = self.unpickle_entries()
-        self.release = self.data["Release"]
-        self.version = "v{}".format(self.release)
-
-        # if pickled version matches current database version, then load entries from pickle file
-        if self.release == release:
-            self.animal_list = self.data["Entries"]
-            return True
-        else:
-            print('saved release is out-of-date')
-            self.release = release  # set this to the current release version
-            return False
-
-    def parse_raw_table(self):
-        """Gets Ensembl proteome entries. Looks for pickle file first and checks if current, if not fetches from web."""
-        if self.load_all_entries():
-            return  # pickled entries were read in and were current            
-        else:
-            print('fetching data from web')
-            # Parse header into animal list
-            # Need an alternative path for missing entries where gene build method is "import"
-            parser = re.compile(r'<td\b[^>]*>(.*?)</td>|</span\b[^>]*>(.*?)</span>')
-            matched_groups = parser.findall(self.raw_table)
-            parsed = []
-            for i in range(0, len(matched_groups), 9):  # Split 1D list into 2D so that each animal has 9 attributes
-                animal = matched_groups[i:i+9]
-                parsed.append(animal)
-                
-            # We want to remove the empty space produced by alternative path in regex
-            for animal in parsed:
-                for i in range(len(animal)):
-                    for path in animal[i]:
-                        if path:
-                            animal[i] = path
-                common_name = self.clean_common_name(animal[0])
-                latin_name = self.clean_latin_name(animal[1])
-                tax_id = animal[2]
-                if not str(tax_id).isdigit():  # In case tax_id is something other than a number
-                    tax_id = "000"
-
-                # Create main animal entry
-                animal_obj = AnimalEntry(common_name, latin_name, tax_id, animal[3], animal[4],
-                                         animal[5], animal[6], animal[7], animal[8])
-
-                # Set animal object's folder name (ftp download path is set in remove_invalid_animals method)
-                folder_name = "{}__{}__{}".format(animal_obj.common_name, animal_obj.latin_name, animal_obj.tax_ID)
-                folder_name = re.sub(self.illegal_characters, "_", folder_name)
-                animal_obj.folder_name = folder_name
-
-                # save animal record
-                self.animal_list.append(animal_obj)
-                
-            self.remove_invalid_animals()   # FTP paths are set in this method
-
-            # save the fetched species information
-            self.pickle_entries()
-
-    def remove_invalid_animals(self):
-        """Make sure animals in species table have actual FTP links."""
-        # if we cant find the animal directory, remove it from animal list
-        del_list = []
-        actual_list = self.get_animal_directory() # get list of FTP folders
-        actual_set = set(actual_list)
-        for i, animal in enumerate(self.animal_list):
-            if animal.ensembl_assembly == '-':  # no ftp if no assembly?
-                print('no FTP files:', animal.common_name)
-                del_list.append(i)
-            else:
-                test_name = animal.latin_name.lower().replace(" ", "_")
-                if test_name not in actual_set:
-                    match = self.double_check_animal(test_name, actual_list)
-                    if match:
-                        download_path = r"{}/{}/pep/".format(self.ensembl_prot_path, match)
-                        animal.ftp_file_path = download_path
-                    else:
-                        print('unknown animal:', animal.common_name)
-                        del_list.append(i)
-                else:
-                    download_path = r"{}/{}/pep/".format(self.ensembl_prot_path, test_name)
-                    animal.ftp_file_path = download_path
-
-        # delete list items (work backwards)
-        print('starting animal list length:', len(self.animal_list))
-        del_list = del_list[::-1]
-        for i in del_list:
-            del(self.animal_list[i])
-        print('ending animal list length:', len(self.animal_list))
-
-    def double_check_animal(self, test_name, actual_list):
-        """Latin species names in table do not always match FTP folder names (gorilla and dog)"""
-        test_set = set(test_name.split('_'))
-        for actual in actual_list:
-            actual_set = set(actual.split('_'))
-            if (actual_set < test_set) or (actual_set == test_set):
-                return actual
-        else:
-            return None
-
-    def get_animal_directory(self):
-        """Get list of folder names from the FTP site"""
-        self.login()
-        self.ftp.cwd(self.ensembl_prot_path)
-        listing = []
-        self.ftp.retrlines('LIST', listing.append)  # get list of folders
-        listing = [x.split()[-1].strip() for x in listing]
-        return listing
-        
-    def pickle_entries(self):
-        """Saves full left display list to make subsequent launches faster."""
-        text = {"Release": self.release, "Entries": self.animal_list}
-
-        # make sure we are in the location with the script
-        try:
-            os.chdir(self.script_location)
-        except OSError:
-            print("OSError occurred during pickling. Cwd: {}".format(os.getcwd()))
-
-        with open('Ensembl_current_release.pickle', 'wb') as file:
-            pickle.dump(text, file)
-
-    def unpickle_entries(self):
-        """Loads saved full left display list of species."""
-        with open('Ensembl_current_release.pickle', 'rb') as file:
-            return pickle.load(file)
 
     # list management functions
     def filter_entries(self):
@@ -344,13 +104,8 @@ class GUI:
         species_entry = self.search_species.get().lower()
         tax_entry = self.search_tax.get()
 
-        # filter on taxonomy number substring
-        self.selected_entries = [entry for entry in self.animal_list if tax_entry in entry.tax_ID]
-
-        # filter on species name substring
-        self.selected_entries = [entry for entry in self.selected_entries
-                                 if species_entry in entry.common_name.lower()
-                                 or species_entry in entry.latin_name.lower()]
+        # filter on taxonomy number and species name substrings
+        self.selected_entries = self.select_entries(tax_entry, species_entry)
         
     def get_filtered_proteome_list(self):
         """Calls relevant methods to create filtered lists, then finds intersection of the lists, 
@@ -545,9 +300,14 @@ class GUI:
                     self.save_defaults(overwrite=True)
             
     def download_databases(self):
-        """Fetches the database files for the selected species."""
-        self.login()    # refresh the FTP connection
-        
+        """Fetches the database files for the selected species.
+        Downloads and FASTA processing run in a background pipeline so the window stays live.
+        """
+        # only one set of downloads at a time
+        if self.pipeline and self.pipeline.is_alive():
+            messagebox.showwarning("Downloads Running", "Please wait for the current downloads to finish!")
+            return None
+
         # throw warning if no databases selected
         if len(self.tree_right.get_children()) == 0:
                messagebox.showwarning("Empty Selection", "No databases were selected for download!")
@@ -561,13 +321,7 @@ class GUI:
             return None
 
         # Make a separate folder to contain all files
-        ensembl_dir_name = r"Ensembl_v{}".format(self.release)
-        ensembl_dir_path = os.path.join(self.abs_dl_path, ensembl_dir_name)
-        try:
-            os.mkdir(ensembl_dir_path)
-        except FileExistsError:
-            pass
-        os.chdir(ensembl_dir_path)
+        ensembl_dir_path = self.make_download_folder(self.abs_dl_path)
 
         # Grab entries from right tree view
         download_common_names = [self.tree_right.item(entry)['values'][0] for entry in self.tree_right.get_children()]
@@ -582,84 +336,34 @@ class GUI:
                             if (int(_tuple[1]) == int(entry.tax_ID)) and
                             (_tuple[0] == entry.common_name)]
 
-        # Change ftp directory for each species
-        for entry in download_entries:
-            self.ftp.cwd(entry.ftp_file_path)
-
-            # Create a folder for each species
-            download_folder = os.path.join(ensembl_dir_path, entry.folder_name)
-            try:
-                os.mkdir(download_folder)
-                os.chdir(download_folder)
-            except FileExistsError:
-                os.chdir(download_folder)
-                
-            # Create a list of all files in each species folder
-            listing = []
-            self.ftp.retrlines('LIST', listing.append)
-            
-            # Download each selected entry's fasta file
-            for line in listing:
-                line = line.strip() # Want last item, so strip EOL
-                fname = line.split()[-1] # Get the file name
-                
-                # Skip any files that we do not want to download
-                if self.banned_file(fname):
-                    continue
-                fixed_fname = "{}__{}__{}".format(self.version, entry.common_name, fname)
-                fixed_fname = re.sub(self.illegal_characters, "_", fixed_fname)
-                self.update_status_bar("Downloading {} file".format(fname))
-                self.ftp.retrbinary('RETR {}'.format(fname), open('{}'.format(fname), 'wb').write)
-                print("{} is done downloading".format(fname))
-                os.rename(os.path.join(download_folder, fname),
-                          os.path.join(download_folder, fixed_fname))
-                self.make_fasta_files(os.path.join(ensembl_dir_path, entry.folder_name, fixed_fname), entry)
-
-        messagebox.showinfo("All Downloads Completed!", "Downloads Finished!")
-
-    def make_fasta_files(self, file_location, entry):
-        """Uncompresses FASTA file, reformats descriptions, and does some analysis.
-        """
-        # analyze and fix descriptions (also uncompresses the file)
-        new_fasta_file = Ensembl_fixer.main(file_location, up_one=True)
-
-        # chdir into correct folder and make sure all file paths are set up correctly
-        contam_location = self.contams_database
-        print('contams:', contam_location)
-        ensembl_dir_name = r"Ensembl_v{}".format(self.release)
-        os.chdir(os.path.join(self.abs_dl_path, ensembl_dir_name))
-        
-        # Add forward/reverse/contams, as specified by checkboxes
-        self.process_databases(new_fasta_file, contam_location)
+        # start the downloads (folder listings are made on the pipeline thread) and watch progress
+        (forward, both) = self.processing_options()
+        self.pipeline = fasta_lib.DownloadPipeline(fasta_lib.Downloader(workers=proteome_engine.DOWNLOADS))
+        self.pipeline.start(self.download_jobs(download_entries, ensembl_dir_path, forward, both))
+        self.watch_pipeline()
+
+    def watch_pipeline(self):
+        """Shows pipeline progress in the status bar until the downloads are done."""
+        for message in self.pipeline.poll():
+            self.update_status_bar(message)
+        if self.pipeline.is_alive():
+            self.root.after(200, self.watch_pipeline)
+        elif self.pipeline.failed:
+            messagebox.showwarning("Downloads Completed!",
+                                   "These downloads failed:\n" + "\n".join(self.pipeline.failed))
+        else:
+            messagebox.showinfo("All Downloads Completed!", "Downloads Finished!")
 
-    def process_databases(self, fasta_file, contam_location):
-        """Gets selection value from radiobuttons and then passes those values to imported fasta_reverse function.
-        More documentation on how fasta_reverse works can be found in the reverse_fasta.py file.
+    def processing_options(self):
+        """Gets selection values from the checkboxes for the reverse_fasta main function.
+        More documentation on how reverse_fasta works can be found in the reverse_fasta.py file.
+        Returns (forward, both) flags.
         """
         reverse_values = list(self.reverse_contams.get_state())
-        # Initially set everything to false
-        forward = False
-        reverse = False
-        both = False
         decoy_contams = reverse_values[0]
         target_contams = reverse_values[1]
+        return (bool(target_contams), bool(decoy_contams))
         
-        if decoy_contams:
-            both = True
-        if target_contams:
-            forward = True
-            
-        if decoy_contams or target_contams:        
-            reverse_fasta.main(fasta_file, forward, reverse, both, contam_path=contam_location)
-        
-    def banned_file(self, fname):
-        """False if fname in banned list."""
-        skip = False
-        for ban in self.banned_list:
-            if ban.lower() in fname.lower():
-                skip = True
-        return skip
-    
     def update_status_bar(self, _text):
         """Updates status bar with new text"""
         self.status_bar.config(text=_text)
@@ -667,6 +371,12 @@ class GUI:
         
     def quit_gui(self):
         """Quits the GUI application."""
+        if self.pipeline and self.pipeline.is_alive():
+            # quitting would leave the downloads running with no window
+            if not messagebox.askyesno("Downloads Running",
+                                       "Downloads are still running. Cancel them and quit?"):
+                return
+            self.pipeline.stop()
         self.logout()   # close the FTP connection
         self.update_defaults()
         self.root.withdraw()
@@ -846,10 +556,7 @@ if __name__ == '__main__':
     print('Starting Ensembl_proteome_manager.py - querying Ensembl...')
 
     # Get HTML page from Ensembl for parsing
-    PARSE_URL = r'http://www.ensembl.org/info/about/species.html'
-    RESPONSE = urllib.request.urlopen(PARSE_URL)
-    DATA = RESPONSE.read()
-    TEXT = DATA.decode('utf-8')
+    TEXT = proteome_engine.EnsemblEngine.fetch_species_page()
 
     # create the GUI object and start program    
     gui = GUI(FTP_URL, PROT_PATH, TEXT, HEADERS, BANNED, SCRIPT_LOCATION, DEFAULT_CONTAMS)
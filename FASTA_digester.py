@@ -37,6 +37,7 @@ import numpy
 import fasta_lib
 
 
+@fasta_lib.profile_entry
 def fasta_digester(fasta_file, enzyme='trypsin', log=[None]):
     """Trypsin digests entries in a FASTA protein database.
         Call with FASTA filename, returns list of proteins with
@@ -84,7 +85,7 @@ def fasta_digester(fasta_file, enzyme='trypsin', log=[None]):
     all_peptides = {}
     print('starting file reading:', time.ctime())
 
-    # read proteins until EOF; NOTE: checking for errors slows program by factor of 3 or 4
+    # read proteins until EOF; NOTE: checking for errors adds about 50% to the reading time
     while f.readNextProtein(p, check_for_errs=False):
 
         # digest protein sequence (regex expression, low mass cutoff, high mas cutoff,
@@ -123,6 +124,7 @@ def fasta_digester(fasta_file, enzyme='trypsin', log=[None]):
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
 
     # check if database name passed on command line
     if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
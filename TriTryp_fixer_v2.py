@@ -31,9 +31,11 @@ Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
 # truncates at stop codons, flags other odd things
 # reformats description strings
 # updated for Python 3 -PW 7/6/2017
+# proteins are written as they are read; repeated sequences are counted
+# with a set of sequence digests instead of keeping all of the proteins
 
 import os
-import copy
+import sys
 import fasta_lib
 
 # print program name and version
@@ -54,15 +56,17 @@ new_fasta_file = new_fasta_file.replace('.fasta', '_fixed.fasta')
 new_fasta_file = os.path.join(os.path.dirname(fasta_file), new_fasta_file)
 
 # initializations
-proteins = []
 p = fasta_lib.Protein()
 pcount = 0
 stop_count = 0
 gap_count = 0
 no_met = 0
+duplicates = 0
+sequences = fasta_lib.DigestSet()
 
-# read the sequences into a list
+# fix each protein and write it to the new protein fasta file
 f = fasta_lib.FastaReader(fasta_file)
+file_obj = open(new_fasta_file, 'w')
 while f.readNextProtein(p, check_for_errs=True):
     pcount += 1
 
@@ -95,23 +99,9 @@ while f.readNextProtein(p, check_for_errs=True):
         gap_count += 1
         p.new_desc = p.new_desc + ' (Contains gaps)'
 
-    # save the protein in list
-    proteins.append(copy.deepcopy(p))
-
-# check for duplicates and count
-duplicates = 0
-mw_dict = {}
-for i, p in enumerate(proteins):
-    if mw_dict.get(str(p.molwtProtein()), False):
-        j = mw_dict[str(p.molwtProtein())]
-        if p.sequence == proteins[j].sequence:
-            duplicates += 1
-    else:
-        mw_dict[str(p.molwtProtein())] = i
-
-# open the new protein fasta file and write out the proteins
-file_obj = open(new_fasta_file, 'w')
-for p in proteins:
+    # count duplicates and write the protein
+    if sequences.seen(p.sequence):
+        duplicates += 1
     p.printProtein(file_obj)
 file_obj.close()
 
@@ -121,7 +111,7 @@ print("   translations that do not start with Met:", no_met)
 print("   translations that have premature stop codons:", stop_count)
 print("   translations that contain gaps:", gap_count)
 print("   total number of input sequences was:", pcount)
-print("   total number of sequences written was:", len(proteins))
+print("   total number of sequences written was:", pcount)
 print("   number of redundant sequences was:", duplicates)
 
 # end
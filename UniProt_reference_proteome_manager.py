@@ -40,17 +40,13 @@ from tkinter import messagebox
 from tkinter import filedialog
 import os
 import sys
-import time
-import ftplib
 import datetime
-import re
-import pickle
 
 # Imports dependent on other files
 # This script only uses built-in modules, no external downloads required
 try:
     import fasta_lib
-    import reverse_fasta
+    import proteome_engine
 except ImportError:
     print("Could not import all files.")
     sys.exit("Imports failed!")
@@ -83,341 +79,30 @@ class CheckBoxes(Frame):
         for var in self.vars:
             var.set(0)
 
-class ReadMeEntry:
-    """Container for data parsed from README table rows.
-    """
-    def __init__(self, line_entry):
-        """Create placeholders for variables and then parse the line"""
-        self.kingdom = ""                           # Major phylogenic categories
-        self.proteome_ID = ""                       # UniProt refence proteome designation
-        self.tax_ID = ""                            # NCBI taxonomy number
-        self.oscode = ""                            # UniProt OSCODE string
-        self.main_fasta = ""                        # Number of entries in the main fasta file
-        self.additional_fasta = ""                  # Number of entries in the additional fasta file
-        self.gene2acc = ""                          # Number of entries in the gene2acc file
-        self.species_name = ""                      # Latin species name
-        self.short_name = ""                        # Shortened species name with underscores
-        self.ftp_download_list = []                 # FTP downloadable files for each species
-        self.ftp_file_path = ""                     # Kingdom branch path at FTP site
-        self.download_folder_name = ""              # More descriptive folder name to hold download files
-
-        # Regular expression for parsing README table rows       
-        self.parser = re.compile('^(\S+)\s([0-9]+)\s(.+?)\s+([0-9]+)\s+([0-9]+)\s+([0-9]+)\s+(.*)$')
-        
-        # List of characters that cannot be in folder names
-        self.illegal_pattern = r"[\\#%&{}/<>*?:]"
-
-        self.set_attributes(line_entry)  # Populate object attributes
-        self.make_short_name()            # Makes some shorter species names
-
-    # Parse README table line
-    def set_attributes(self, line):
-        """Parse attributes from table line."""
-        m = self.parser.match(line)
-
-        # This can be used to skip over rows before or after the main table
-        if not m:   
-            raise ValueError('Invalid line')
-
-        # Get the matching groups and load attributes
-        groups = m.groups()
-        self.proteome_ID = groups[0]
-        self.tax_ID = groups[1]
-        self.oscode = groups[2]
-        self.main_fasta = groups[3]
-        self.additional_fasta = groups[4]
-        self.gene2acc = groups[5]
-        self.species_name = groups[6]
-
-    def make_short_name(self):
-        """To get a shorter species name to add to download filenames.
-
-        Pattern is one or more words with capital first letter and one
-        lower-case word.
-        """
-        m = re.match(r"([A-Z][a-z]+\s)+[a-z]+", self.species_name)
-        if m:
-            self.short_name = re.sub(r"\s", "_", m.group())
-            if self.short_name.endswith('_sp'):
-                self.short_name = self.short_name[:-3]
-                
-    def make_folder_name(self, date, dash=True):
-        """ This function will remove any characters from the species
-        name that are in the remove characters list, and make a folder name
-        with date, proteome ID, and fixed species name.
-        """
-        # Remove invalid folder name characters
-        fixed_name = re.sub(self.illegal_pattern, " ", self.species_name).strip()
-        if dash:
-            fixed_name = fixed_name.replace(" ", "-")
-        else:
-            fixed_name = fixed_name.replace(" ", "_")
-
-        # Make the local download folder name
-        self.download_folder_name = '_'.join([date, self.proteome_ID, fixed_name])
-
-    def _snoop(self):
-        """Diagnostic print of attributes."""
-        print('kingdom:', self.kingdom)
-        print('proteome ID:', self.proteome_ID)
-        print('tax ID:', self.tax_ID)
-        print('Oscode:', self.oscode)
-        print('Fasta entries:', self.main_fasta)
-        print('Additional entries:', self.additional_fasta)
-        print('Gene To Acc entries:', self.gene2acc)
-        print('species name:', self.species_name)
-        print('short name:', self.short_name)
-        print('download list:', self.ftp_download_list)
-        print('ftp file path:', self.ftp_file_path)
-        print('download folder name:', self.download_folder_name)         
-    
 # Build GUI
-class GUI:
+class GUI(proteome_engine.UniProtEngine):
     """Main GUI class for application.
+    The catalog, download, and processing logic is in proteome_engine.UniProtEngine.
     """
     def __init__(self, url, ref_prot_path, kingdom_paths, headers, banned_list, script_path, default_contams):
         """Create object and set some state attributes."""
-        self.url = url                          # Url of UniProt FTP site
-        self.ftp = None                         # FTP object (set in login method)
-        self.ref_prot_path = ref_prot_path      # Specifies top level directory of the Uniprot ftp database
-        self.kingdom_paths = kingdom_paths      # List of directory names where files are located (kingdoms)
+        proteome_engine.UniProtEngine.__init__(self, url, ref_prot_path, kingdom_paths, banned_list,
+                                               script_path, default_contams)
         self.kingdom_selections = []            # List of subpaths user specified
-        self.all_entries = []                   # List of selected entry object attributes
         self.selected_entries = []              # holds filtered subset of all_entries
-        self.banned_full = banned_list          # Full ist of extra file patterns to be skipped when downloading
-        self.banned_list = banned_list          # List of extra file patterns to be skipped when downloading
-        self.date = ""                          # This should be a UniProt version (i.e. 2017.07 for July, 2017 release)        
         self.headers = headers                  # Needed for columns in tables
         self.proteome_IDs = []                  # List of unique proteome IDs
         self.selected_default = os.path.join(script_path, 'default_UniProt_species.txt')     # typical default species file path
-        self.script_path = script_path          # Path location of script
-        self.contams_database = os.path.join(self.script_path, default_contams)
         self.abs_download_path = ""             # Absolute path of user selected download directory
-        self.data = None                        # Data from pickle file (UniProt reference proteome entries and release date)
         self.quit_save_state = False            # Flag set if user wants to save database after quitting program
                 
         # List of characters that cannot be in folder names
         self.illegal_characters = r"[\\#%&{}/<>*?:]"
 
-    # Helper Class Functions
-    # FTP support
-    def login(self):
-        """Open an FTP connection and login."""
-        self.ftp = ftplib.FTP()
-        self.ftp.connect(str(self.url))
-        self.ftp.login()
-
-    def logout(self):
-        """Close the FTP connection."""
-        try:
-            self.ftp.quit()
-        except:
-            pass # Catch error if no FTP connection to close (already timed out)
-
-    def _fetch_README(self):
-        """fetches the README file from FTP site with error testing and retries.
-        Has a hard failure if file cannot be downloaded."""
-        retry = 0
-        listing = []
-        while retry < 10:
-            try:
-                self.login()
-                self.ftp.cwd(self.ref_prot_path)  # move into README file location
-                self.ftp.retrlines('RETR README', listing.append)
-                print('...README was retrieved OK')
-                return listing
-            except:
-                # wait 15 seconds and retry
-                time.sleep(15)
-                retry += 1
-                print('...fetching README retry:', retry)
-
-        # ftp connection not working so terminate
-        if retry == 10:
-            print('...FATAL: unable to make FTP connection. Try again later.')
-            self.quit_gui(True)        
-
-    # ReadMeEntry support         
-    def load_all_entries(self):
-        """Loads reference proteome entries from pickle file.
-        If file does not exist or file is out-of-date, return False.
-        """
-        # see if pickle file exists
-        if not os.path.exists(os.path.join(self.script_path, 'UniProt_current_release.pickle')):
-            return False
-
-        # get data from pickle file
-        self.data = self.unpickle_entries()
-        date = self.data["Date"]
-        entries = self.data["Entries"]
-
-        # Get the release version information from README
-        listing = self._fetch_README()
-        for line in listing:
-            if "release" in line.lower():
-                version = line.replace(',', '')
-                version = version.replace('_', '.')
-                self.date = version.split()[1]
-
-        # if pickled date matches current database version, then load entries from pickle file
-        if self.date == date:
-            self.all_entries = entries
-            return True
-        else:
-            return False
-        
-    def pickle_entries(self):
-        """Saves list of all entry objects (reference proteomes) into
-        UniProt_release.pickle (the current release only, updated monthly).
-        """
-        text = {"Date": self.date, "Entries": self.all_entries}
-        
-        # Make sure we are in the correct folder (save to location where script was run)
-        try:
-            os.chdir(self.script_path)
-        except OSError:
-            print("OSError occurred during pickling. Cwd: {}".format(os.getcwd()))
-        
-        with open('UniProt_current_release.pickle', 'wb') as file:
-            pickle.dump(text, file)
-
-    def unpickle_entries(self):
-        """Loads list of all entry objects into UniProt_release.pickle"""
-        with open('UniProt_current_release.pickle', 'rb') as file:
-            return pickle.load(file)
-
-    def parse_README(self):
-        """Fetches the README file and parses the table in "ReadMeEntry" objects."""
-        # Try to load entry objects from pickle file unless first time running, then user needs to save defaults
-        if self.load_all_entries():
-            return     # exits here if pickled entries were OK
-        else:
-            # get the release version information
-            listing = self._fetch_README()
-            for line in listing:
-                if "release" in line.lower():
-                    version = line.replace(',', '')
-                    version = version.replace('_', '.')
-                    self.date = version.split()[1]
-        
-            # Find and parse the table
-##            header_index = listing.index('Proteome_ID Tax_ID  OSCODE     #(1)    #(2)    #(3)  Species Name')
-            header_index = listing.index('Proteome_ID	Tax_ID	OSCODE	SUPERREGNUM	#(1)	#(2)	#(3)	Species Name')
-            for line in listing[header_index:]:
-                try:
-                    entry = ReadMeEntry(line)
-                except ValueError:
-                    continue
-                self.all_entries.append(entry)
-
-            # Add the kingdom categories and download file lists
-            self.get_kingdoms()
-
-            # save the entry list
-            self.pickle_entries()
-
-    def get_kingdoms(self):
-        """Walks the kingdom FTP pages and sets additional entry attributes."""
-        for kingdom in self.kingdom_paths:
-            print('kingdon:', kingdom)
-            kingdom_path = self.ref_prot_path + kingdom
-            kingdom_proteome = {} # holds file names for each proteome in the kingdom
-            retry = 0
-            listing = []    # To hold file listing
-            while retry < 10:
-                try:
-                    self.login()
-                    self.ftp.cwd(kingdom_path)  # Move into category location
-                    self.ftp.retrlines('LIST', listing.append)   # Get the listing and save
-                    print('...%s listing was retrieved OK' % kingdom)
-                    break
-                except:
-                    # wait 15 seconds and retry
-                    time.sleep(15)
-                    retry += 1
-                    print('...fetching %s retry: %d' % (kingdom, retry))
-
-            # ftp connection not working so terminate
-            if retry == 10:
-                print('...FATAL: unable to make FTP connection. Try again later.')
-                self.quit_gui(True)
-
-
-            # get the list of proteome subfolders
-            proteome_list = []
-            for line in listing:
-                subdir = line.strip().split()[-1] # Get the subfolder name
-                proteome_list.append(subdir)
-
-            # for each subfolder, get the file list for that proteome
-            for subdir in proteome_list:
-##                print('subdir:', subdir)
-                retry = 0
-                listing = []    # To hold file listing
-                while retry < 3:
-                    try:
-##                        self.login()
-                        self.ftp.cwd(kingdom_path + '/' + subdir)  # Move into category location
-                        self.ftp.retrlines('LIST', listing.append)   # Get the listing and save
-                        break
-                    except:
-                        # wait 5 seconds and retry
-                        time.sleep(5)
-                        retry += 1
-                        print('......fetching proteome %s retry: %d' % (subdir, retry))
-
-                # get the actual proteome file names of interest
-                for line in listing:
-                    line = line.strip() # Want last item, so strip EOL
-                    fname = line.split()[-1] # Get the file name
-                    if fname.split('_')[0].startswith('UP'):
-                        key = fname.split('_')[0]   # Parse the reference proteome string
-                        
-
-                        # Save all filenames for each species
-                        if key in kingdom_proteome:
-                            kingdom_proteome[key].append(kingdom_path + '/' + subdir '/' + fname)
-                        else:
-                            kingdom_proteome[key] = [kingdom_path + '/' + subdir '/' + fname]
-
-                kingdom_keys = list(kingdom_proteome.keys()) # convert iterator to list
-                for entry in self.all_entries:
-                    if entry.proteome_ID in kingdom_keys:
-                        entry.ftp_download_list = list(kingdom_proteome[entry.proteome_ID]) # makes copy of list
-                        entry.kingdom = kingdom
-
-            """need to do:
-                1. loop over subfolders
-                2. set dir to path+subfolder
-                3. get the list of files in the subfolder
-                4. use code below to filter the filenames
-                5. make fname a full path (kingfom_path + proteome_subdir + filename)
-                
-                
-            # Count the number of proteomes (each has several files)
-            for line in listing:
-                line = line.strip() # Want last item, so strip EOL
-                fname = line.split()[-1] # Get the file name
-                if fname.split('_')[0].startswith('UP'):
-                    key = fname.split('_')[0]   # Parse the reference proteome string
-
-                    # Save all filenames for each species
-                    if key in kingdom_proteome:
-                        kingdom_proteome[key].append(fname)
-                    else:
-                        kingdom_proteome[key] = [fname]
-
-            kingdom_keys = list(kingdom_proteome.keys())
-            for entry in self.all_entries:
-                if entry.proteome_ID in kingdom_keys:
-                    entry.ftp_download_list = list(kingdom_proteome[entry.proteome_ID]) # makes copy of list
-                    entry.kingdom = kingdom
-                    entry.ftp_file_path = kingdom_path  # save file path in new variable
-            """
-
-            print(kingdom, 'count is', len(kingdom_keys))
-
-        return
+    def fatal(self, message):
+        """Closes the GUI after a connection failure."""
+        print('...FATAL:', message)
+        self.quit_gui(True)
 
     # list management functions
     def filter_entries(self):
@@ -432,15 +117,9 @@ class GUI:
         species_entry = self.search_species.get().lower()
         tax_entry = self.search_tax.get()
 
-        # Filter for Kingdoms that were selected
+        # Filter for Kingdoms that were selected, taxonomy number and species name substrings
         self.kingdom_selections = [key for key in kingdoms if kingdoms[key] == 1]        
-        self.selected_entries = [entry for entry in self.all_entries if entry.kingdom in self.kingdom_selections]
-
-        # Filter on taxonomy number substring
-        self.selected_entries = [entry for entry in self.selected_entries if tax_entry in entry.tax_ID]
-
-        # Filter on species name substring
-        self.selected_entries = [entry for entry in self.selected_entries if species_entry in entry.species_name.lower()]
+        self.selected_entries = self.select_entries(self.kingdom_selections, tax_entry, species_entry)
 
     def select_entry_values(self, entry):
         """Selects fields from entry for treeview display."""
@@ -648,25 +327,15 @@ class GUI:
                     self.save_defaults(overwrite=True)
 
     # FASTA file download and processing functions        
-    def database_processing(self, fasta_file, contam_location):
-        """Gets selection value from radiobuttons and then passes those values to imported reverse_fasta main function.
+    def processing_options(self):
+        """Gets selection values from the checkboxes for the reverse_fasta main function.
         More documentation on how reverse_fasta works can be found in the reverse_fasta.py file.
+        Returns (forward, both) flags.
         """
         reverse_values = list(self.reverse_contams.get_state())
-        # Initially set everything to false
-        forward = False
-        reverse = False
-        both = False
         decoy_contams = reverse_values[0]
         target_contams = reverse_values[1]
-
-        if decoy_contams:
-            both = True
-        if target_contams:
-            forward = True
-
-        if decoy_contams or target_contams:        
-            reverse_fasta.main(fasta_file, forward, reverse, both, contam_path=contam_location)
+        return (bool(target_contams), bool(decoy_contams))
 
     def download_all_databases(self):
         """Fetches the canonical only database files for the selected species."""
@@ -686,9 +355,14 @@ class GUI:
         self.download_databases()
 
     def download_databases(self):
-        """Fetches the database files for the selected species."""
-        self.login()    # Refresh the FTP connection
-        
+        """Fetches the database files for the selected species.
+        Downloads and FASTA processing run in a background pipeline so the window stays live.
+        """
+        # Only one set of downloads at a time
+        if self.pipeline and self.pipeline.is_alive():
+            messagebox.showwarning("Downloads Running", "Please wait for the current downloads to finish!")
+            return None
+
         # Throw warning if no databases selected
         if len(self.tree_right.get_children()) == 0:
             messagebox.showwarning("Empty Selection", "No databases were selected for download!")
@@ -701,13 +375,7 @@ class GUI:
             return None
 
         # Make a separate folder to contain all files
-        uniprot_dir_name = r"UniProt_{}".format(self.date)
-        uniprot_dir_path = os.path.join(self.abs_download_path, uniprot_dir_name)
-        try:
-            os.mkdir(uniprot_dir_path)
-        except FileExistsError:
-            pass
-        os.chdir(uniprot_dir_path)
+        uniprot_dir_path = self.make_download_folder(self.abs_download_path)
 
         # Get taxonomy ID numbers for right (download) list
         tax_id_list = [self.tree_right.item(entry)['values'][0] for entry in self.tree_right.get_children()]
@@ -718,129 +386,27 @@ class GUI:
         # Get the entry objects for the right taxonomy numbers
         download_entries = [entry for entry in self.all_entries if int(entry.tax_ID) in set_tax_id_list]
 
-        # Add normalized folder name attribute
-        [entry.make_folder_name(self.date) for entry in download_entries]
+        # Make one pipeline job per species: its files and the processing step arguments
+        (forward, both) = self.processing_options()
+        jobs = self.download_jobs(download_entries, uniprot_dir_path, forward, both)
+
+        # Start the downloads and watch the progress messages
+        self.pipeline = fasta_lib.DownloadPipeline(fasta_lib.Downloader(workers=proteome_engine.DOWNLOADS))
+        self.pipeline.start(jobs)
+        self.watch_pipeline()
+
+    def watch_pipeline(self):
+        """Shows pipeline progress in the status bar until the downloads are done."""
+        for message in self.pipeline.poll():
+            self.status_bar.config(text=message)
+        if self.pipeline.is_alive():
+            self.root.after(200, self.watch_pipeline)
+        elif self.pipeline.failed:
+            messagebox.showwarning("Downloads Completed!",
+                                   "These downloads failed:\n" + "\n".join(self.pipeline.failed))
+        else:
+            messagebox.showinfo("All Downloads Completed!", "Downloads Finished!")
 
-        for entry in download_entries:
-            # Move to the FTP site branch where files are located
-            print('==================')
-            print('path:', entry.ftp_file_path)
-            print('==================')            
-            self.ftp.cwd(entry.ftp_file_path)
-                
-            # Set local location for the download
-            download_folder = os.path.join(uniprot_dir_path, entry.download_folder_name)
-            try:
-                os.mkdir(download_folder)
-                os.chdir(download_folder)
-            except FileExistsError:
-                os.chdir(download_folder)
-            except OSError:
-                print("OSError")
-                print('Download for this entry failed:')
-                entry._snoop()
-                continue
-
-            for file in entry.ftp_download_list:
-                print('==================')
-                print('file:', file)
-                print('==================')
-
-            # Download reference proteome database(s)
-            for file in entry.ftp_download_list:
-                # Skip any files that we do not want to download                    
-                if self.banned_file(file):
-                    continue
-                
-                # Download the file (overwrites any existing files)
-                fixed_file = "{}_{}".format(self.date, file)
-                self.update_status_bar("Downloading {} file".format(file))
-                
-                self.ftp.retrbinary('RETR {}'.format(file), open('{}'.format(file), 'wb').write)
-                print("{} is done downloading".format(file))
-                if os.path.exists(os.path.join(download_folder, fixed_file)):
-                    os.remove(os.path.join(download_folder, fixed_file))
-                os.rename(os.path.join(download_folder, file), os.path.join(download_folder, fixed_file))
-
-            self.make_fasta_files(uniprot_dir_path, entry)
-
-        messagebox.showinfo("All Downloads Completed!", "Downloads Finished!")
-        self.update_status_bar("Done downloading")
-
-    def banned_file(self, fname):
-        """False if fname in banned list."""
-        skip = False
-        for ban in self.banned_list:
-            if ban.lower() in fname.lower():
-                skip = True
-        return skip
-
-    def make_fasta_files(self, uniprot_dir_path, entry):
-        """Uncompresses canonical FASTA file and does some analysis. Also
-        combines fasta and additional fasta files with decompression.
-        """
-        # Get the list of protein fasta files
-        temp_files = ["{}_{}".format(self.date, x) for x in entry.ftp_download_list if 'fasta' in x.lower()]
-        fasta_files = []
-        combined_files = []
-        for f in temp_files:
-            if not self.banned_file(f):
-                fasta_files.append(f)
-        fasta_files.sort()
-
-        fasta_file = fasta_files[0].replace('.fasta.gz', '')
-        fasta_file = fasta_file + '_' + entry.short_name + '_canonical.fasta'
-        combined_files.append(fasta_file)
-        fasta_obj_list = [open(os.path.join(uniprot_dir_path, fasta_file), 'w')]
-        if len(fasta_files) == 2:
-            fasta_file = fasta_files[1].replace('_additional.fasta.gz', '')
-            fasta_file = fasta_file + '_' + entry.short_name + '_all.fasta'
-            fasta_obj_list.append(open(os.path.join(uniprot_dir_path, fasta_file), 'w'))
-            combined_files.append(fasta_file)
-
-        # Set up to read the fasta file entries and init counters
-        print('proteome:', entry.proteome_ID, 'species:', entry.species_name)
-        p = fasta_lib.Protein()
-
-        # Read entries and write to new file
-        for i, fasta in enumerate(fasta_files):
-            sp_count = 0
-            iso_count = 0
-            tr_count = 0
-            p_count = 0
-            f = fasta_lib.FastaReader(os.path.join(uniprot_dir_path, entry.download_folder_name, fasta))
-            while f.readNextProtein(p, False):
-                p_count += 1
-                if p.accession.startswith('sp|'):
-                    sp_count += 1
-                if p.accession.startswith('tr|'):
-                    tr_count += 1
-                if ('-' in p.accession) or ('Isoform of' in p.description):
-                    iso_count += 1
-                if i == 0:
-                    for obj in fasta_obj_list:
-                        p.printProtein(obj)
-                else:
-                    p.printProtein(fasta_obj_list[i])
-
-            # Print stats
-            print('...database:', fasta)
-            print('......tot_count: %s, sp count: %s, tr count: %s, isoform count: %s' %
-                  ("{0:,}".format(p_count), "{0:,}".format(sp_count),
-                   "{0:,}".format(tr_count), "{0:,}".format(iso_count)))
-
-        # Close output file(s)
-        for obj in fasta_obj_list:
-            obj.close()
-
-        # chdir into correct folder and make sure all file paths are set up correctly
-        uniprot_dir_name = r"UniProt_{}".format(self.date)
-        os.chdir(os.path.join(self.abs_download_path, uniprot_dir_name))
-        
-        # Add forward/reverse/contams
-        for file in combined_files:
-            self.database_processing(file, self.contams_database)
-                        
     def update_status_bar(self, _text):
         """Updates status bar with new text"""
         self.status_bar.config(text=_text)
@@ -849,6 +415,12 @@ class GUI:
            
     def quit_gui(self, hard_exit=False):
         """Quits the GUI application."""
+        if self.pipeline and self.pipeline.is_alive():
+            # quitting would leave the downloads running with no window
+            if not messagebox.askyesno("Downloads Running",
+                                       "Downloads are still running. Cancel them and quit?"):
+                return
+            self.pipeline.stop()
         self.logout()   # Close the FTP connection
         if not hard_exit:
             self.update_saved_defaults()
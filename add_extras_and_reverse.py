@@ -55,6 +55,7 @@ MAKE_SEPARATE_REVERSED = False
 MAKE_SEPARATE_BOTH = True
 
 
+@fasta_lib.profile_entry
 def fasta_add_extras(extra_file, fasta_file, output_file):
     """Adds contaminants and reverses entries in a FASTA protein database.
         Called with FASTA filename.  Reversed DB written to same location.
@@ -66,12 +67,9 @@ def fasta_add_extras(extra_file, fasta_file, output_file):
     print(' add_extras_and_reverse.py, v1.1.0, written by Phil Wilmarth, OHSU, 2017 ')
     print('=========================================================================')
 
-    # open the "forward" and "reversed" output files
-    _file = os.path.splitext(output_file)[0] + '.fasta'
-    for_name = _file.replace('.fasta', '_for.fasta')
-    for_file_obj = open(for_name, 'w')
-    rev_name = _file.replace('.fasta', '_rev.fasta')
-    rev_file_obj = open(rev_name, 'w')
+    # open the requested output files (everything is written in one pass)
+    writer = fasta_lib.TargetDecoyWriter(os.path.splitext(output_file)[0], MAKE_SEPARATE_FORWARD,
+                                         MAKE_SEPARATE_REVERSED, MAKE_SEPARATE_BOTH)
 
     # create a log file to mirror screen output
     _folder = os.path.split(fasta_file)[0]
@@ -106,9 +104,7 @@ def fasta_add_extras(extra_file, fasta_file, output_file):
         prot.new_desc = '[%s] %s' % (prot.new_acc, prot.new_desc)
         prot.new_acc = 'EXTRA_%04d' % (pcount,)
         prot.accession = 'EXTRA_%04d' % (pcount,)
-        prot.printProtein(for_file_obj)
-        rev = prot.reverseProtein(decoy_string)
-        rev.printProtein(rev_file_obj)
+        writer.write(prot, prot.reverseProtein(decoy_string))
     for obj in write:
         print('...there were %s extra sequences in %s' % (pcount, os.path.split(extra_file)[1]), file=obj)
 
@@ -128,9 +124,7 @@ def fasta_add_extras(extra_file, fasta_file, output_file):
                 prot.parseCONT()
 
             # write sequences to respective files
-            prot.printProtein(for_file_obj)
-            rev = prot.reverseProtein(decoy_string)
-            rev.printProtein(rev_file_obj)
+            writer.write(prot, prot.reverseProtein(decoy_string))
         for obj in write:
             print('...there were %s contaminant entries in %s' % (contams, contams_file), file=obj)
     except:
@@ -138,10 +132,10 @@ def fasta_add_extras(extra_file, fasta_file, output_file):
             print('...WARNING:', CONTAMS, 'not found!', file=obj)
 
     # read proteins, clean up accessions, decriptions until EOF
-    # write proteins to "forward" and "reversed" files
+    # write target and decoy proteins
     f = fasta_lib.FastaReader(fasta_file)
 
-    # checking for errors can slow program execution by factor of 3-4
+    # checking for errors adds about 50% to the reading time
     # Reading and writing sequences will always remove spaces and blank lines
     while f.readNextProtein(prot, check_for_errs=False):
         pcount += 1
@@ -155,51 +149,30 @@ def fasta_add_extras(extra_file, fasta_file, output_file):
             else:
                 pass
 
-        prot.printProtein(for_file_obj)    # write to "forward" file
-        rev = prot.reverseProtein(decoy_string)
-        rev.printProtein(rev_file_obj)   # write to "reversed" file
+        writer.write(prot, prot.reverseProtein(decoy_string))
+    writer.close()
 
-    # make concatenated output file if desired and print summary stats
+    # print summary stats
     if MAKE_SEPARATE_BOTH:
-        both_name = _file.replace('.fasta', '_both.fasta')
-        both_file_obj = open(both_name, 'w')
-        for_file_obj.close()
-        for_file_obj = open(for_name, 'r')
-        rev_file_obj.close()
-        rev_file_obj = open(rev_name, 'r')
-        while True:
-            line = for_file_obj.readline()
-            if not line: break
-            both_file_obj.write(str(line))
-        while True:
-            line = rev_file_obj.readline()
-            if not line: break
-            both_file_obj.write(str(line))
-        both_file_obj.close()
         for obj in write:
-            print('...%s total proteins written to %s' % (2*pcount, os.path.split(both_name)[1]), file=obj)
+            print('...%s total proteins written to %s' % (2*pcount, os.path.split(writer.both_name)[1]), file=obj)
 
     if MAKE_SEPARATE_FORWARD:
         for obj in write:
-            print('...%s proteins written to %s' % (pcount, os.path.split(for_name)[1]), file=obj)
+            print('...%s proteins written to %s' % (pcount, os.path.split(writer.for_name)[1]), file=obj)
     if MAKE_SEPARATE_REVERSED:
         for obj in write:
-            print('...%s proteins reversed and written to %s' % (pcount, os.path.split(rev_name)[1]), file=obj)
+            print('...%s proteins reversed and written to %s' % (pcount, os.path.split(writer.rev_name)[1]), file=obj)
 
-    # close files and delete unwanted files
-    for_file_obj.close()
-    rev_file_obj.close()
+    # close log file
     fasta_lib.time_stamp_logfile('>>> ending: add_extras_and_reverse.py', log_obj)
     log_obj.close()
-    if not MAKE_SEPARATE_FORWARD:
-        os.remove(for_name)
-    if not MAKE_SEPARATE_REVERSED:
-        os.remove(rev_name)
     return
 
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     extra_file = ''
     fasta_file = ''
     output_file = ''
@@ -0,0 +1,168 @@
+"""'benchmarks/ensembl_headers.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# times the Ensembl header line parser (old tag-by-tag splitting vs. the compiled regex)
+
+import os
+import sys
+import re
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fasta_lib
+import Ensembl_fixer
+
+# header lines (after the accession) in the formats of recent Ensembl releases
+SAMPLE_HEADERS = [
+    'pep chromosome:GRCh38:7:117480025:117668665:1 gene:ENSG00000001626.16 transcript:ENST00000003084.11 '
+    'gene_biotype:protein_coding transcript_biotype:protein_coding gene_symbol:CFTR '
+    'description:CF transmembrane conductance regulator [Source:HGNC Symbol;Acc:HGNC:1884]',
+    'pep chromosome:GRCm39:11:101223546:101258430:-1 gene:ENSMUSG00000017167.17 transcript:ENSMUST00000103109.4 '
+    'gene_biotype:protein_coding transcript_biotype:protein_coding gene_symbol:Cntnap1 '
+    'description:contactin associated protein-like 1 [Source:MGI Symbol;Acc:MGI:1858201]',
+    'pep primary_assembly:GRCz11:5:25484331:25513742:1 gene:ENSDARG00000003570.10 transcript:ENSDART00000010007.9 '
+    'gene_biotype:protein_coding transcript_biotype:protein_coding gene_symbol:tp53 '
+    'description:tumor protein p53 [Source:ZFIN;Acc:ZDB-GENE-990415-270]',
+    'pep scaffold:ASM985889v3:JAAXJR010000012.1:1025:8812:1 gene:ENSCAFG00845000001.1 '
+    'transcript:ENSCAFT00845000002.1 gene_biotype:protein_coding transcript_biotype:protein_coding',
+    'pep supercontig:Broad_Nile_tilapia:GL831134.1:106:6325:-1 gene:ENSONIG00000000003.1 '
+    'transcript:ENSONIT00000000004.1 gene_biotype:protein_coding transcript_biotype:protein_coding '
+    'description:uncharacterized protein',
+    'pep chromosome:IRGSP-1.0:1:2983:10815:1 gene:Os01g0100100 transcript:Os01t0100100-01 '
+    'gene_biotype:protein_coding transcript_biotype:protein_coding '
+    'description:RabGAP/TBC domain containing protein. (Os01t0100100-01)',
+    'pep chromosome:BDGP6.46:2L:7529:9484:1 gene:FBgn0031208 transcript:FBtr0300689 '
+    'gene_biotype:protein_coding transcript_biotype:protein_coding gene_symbol:CG11023 '
+    'description:CG11023 [Source:FlyBase;Acc:FBgn0031208]',
+    'pep genescaffold:Pmarinus_7.0:GL476328:31:4015:1 gene:ENSPMAG00000000001.1 '
+    'transcript:ENSPMAT00000000001.1 gene_biotype:protein_coding transcript_biotype:protein_coding',
+    ]
+
+
+def old_parse_ensembl_header_line(line, all_tags):
+    """The previous parser (one scan and one split per tag)."""
+    parsed = {}
+    tags = [x for x in all_tags if x in line]
+    if not tags:
+        return line
+    while line:
+        line = line.strip()
+        current_tag = tags.pop()
+        line, current_value = line.split(current_tag)
+        parsed[current_tag] = current_value
+    if 'description:' not in parsed:
+        parsed['description:'] = 'NO DESCRIPTION'
+    extra = ' ('
+    if 'gene:' in parsed and parsed['gene:']:
+        if parsed['gene:'].startswith('ENS'):
+            extra += 'g:' + str(float(re.sub(r"\D", "", parsed['gene:'])))
+        else:
+            extra += 'g:' + parsed['gene:']
+    if 'transcript:' in parsed and parsed['transcript:']:
+        if extra != ' (':
+            extra += ', '
+        if parsed['transcript:'].startswith('ENS'):
+            extra += 't:' + str(float(re.sub(r"\D", "", parsed['transcript:'])))
+        else:
+            extra += 't:' + parsed['transcript:']
+    if 'gene_symbol:' in parsed and parsed['gene_symbol:']:
+        if extra != ' (':
+            extra += ', '
+        extra += 'gs:' + parsed['gene_symbol:']
+    if extra == ' (':
+        extra = ''
+    else:
+        extra += ')'
+    return parsed['description:'] + extra
+
+
+def file_headers(fasta_file, limit):
+    """Header lines (without the accession) from a real Ensembl "pep.all.fa(.gz)" file."""
+    headers = []
+    for header in fasta_lib.read_headers(fasta_file):
+        headers.append(header.split(None, 1)[1] if ' ' in header else '')
+        if len(headers) == limit:
+            break
+    return headers
+
+
+def best_time(parser, headers, repeats):
+    """Best time for parsing all "headers" with "parser"."""
+    all_tags = Ensembl_fixer.ALL_TAGS
+    best = None
+    for i in range(repeats):
+        Ensembl_fixer.ensembl_number.cache_clear()
+        start = time.perf_counter()
+        for header in headers:
+            parser(header, all_tags)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(headers, repeats):
+    """Checks that both parsers agree, then times them."""
+    print('==================================================================')
+    print(' ensembl_headers.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('==================================================================')
+    differ = 0
+    for header in set(headers):
+        try:
+            old = old_parse_ensembl_header_line(header, Ensembl_fixer.ALL_TAGS)
+        except (ValueError, IndexError):    # old parser failed on this line
+            continue
+        if old != Ensembl_fixer.parse_ensembl_header_line(header):
+            differ += 1
+            print('...WARNING: parsers differ for:', header)
+    print('...%s header lines, %s differences, best of %s' %
+          ("{0:,d}".format(len(headers)), differ, repeats))
+    old = best_time(old_parse_ensembl_header_line, headers, repeats)
+    new = best_time(Ensembl_fixer.parse_ensembl_header_line, headers, repeats)
+    for (name, seconds) in [('old parser', old), ('compiled regex', new)]:
+        print('......%-16s %8.3f sec  %10s headers/sec' %
+              (name, seconds, "{0:,d}".format(int(len(headers) / seconds))))
+    print('...compiled regex parser is %.1f times faster' % (old / new,))
+    return differ
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times the Ensembl_fixer header line parser.')
+    parser.add_argument('fasta_file', nargs='?', default=None,
+                        help='an Ensembl "pep.all.fa.gz" file to take headers from (default: built-in samples)')
+    parser.add_argument('-n', '--count', type=int, default=200000, help='number of header lines (default: 200000)')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='runs per parser (default: 3)')
+    args = parser.parse_args()
+    if args.fasta_file:
+        headers = file_headers(args.fasta_file, args.count)
+    else:
+        headers = (SAMPLE_HEADERS * (args.count // len(SAMPLE_HEADERS) + 1))[:args.count]
+    sys.exit(1 if main(headers, args.repeats) else 0)
+
+# end
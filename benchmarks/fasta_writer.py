@@ -0,0 +1,156 @@
+"""'benchmarks/fasta_writer.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# compares FASTA writing speed: old per-character printProtein, new printProtein, FastaWriter
+
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fasta_lib
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def old_print_protein(prot, file_obj, length=80):
+    """The character-at-a-time printProtein code (before FastaWriter).
+    """
+    if prot.new_desc == '':
+        print('>'+prot.new_acc, file=file_obj)
+    else:
+        print('>'+prot.new_acc, prot.new_desc, file=file_obj)
+    char_count = 0
+    char_line = ''
+    for char in prot.sequence:
+        if char_count < length:
+            char_line += char
+            char_count += 1
+        else:
+            print(char_line, file=file_obj)
+            char_line = char
+            char_count = 1
+    if len(char_line):
+        print(char_line, file=file_obj)
+    return
+
+
+def make_proteins(count, seed=1):
+    """Makes a list of "count" random Protein objects (typical lengths).
+    """
+    rand = random.Random(seed)
+    proteins = []
+    for i in range(count):
+        prot = fasta_lib.Protein()
+        prot.new_acc = 'sp|P%05d|PROT%d_HUMAN' % (i, i)
+        prot.new_desc = 'Synthetic protein %d OS=Homo sapiens OX=9606 GN=GENE%d PE=1 SV=1' % (i, i)
+        prot.sequence = ''.join(rand.choices(AMINO_ACIDS, k=int(rand.lognormvariate(6.0, 0.6)) + 20))
+        proteins.append(prot)
+    return proteins
+
+
+def time_method(name, method, proteins, folder, repeats):
+    """Runs "method(proteins, file_name)" "repeats" times, returns best time.
+    """
+    file_name = os.path.join(folder, name.replace(' ', '_') + '.fasta')
+    if 'gzip' in name:
+        file_name += '.gz'
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        method(proteins, file_name)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, os.path.getsize(file_name)
+
+
+def old_code(proteins, file_name):
+    with open(file_name, 'w') as fout:
+        for prot in proteins:
+            old_print_protein(prot, fout)
+
+def print_protein(proteins, file_name):
+    with open(file_name, 'w') as fout:
+        for prot in proteins:
+            prot.printProtein(fout)
+
+def fasta_writer(proteins, file_name, length=80):
+    writer = fasta_lib.FastaWriter(file_name, length=length)
+    for prot in proteins:
+        writer.write(prot)
+    writer.close()
+
+def fasta_writer_no_wrap(proteins, file_name):
+    fasta_writer(proteins, file_name, length=0)
+
+
+METHODS = [('old printProtein', old_code),
+           ('printProtein', print_protein),
+           ('FastaWriter', fasta_writer),
+           ('FastaWriter no wrap', fasta_writer_no_wrap),
+           ('FastaWriter gzip', fasta_writer)]
+
+
+def main(count, repeats):
+    """Times each writing method and prints a table.
+    """
+    print('===============================================================')
+    print(' fasta_writer.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('===============================================================')
+    proteins = make_proteins(count)
+    residues = sum([len(p.sequence) for p in proteins])
+    print('...writing %s proteins (%s residues), best of %s' %
+          ("{0:,d}".format(count), "{0:,d}".format(residues), repeats))
+    # MB/sec is for the uncompressed FASTA text
+    results = {}
+    text_size = None
+    with tempfile.TemporaryDirectory() as folder:
+        for (name, method) in METHODS:
+            (best, size) = time_method(name, method, proteins, folder, repeats)
+            text_size = text_size or size
+            results[name] = best
+            print('......%-20s %8.3f sec  %8.1f MB/sec  (%s bytes)' %
+                  (name, best, text_size / best / 1048576, "{0:,d}".format(size)))
+    base = results['old printProtein']
+    for (name, method) in METHODS[1:]:
+        print('...%s is %.1f times faster than old printProtein' % (name, base / results[name]))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares FASTA writing speeds.')
+    parser.add_argument('-n', '--count', type=int, default=50000, help='number of proteins (default: 50000)')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='runs per method (default: 3)')
+    args = parser.parse_args()
+    main(args.count, args.repeats)
+
+# end
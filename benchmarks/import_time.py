@@ -0,0 +1,101 @@
+"""'benchmarks/import_time.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# measures how long it takes to import fasta_lib (and a few scripts) in a new interpreter
+
+import os
+import sys
+import json
+import subprocess
+import argparse
+
+# modules that should NOT be loaded by a plain "import fasta_lib" (the GUI scripts need some)
+HEAVY_MODULES = ['tkinter', 'urllib.request', 'ftplib', 'tarfile', 'concurrent.futures',
+                 'multiprocessing', 'numpy']
+
+# the probe runs in a fresh interpreter so nothing is already imported
+PROBE = """
+import sys, time, json
+sys.path.insert(0, %r)
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in %r if m in sys.modules]]))
+"""
+
+
+def time_import(module, repeats, repo_folder):
+    """Imports "module" in "repeats" new interpreters.
+    Returns (best time in seconds, list of heavy modules that were loaded).
+    """
+    best = None
+    loaded = []
+    for i in range(repeats):
+        probe = PROBE % (repo_folder, module, HEAVY_MODULES)
+        output = subprocess.run([sys.executable, '-c', probe], capture_output=True,
+                                text=True, check=True).stdout
+        (elapsed, loaded) = json.loads(output.strip().splitlines()[-1])
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, loaded
+
+
+def main(modules, repeats):
+    """Prints a table of import times and returns the results dictionary.
+    """
+    repo_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print('==============================================================')
+    print(' import_time.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('==============================================================')
+    print('...best of %s runs per module' % (repeats,))
+    results = {}
+    for module in modules:
+        (best, loaded) = time_import(module, repeats, repo_folder)
+        results[module] = {'seconds': round(best, 6), 'heavy_modules': loaded}
+        print('......%-36s %8.1f ms   %s' % (module, 1000.0 * best,
+                                             ', '.join(loaded) if loaded else 'no heavy modules'))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times "import fasta_lib" (and other modules) '
+                                     'in fresh interpreters.')
+    parser.add_argument('modules', nargs='*', default=['fasta_lib', 'reverse_fasta', 'count_fasta'],
+                        help='modules to import (default: fasta_lib reverse_fasta count_fasta)')
+    parser.add_argument('-r', '--repeats', type=int, default=10, help='runs per module (default: 10)')
+    parser.add_argument('-j', '--json', dest='json_file', default=None,
+                        help='also save the results to this JSON file')
+    args = parser.parse_args()
+    results = main(args.modules, args.repeats)
+    if args.json_file:
+        with open(args.json_file, 'w') as fout:
+            json.dump(results, fout, indent=2)
+    # fasta_lib loading a GUI or network module counts as a failure
+    sys.exit(1 if results.get('fasta_lib', {}).get('heavy_modules') else 0)
+
+# end
@@ -0,0 +1,153 @@
+"""'benchmarks/make_fasta.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# makes deterministic synthetic FASTA databases with UniProt, NCBI nr, or Ensembl style headers
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fasta_lib
+
+STYLES = ['uniprot', 'nr', 'ensembl']
+
+# amino acids and approximate natural frequencies (percent)
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+FREQUENCIES = [8.3, 1.4, 5.5, 6.7, 3.9, 7.1, 2.3, 5.9, 5.8, 9.7,
+               2.4, 4.1, 4.7, 3.9, 5.5, 6.6, 5.3, 6.9, 1.1, 2.9]
+
+# (scientific name, taxon number, UniProt mnemonic)
+SPECIES = [('Homo sapiens', 9606, 'HUMAN'), ('Mus musculus', 10090, 'MOUSE'),
+           ('Rattus norvegicus', 10116, 'RAT'), ('Saccharomyces cerevisiae (strain ATCC 204508 / S288c)', 559292, 'YEAST'),
+           ('Escherichia coli (strain K12)', 83333, 'ECOLI'), ('Arabidopsis thaliana', 3702, 'ARATH'),
+           ('Danio rerio', 7955, 'DANRE'), ('Bos taurus', 9913, 'BOVIN')]
+
+NAMES = ['Uncharacterized protein', 'Putative kinase', 'ABC transporter permease', 'Zinc finger protein',
+         'Heat shock protein', '50S ribosomal protein L2', 'Transcription factor', 'Serine protease',
+         'Histone H2B', 'Dehydrogenase', 'Cytochrome c oxidase subunit 1', 'Tubulin alpha chain']
+
+POOL_SIZE = 4194304     # random residues to take sequences from
+
+
+def synthetic_proteins(count, style='uniprot', seed=1, duplicate_rate=0.02):
+    """Generator of "count" Protein objects with "style" header lines.
+    The same arguments always make the same proteins.  Sequences are slices
+    of a block of random residues (lognormal lengths, median near 350),
+    so even 50 million entries can be made quickly.  About "duplicate_rate"
+    of the entries repeat an earlier sequence (for the duplicate checkers).
+    """
+    if style not in STYLES:
+        raise ValueError('style must be one of: %s' % ', '.join(STYLES))
+    rand = random.Random(seed)
+    pool = ''.join(rand.choices(AMINO_ACIDS, weights=FREQUENCIES, k=POOL_SIZE))
+    recent = []     # recent sequences for making duplicates
+    for i in range(count):
+        if recent and rand.random() < duplicate_rate:
+            sequence = rand.choice(recent)
+        else:
+            length = min(int(rand.lognormvariate(5.8, 0.6)) + 20, 30000)
+            start = rand.randrange(POOL_SIZE - length)
+            sequence = 'M' + pool[start:start+length-1]
+            if len(recent) < 1000:
+                recent.append(sequence)
+            else:
+                recent[i % 1000] = sequence
+        (species, taxon, mnemonic) = rand.choice(SPECIES)
+        name = rand.choice(NAMES)
+        prot = fasta_lib.Protein()
+        if style == 'uniprot':
+            db = 'sp' if (i % 20) == 0 else 'tr'
+            acc = 'A%07X' % (i,)
+            prot.accession = '%s|%s|%s_%s' % (db, acc, acc, mnemonic)
+            prot.description = '%s %s OS=%s OX=%s GN=G%s PE=%s SV=1' % (name, i, species, taxon, i, 1 + i % 5)
+        elif style == 'nr':
+            prot.accession = 'WP_%09d.1' % (i,)
+            headers = ['%s %s [%s]' % (name, i, species)]
+            while rand.random() < 0.3:  # compound entries (identical proteins)
+                (species, taxon, mnemonic) = rand.choice(SPECIES)
+                headers.append('XP_%09d.%s %s [%s]' % (rand.randrange(10**9), rand.randint(1, 3), name, species))
+            prot.description = chr(1).join(headers)
+        else:
+            prot.accession = 'ENSP%011d.%s' % (i, 1 + i % 3)
+            position = rand.randrange(1, 10**8)
+            prot.description = ('pep chromosome:GRCh38:%s:%s:%s:%s gene:ENSG%011d.%s transcript:ENST%011d.1 '
+                                'gene_biotype:protein_coding transcript_biotype:protein_coding gene_symbol:G%s '
+                                'description:%s [Source:HGNC Symbol;Acc:HGNC:%s]' %
+                                (1 + i % 22, position, position + 3 * len(sequence), rand.choice([1, -1]),
+                                 i // 3, 1 + i % 7, i, i // 3, name.lower(), i // 3))
+        prot.new_acc = prot.accession
+        prot.new_desc = prot.description
+        prot.sequence = sequence
+        yield prot
+    return
+
+
+def write_database(file_name, count, style='uniprot', seed=1, duplicate_rate=0.02):
+    """Writes a synthetic database ("file_name" ending in ".gz" is compressed).
+    Returns the number of proteins written.
+    """
+    writer = fasta_lib.FastaWriter(file_name)
+    for prot in synthetic_proteins(count, style, seed, duplicate_rate):
+        writer.write(prot)
+    return writer.close()
+
+
+def database_name(folder, count, style='uniprot', seed=1, compressed=False):
+    """Standard file name for a synthetic database (so they can be reused).
+    """
+    name = 'synthetic_%s_%s_seed%s.fasta' % (style, count, seed)
+    return os.path.join(folder, name + ('.gz' if compressed else ''))
+
+
+def main(file_name, count, style, seed):
+    """Makes one synthetic database and prints its size.
+    """
+    print('==============================================================')
+    print(' make_fasta.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('==============================================================')
+    start = time.perf_counter()
+    written = write_database(file_name, count, style, seed)
+    print('...%s %s style proteins written to %s (%s bytes) in %.1f sec' %
+          ("{0:,d}".format(written), style, file_name,
+           "{0:,d}".format(os.path.getsize(file_name)), time.perf_counter() - start))
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Makes a deterministic synthetic FASTA database.')
+    parser.add_argument('file_name', help='output FASTA file (".gz" names are compressed)')
+    parser.add_argument('-n', '--count', type=int, default=10000, help='number of proteins (default: 10000)')
+    parser.add_argument('-s', '--style', choices=STYLES, default='uniprot', help='header style (default: uniprot)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    args = parser.parse_args()
+    main(args.file_name, args.count, args.style, args.seed)
+
+# end
@@ -0,0 +1,456 @@
+"""'benchmarks/run_benchmarks.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# runs the timed scenarios on synthetic databases and saves or compares JSON baselines
+#
+# usage:  python benchmarks/run_benchmarks.py -n 100000 -o baseline.json
+#         (change some code)
+#         python benchmarks/run_benchmarks.py -n 100000 -c baseline.json
+#
+# Each scenario runs in a new interpreter, so the peak RSS is for that
+# scenario alone (plus the small start-up size of this script).  Only the "run" step is timed (best of the repeats);
+# setup work (loading proteins to write, making accession lists) is not.
+
+import os
+import sys
+import io
+import re
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import contextlib
+import argparse
+
+BENCH_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_FOLDER))
+sys.path.insert(0, BENCH_FOLDER)
+import fasta_lib
+import make_fasta
+
+try:
+    import resource     # not on Windows
+except ImportError:
+    resource = None
+
+FORMAT_VERSION = 1
+REGRESSION = 0.10   # records/sec drop (fraction) reported as a regression
+
+
+def read_proteins(fasta_file):
+    """Returns a list of all proteins in "fasta_file" (setup step).
+    """
+    proteins = []
+    f = fasta_lib.FastaReader(fasta_file)
+    while True:
+        p = fasta_lib.Protein()
+        if not f.readNextProtein(p):
+            break
+        proteins.append(p)
+    return proteins
+
+def quiet():
+    """Context manager that hides the screen output of the scripts.
+    """
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+# scenarios: setup(context) returns the state for run(state), which
+# returns the number of records processed
+def setup_file(context):
+    return context
+
+def run_read(context):
+    f = fasta_lib.FastaReader(context['fasta'])
+    p = fasta_lib.Protein()
+    count = 0
+    while f.readNextProtein(p):
+        count += 1
+    return count
+
+def run_read_gzip(context):
+    return run_read(dict(context, fasta=context['gzip']))
+
+def run_read_fbin(context):
+    """Reads the ".fbin" copy (sequences are made, like the other reads).
+    """
+    f = fasta_lib.FastaReader(context['fbin'])
+    p = fasta_lib.Protein()
+    count = 0
+    while f.readNextProtein(p):
+        p.sequence
+        count += 1
+    return count
+
+def run_read_checked(context):
+    f = fasta_lib.FastaReader(context['fasta'])
+    p = fasta_lib.Protein()
+    count = 0
+    while f.readNextProtein(p, check_for_errs=True):
+        count += 1
+    return count
+
+def run_read_lazy(context):
+    """Header-only pass (sequences are never made).
+    """
+    f = fasta_lib.FastaReader(context['fasta'], lazy=True)
+    p = fasta_lib.Protein()
+    count = 0
+    while f.readNextProtein(p):
+        count += 1
+    return count
+
+def setup_proteins(context):
+    return dict(context, proteins=read_proteins(context['fasta']))
+
+def run_print_protein(state):
+    with open(os.path.join(state['folder'], 'print_protein.fasta'), 'w') as fout:
+        for p in state['proteins']:
+            p.printProtein(fout)
+    return len(state['proteins'])
+
+def run_fasta_writer(state):
+    import fasta_writer
+    fasta_writer.fasta_writer(state['proteins'], os.path.join(state['folder'], 'fasta_writer.fasta'))
+    return len(state['proteins'])
+
+def setup_digest(context):
+    state = setup_proteins(context)
+    state['regex'] = re.compile(r".(?:(?<![KR](?!P)).)*")
+    return state
+
+def run_digest(state):
+    regex = state['regex']
+    for p in state['proteins']:
+        p.enzymaticDigest(regex)
+    return len(state['proteins'])
+
+def run_molwt(state):
+    for p in state['proteins']:
+        p.molwtProtein(show_errs=False)
+    return len(state['proteins'])
+
+def setup_find_peptide(context):
+    state = setup_proteins(context)
+    state['peptides'] = ['K.%s.L' % (p.sequence[10:22],) for p in state['proteins']]
+    return state
+
+def run_find_peptide(state):
+    for (p, peptide) in zip(state['proteins'], state['peptides']):
+        p.findPeptide(peptide)
+    return len(state['proteins'])
+
+def setup_copy(context):
+    """Works on a copy of the database in its own folder (scripts write next to it).
+    """
+    folder = tempfile.mkdtemp(dir=context['folder'])
+    fasta = os.path.join(folder, os.path.basename(context['fasta']))
+    shutil.copyfile(context['fasta'], fasta)
+    return dict(context, fasta=fasta, folder=folder)
+
+def run_remove_duplicates(state):
+    import remove_duplicates
+    with quiet():
+        remove_duplicates.main(state['fasta'])
+    return state['count']
+
+def run_check_for_duplicates(state):
+    import check_for_duplicates
+    with quiet():
+        check_for_duplicates.main(state['fasta'])
+    return state['count']
+
+def run_reverse_fasta(state):
+    import reverse_fasta
+    with quiet():
+        reverse_fasta.main(state['fasta'], forward=False, reverse=False, both=True,
+                           contam_path=os.path.join(os.path.dirname(BENCH_FOLDER), 'Thermo_contams.fasta'))
+    return state['count']
+
+def setup_accessions(context):
+    """Every 100th accession (1% of the entries are extracted).
+    """
+    accessions = []
+    for (i, header) in enumerate(fasta_lib.read_headers(context['fasta'])):
+        if (i % 100) == 0:
+            accessions.append(header.split()[0])
+    return dict(context, accessions=accessions)
+
+def run_extract_by_accession(state):
+    import extract_by_accession
+    with open(os.path.join(state['folder'], 'extracted.fasta'), 'w') as fout:
+        extract_by_accession.extract_by_streaming(state['fasta'], state['accessions'], 'file', fout)
+    return state['count']
+
+def run_extract_fbin(state):
+    import extract_by_accession
+    with open(os.path.join(state['folder'], 'extracted_fbin.fasta'), 'w') as fout:
+        extract_by_accession.extract_with_fbin(state['fbin'], state['accessions'], 'file', fout)
+    return state['count']
+
+def run_extract_by_queries(state):
+    queries = [fasta_lib.ExtractionQuery('kinase', strings=['kinase']),
+               fasta_lib.ExtractionQuery('human', strings=['Homo sapiens', 'GRCh38']),
+               fasta_lib.ExtractionQuery('small', max_length=200, max_mw=25000.0)]
+    names = [q.name for q in queries]
+    out_files = dict([(name, open(os.path.join(state['folder'], name + '.fasta'), 'w')) for name in names])
+    try:
+        with quiet():
+            fasta_lib.MultiExtractor(queries).extract(state['fasta'], out_files)
+    finally:
+        for fout in out_files.values():
+            fout.close()
+    return state['count']
+
+def setup_headers(context):
+    return dict(context, headers=[h.split(None, 1)[1] for h in fasta_lib.read_headers(context['fasta'])
+                                  if ' ' in h])
+
+def run_ensembl_headers(state):
+    import Ensembl_fixer
+    Ensembl_fixer.ensembl_number.cache_clear()
+    for header in state['headers']:
+        Ensembl_fixer.parse_ensembl_header_line(header)
+    return len(state['headers'])
+
+def run_import(context):
+    """Fresh-interpreter "import fasta_lib" (see import_time.py).
+    """
+    import import_time
+    (seconds, loaded) = import_time.time_import('fasta_lib', 1, os.path.dirname(BENCH_FOLDER))
+    context['import_seconds'] = min(seconds, context.get('import_seconds', seconds))
+    return 1
+
+
+# (name, setup, run, processes the FASTA text) in the order they are run
+SCENARIOS = [
+    ('import_fasta_lib', setup_file, run_import, False),
+    ('read', setup_file, run_read, True),
+    ('read_gzip', setup_file, run_read_gzip, True),
+    ('read_fbin', setup_file, run_read_fbin, True),
+    ('read_checked', setup_file, run_read_checked, True),
+    ('read_lazy_headers', setup_file, run_read_lazy, True),
+    ('printProtein', setup_proteins, run_print_protein, True),
+    ('FastaWriter', setup_proteins, run_fasta_writer, True),
+    ('enzymaticDigest', setup_digest, run_digest, True),
+    ('molwtProtein', setup_proteins, run_molwt, True),
+    ('findPeptide', setup_find_peptide, run_find_peptide, True),
+    ('remove_duplicates', setup_copy, run_remove_duplicates, True),
+    ('check_for_duplicates', setup_copy, run_check_for_duplicates, True),
+    ('reverse_fasta', setup_copy, run_reverse_fasta, True),
+    ('extract_by_accession', setup_accessions, run_extract_by_accession, True),
+    ('extract_fbin', setup_accessions, run_extract_fbin, True),
+    ('extract_by_queries', setup_file, run_extract_by_queries, True),
+    ('ensembl_headers', setup_headers, run_ensembl_headers, False),
+    ]
+SCENARIO_NAMES = [s[0] for s in SCENARIOS]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None if unknown).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':    # bytes on macOS, KB on Linux
+        return round(peak / 1048576.0, 1)
+    return round(peak / 1024.0, 1)
+
+
+def run_scenario(name, context, repeats):
+    """Runs one scenario (in this process), returns the results dictionary.
+    """
+    (name, setup, run, text) = SCENARIOS[SCENARIO_NAMES.index(name)]
+    state = setup(context)
+    best = None
+    records = 0
+    for i in range(repeats):
+        start = time.perf_counter()
+        records = run(state)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    if 'import_seconds' in state:   # best time measured in the new interpreters
+        best = state['import_seconds']
+    result = {'seconds': round(best, 6), 'records': records,
+              'records_per_sec': round(records / best, 1) if best else None,
+              'mb_per_sec': None, 'peak_rss_mb': peak_rss_mb()}
+    if text and best:
+        result['mb_per_sec'] = round(context['size'] / best / 1048576.0, 2)
+    return result
+
+
+def child_scenario(name, context, repeats):
+    """Runs one scenario in a new interpreter, returns its results.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--context', json.dumps(context),
+               '-r', str(repeats)]
+    output = subprocess.run(command, capture_output=True, text=True)
+    if output.returncode:
+        print(output.stderr)
+        return {'error': output.stderr.strip().splitlines()[-1] if output.stderr.strip() else 'failed'}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    """Short commit hash of the code being timed ('' if unknown).
+    """
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(BENCH_FOLDER))
+        return output.stdout.strip()
+    except OSError:
+        return ''
+
+
+def make_databases(folder, count, style, seed):
+    """Makes (or reuses) the synthetic database and its gzip and ".fbin" copies.
+    The database and the ".fbin" file are made in other processes so the
+    memory they use is not part of the peak RSS that the scenario processes
+    inherit from this one.
+    """
+    import gzip
+    fasta = make_fasta.database_name(folder, count, style, seed)
+    if not os.path.exists(fasta):
+        print('...making %s' % (os.path.basename(fasta),))
+        subprocess.run([sys.executable, os.path.join(BENCH_FOLDER, 'make_fasta.py'), fasta + '.tmp',
+                        '-n', str(count), '-s', style, '--seed', str(seed)], stdout=subprocess.DEVNULL, check=True)
+        os.replace(fasta + '.tmp', fasta)
+    gzip_file = make_fasta.database_name(folder, count, style, seed, compressed=True)
+    if not os.path.exists(gzip_file):
+        with open(fasta, 'rb') as fin, gzip.open(gzip_file + '.tmp', 'wb', compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1048576)
+        os.replace(gzip_file + '.tmp', gzip_file)
+    fbin_file = os.path.splitext(fasta)[0] + '.fbin'
+    if not os.path.exists(fbin_file):
+        subprocess.run([sys.executable, '-c', 'import fasta_lib, sys; fasta_lib.write_fbin(sys.argv[1])', fasta],
+                       cwd=os.path.dirname(BENCH_FOLDER), check=True)
+    return fasta, gzip_file, fbin_file
+
+
+def compare(baseline_file, results, threshold=REGRESSION):
+    """Prints records/sec changes against a saved baseline.
+    Returns the list of scenarios that got slower by more than "threshold".
+    """
+    with open(baseline_file, 'r') as fin:
+        baseline = json.load(fin)
+    if baseline['meta'].get('count') != results['meta']['count'] or \
+       baseline['meta'].get('style') != results['meta']['style']:
+        print('...WARNING: baseline was made with a different database (count or style)')
+    print('...compared to %s (commit %s):' % (os.path.basename(baseline_file), baseline['meta'].get('commit') or '?'))
+    slower = []
+    for (name, new) in results['results'].items():
+        old = baseline['results'].get(name)
+        if not old or not old.get('records_per_sec') or not new.get('records_per_sec'):
+            continue
+        ratio = new['records_per_sec'] / old['records_per_sec']
+        flag = ''
+        if ratio < 1.0 - threshold:
+            flag = '  <== SLOWER'
+            slower.append(name)
+        print('......%-22s %12s -> %12s records/sec  (%.2fx)%s' %
+              (name, "{0:,d}".format(int(old['records_per_sec'])), "{0:,d}".format(int(new['records_per_sec'])),
+               ratio, flag))
+    return slower
+
+
+def main(count, style, seed, repeats, names, folder, out_file=None, baseline_file=None):
+    """Runs the scenarios and prints (and optionally saves) the results.
+    """
+    print('==================================================================')
+    print(' run_benchmarks.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('==================================================================')
+    own_folder = folder is None
+    if own_folder:
+        folder = tempfile.mkdtemp(prefix='fasta_bench_')
+    elif not os.path.exists(folder):
+        os.makedirs(folder)
+    try:
+        (fasta, gzip_file, fbin_file) = make_databases(folder, count, style, seed)
+        context = {'fasta': os.path.abspath(fasta), 'gzip': os.path.abspath(gzip_file),
+                   'fbin': os.path.abspath(fbin_file),
+                   'folder': os.path.abspath(folder), 'count': count, 'size': os.path.getsize(fasta)}
+        print('...%s %s style proteins (%s MB), best of %s runs' %
+              ("{0:,d}".format(count), style, "{0:,.1f}".format(context['size'] / 1048576.0), repeats))
+        results = {'version': FORMAT_VERSION,
+                   'meta': {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': git_commit(),
+                            'python': platform.python_version(), 'platform': platform.platform(),
+                            'count': count, 'style': style, 'seed': seed, 'repeats': repeats,
+                            'fasta_bytes': context['size']},
+                   'results': {}}
+        for name in names:
+            result = child_scenario(name, context, repeats)
+            results['results'][name] = result
+            if 'error' in result:
+                print('......%-22s FAILED: %s' % (name, result['error']))
+                continue
+            print('......%-22s %9.3f sec  %12s records/sec  %8s MB/sec  %8s MB peak RSS' %
+                  (name, result['seconds'], "{0:,d}".format(int(result['records_per_sec'])),
+                   '%.1f' % result['mb_per_sec'] if result['mb_per_sec'] else '-',
+                   '%.0f' % result['peak_rss_mb'] if result['peak_rss_mb'] else '-'))
+    finally:
+        if own_folder:
+            shutil.rmtree(folder, ignore_errors=True)
+    if out_file:
+        with open(out_file, 'w') as fout:
+            json.dump(results, fout, indent=2)
+        print('...results saved to %s' % (out_file,))
+    slower = []
+    if baseline_file:
+        slower = compare(baseline_file, results)
+    failed = [name for (name, result) in results['results'].items() if 'error' in result]
+    return results, slower + failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times fasta_utilities scenarios on a synthetic database.')
+    parser.add_argument('-n', '--count', type=int, default=10000,
+                        help='number of proteins (default: 10000; up to 50M works but takes a while)')
+    parser.add_argument('-s', '--style', choices=make_fasta.STYLES, default='uniprot',
+                        help='header style (default: uniprot)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='runs per scenario (default: 3)')
+    parser.add_argument('-k', '--scenarios', nargs='+', choices=SCENARIO_NAMES, default=SCENARIO_NAMES,
+                        help='scenarios to run (default: all)')
+    parser.add_argument('-d', '--folder', default=None,
+                        help='folder for the synthetic databases (kept and reused; default: temporary)')
+    parser.add_argument('-o', '--output', default=None, help='save the results to this JSON file')
+    parser.add_argument('-c', '--compare', default=None, help='compare to this saved JSON baseline')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--context', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_scenario(args.child, json.loads(args.context), args.repeats)))
+        sys.exit(0)
+    (results, problems) = main(args.count, args.style, args.seed, args.repeats, args.scenarios,
+                               args.folder, args.output, args.compare)
+    sys.exit(1 if problems else 0)
+
+# end
@@ -31,88 +31,51 @@ Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
 
 import os
 import sys
-import copy
 import time
 import fasta_lib
 
+# also print the total count of each amino acid character
+RESIDUE_COUNTS = False
+
+@fasta_lib.profile_entry
 def fasta_checker(fasta_file, write):
     """Checks FASTA files for non-standard amino acid characters.
+    All of the counts for a sequence are made in one pass (see ResidueStats),
+    and proteins are not kept in memory.
     """
     for obj in write:
         print("  database:", os.path.basename(fasta_file), file=obj)
 
     # initializations
-    proteins = []
     p = fasta_lib.Protein()
+    stats = fasta_lib.ResidueStats(duplicates=True, composition=RESIDUE_COUNTS)
 
-    # counters
-    prot_count = 0
-    no_start_met = 0
-    stop_count = 0
-    stop_end = 0
-    gap_count = 0
-    B_count = 0
-    J_count = 0
-    O_count = 0
-    U_count = 0
-    X_count = 0
-    Z_count = 0
-
-    # read the sequences into a list
+    # read the sequences (ResidueStats reports any invalid characters)
     f = fasta_lib.FastaReader(fasta_file)
-    while f.readNextProtein(p, check_for_errs=True):
-        prot_count += 1
-
-        # test for odd amino acids, stop codons, gaps
-        if not p.sequence.startswith('M'):
-            no_start_met += 1
-        if p.sequence.endswith('*'):
-            stop_end += 1
-        if '*' in p.sequence:
-            stop_count += 1
-        if '-' in p.sequence:
-            gap_count += 1
-        if 'B' in p.sequence:
-            B_count += 1
-        if 'J' in p.sequence:
-            J_count += 1
-        if 'O' in p.sequence:
-            O_count += 1
-        if 'U' in p.sequence:
-            U_count += 1
-        if 'X' in p.sequence:
-            X_count += 1
-        if 'Z' in p.sequence:
-            Z_count += 1
-
-        # save the protein in list
-        proteins.append(copy.deepcopy(p))
-
-    # check for duplicates and count
-    duplicate_count = 0
-    mw_dict = {}
-    for i, p in enumerate(proteins):
-        if mw_dict.get(str(p.molwtProtein()), False):
-            j = mw_dict[str(p.molwtProtein())]
-            if p.sequence == proteins[j].sequence:
-                duplicate_count += 1
-        else:
-            mw_dict[str(p.molwtProtein())] = i
+    while f.readNextProtein(p, check_for_errs=False):
+        (sequence, invalid) = stats.add(p.sequence)
+        if invalid:
+            print('   WARNING: unknown symbol(s) (%s) in %s' % (''.join(sorted(invalid)), p.accession))
+    counts = stats.counts
 
     # print out the report of oddball characters
     for obj in write:
-        print("  total number of input sequences was:", prot_count, file=obj)
-        print("  number of redundant sequences was:", duplicate_count, file=obj)
-        print("    translations that do not start with Met:", no_start_met, file=obj)
-        print("    translations that ended with a stop codon:", stop_end, file=obj)
-        print("    translations that had premature stop codons:", stop_count, file=obj)
-        print("    translations that contained gaps:", gap_count, file=obj)
-        print("    translations that had B (ambiguous N/D):", B_count, file=obj)
-        print("    translations that had J (ambiguous I/L):", J_count, file=obj)
-        print("    translations that had O (pyrrolysine):", O_count, file=obj)
-        print("    translations that had U (selenocysteine):", U_count, file=obj)
-        print("    translations that had X (unknown amino acid):", X_count, file=obj)
-        print("    translations that had Z (ambiguous Q/E):", Z_count, file=obj)
+        print("  total number of input sequences was:", counts['prot_count'], file=obj)
+        print("  number of redundant sequences was:", counts['duplicate_count'], file=obj)
+        print("    translations that do not start with Met:", counts['no_start_met_count'], file=obj)
+        print("    translations that ended with a stop codon:", counts['stop_end_count'], file=obj)
+        print("    translations that had premature stop codons:", counts['stop_count'], file=obj)
+        print("    translations that contained gaps:", counts['gap_count'], file=obj)
+        print("    translations that had B (ambiguous N/D):", counts['B_count'], file=obj)
+        print("    translations that had J (ambiguous I/L):", counts['J_count'], file=obj)
+        print("    translations that had O (pyrrolysine):", counts['O_count'], file=obj)
+        print("    translations that had U (selenocysteine):", counts['U_count'], file=obj)
+        print("    translations that had X (unknown amino acid):", counts['X_count'], file=obj)
+        print("    translations that had Z (ambiguous Q/E):", counts['Z_count'], file=obj)
+        if RESIDUE_COUNTS:
+            print("    amino acid character counts:", file=obj)
+            for (char, count) in sorted(stats.composition_counts().items()):
+                print("      %s: %s" % (char, "{0:,d}".format(count)), file=obj)
 
     return
 
@@ -122,6 +85,8 @@ print('==========================================================')
 print(' program check_fasta.py, v1.0.0, Phil Wilmarth, OHSU 2020 ')
 print('==========================================================')
 
+fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+
 # browse to the database
 database = r"C:\Xcalibur\database"
 if not os.path.exists(database):
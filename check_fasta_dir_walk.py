@@ -28,13 +28,22 @@ Technology & Research Collaborations, Oregon Health & Science University,
 Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
 """
 # simple FASTA checking program - counts unusual amino acid characters
+# files are checked in parallel and results are saved in the root folder,
+# so only new or changed files are read again on the next run
 
 import os
 import sys
-import copy
 import time
+import concurrent.futures
 import fasta_lib
 
+# number of worker processes (0 uses all cores, 1 is serial)
+NUM_WORKERS = 0
+
+# saved results (in the root folder), keyed by file path, size, and time
+CACHE_FILE = 'check_fasta_dir_walk.json'
+CACHE_VERSION = 1
+
 class Species():
     """generic data container."""
     def __init__(self):
@@ -74,72 +83,32 @@ class Species():
                  self.J_count, self.O_count, self.U_count, self.X_count, self.Z_count]
         return '\t'.join([str(x) for x in cells])
 
-def fasta_checker(species, write):
-    """Checks FASTA files for non-standard amino acid characters.
+def fasta_checker(fasta_file):
+    """Checks a FASTA file for non-standard amino acid characters.
+    Returns a dictionary of the counts (see ResidueStats), or None if the
+    file is missing.  Proteins are not kept; repeated sequences are counted
+    with a set of sequence digests.
     """
-    for obj in write:
-        print("  database:", os.path.basename(species.fasta_file), file=obj)
-
-    # initializations
-    proteins = []
     p = fasta_lib.Protein()
-
-    # counters
-    species.prot_count = 0
-    species.no_start_met_count = 0
-    species.stop_count = 0
-    species.stop_end_count = 0
-    species.gap_count = 0
-    species.B_count = 0
-    species.J_count = 0
-    species.O_count = 0
-    species.U_count = 0
-    species.X_count = 0
-    species.Z_count = 0
-
-    # read the sequences into a list
-    f = fasta_lib.FastaReader(species.fasta_file)
-    while f.readNextProtein(p, check_for_errs=True):
-        species.prot_count += 1
-
-        # test for odd amino acids, stop codons, gaps
-        if not p.sequence.startswith('M'):
-            species.no_start_met_count += 1
-        if p.sequence.endswith('*'):
-            species.stop_end_count += 1
-        if '*' in p.sequence:
-            species.stop_count += 1
-        if '-' in p.sequence:
-            species.gap_count += 1
-        if 'B' in p.sequence:
-            species.B_count += 1
-        if 'J' in p.sequence:
-            species.J_count += 1
-        if 'O' in p.sequence:
-            species.O_count += 1
-        if 'U' in p.sequence:
-            species.U_count += 1
-        if 'X' in p.sequence:
-            species.X_count += 1
-        if 'Z' in p.sequence:
-            species.Z_count += 1
-
-        # save the protein in list
-        proteins.append(copy.deepcopy(p))
-
-    # check for duplicates and count
-    species.duplicate_count = 0
-    mw_dict = {}
-    for i, p in enumerate(proteins):
-        if mw_dict.get(str(p.molwtProtein()), False):
-            j = mw_dict[str(p.molwtProtein())]
-            if p.sequence == proteins[j].sequence:
-                species.duplicate_count += 1
-        else:
-            mw_dict[str(p.molwtProtein())] = i
-
-    # print out the report of oddball characters
+    stats = fasta_lib.ResidueStats(duplicates=True)
+
+    # read the sequences one at a time
+    try:
+        f = fasta_lib.FastaReader(fasta_file)
+    except FileNotFoundError:
+        return None
+    while f.readNextProtein(p, check_for_errs=False):
+        (sequence, invalid) = stats.add(p.sequence)
+        if invalid:
+            print('   WARNING: unknown symbol(s) (%s) in %s' % (''.join(sorted(invalid)), p.accession))
+
+    return stats.counts
+
+def print_report(species, write):
+    """Prints the report of oddball characters for one database.
+    """
     for obj in write:
+        print("  database:", os.path.basename(species.fasta_file), file=obj)
         print("  total number of input sequences was:", species.prot_count, file=obj)
         print("  number of redundant sequences was:", species.duplicate_count, file=obj)
         print("    translations that do not start with Met:", species.no_start_met_count, file=obj)
@@ -152,56 +121,129 @@ def fasta_checker(species, write):
         print("    translations that had U (selenocysteine):", species.U_count, file=obj)
         print("    translations that had X (unknown amino acid):", species.X_count, file=obj)
         print("    translations that had Z (ambiguous Q/E):", species.Z_count, file=obj)
+        print(file=obj)
+    return
 
-    return # attributes added to species should be there after return
-
-
-# print program name and version
-print('===================================================================')
-print(' program check_fasta_dir_walk.py, v1.0.0, Phil Wilmarth, OHSU 2020 ')
-print('===================================================================')
-
-# select a root folder
-root_path = fasta_lib.get_folder(os.getcwd(), 'Select a Root folder')
-if not root_path:
-    sys.exit()     # cancel button repsonse
-
-# create a log file to mirror screen output
-_folder = root_path
-log_obj = open(os.path.join(_folder, 'fasta_utilities.log'), 'a')
-write = [None, log_obj]
-fasta_lib.time_stamp_logfile('\n>>> starting: check_fasta.py', log_obj)
-
-species_list = []
-# process the FASTA files
-for root, dirs, files in os.walk(root_path):
-    for file in files:
-        if file.endswith(".all.fa.gz"):
-            species = Species()
-            species.fasta_file = os.path.join(root,file)
-            sub_folder = os.path.split(root)[-1]
-            parts = sub_folder.split('__')
-            species.common_name = parts[0]
-            species.latin_name = parts[1]
-            species.taxon = parts[2]
-            species.release = file.split('__')[0]
-            species.db_name = file.split('__')[2]
-            try:
-                fasta_checker(species, write)
+def find_species(root_path):
+    """Walks "root_path" and returns list of Species for the ".all.fa.gz" files.
+    """
+    species_list = []
+    for root, dirs, files in os.walk(root_path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(".all.fa.gz"):
+                species = Species()
+                species.fasta_file = os.path.join(root,file)
+                sub_folder = os.path.split(root)[-1]
+                parts = sub_folder.split('__')
+                species.common_name = parts[0]
+                species.latin_name = parts[1]
+                species.taxon = parts[2]
+                species.release = file.split('__')[0]
+                species.db_name = file.split('__')[2]
                 species_list.append(species)
-            except FileNotFoundError:
-                pass
-            for obj in write:
-                print(file=obj)
+    return species_list
 
-# finish up the log file
-fasta_lib.time_stamp_logfile('>>> ending: check_fasta.py', log_obj)
-log_obj.close()
+def file_stamp(fasta_file):
+    """Returns [size, modification time] of a file (None if it is missing).
+    """
+    try:
+        stat = os.stat(fasta_file)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+@fasta_lib.profile_entry
+def main(root_path, workers=NUM_WORKERS):
+    """Checks all of the FASTA files under "root_path" and writes the summary table.
+    """
+    # create a log file to mirror screen output
+    _folder = root_path
+    log_obj = open(os.path.join(_folder, 'fasta_utilities.log'), 'a')
+    write = [None, log_obj]
+    fasta_lib.time_stamp_logfile('\n>>> starting: check_fasta_dir_walk.py', log_obj)
+
+    # reuse saved results for files that have not changed
+    cache = fasta_lib.CatalogCache(os.path.join(root_path, CACHE_FILE), CACHE_VERSION)
+    saved = (cache.load() or {}).get('Files', {})
+    results = {}
+    to_check = []
+    species_list = find_species(root_path)
+    for species in species_list:
+        key = os.path.relpath(species.fasta_file, root_path)
+        stamp = file_stamp(species.fasta_file)
+        if stamp and saved.get(key, {}).get('stamp') == stamp:
+            results[key] = saved[key]
+        elif stamp:
+            to_check.append((key, species.fasta_file, stamp))
+
+    # check the new or changed files in parallel
+    workers = min(workers or os.cpu_count() or 1, max(len(to_check), 1))
+    for obj in write:
+        print('...%s FASTA files, %s already checked, checking %s with %s workers' %
+              (len(species_list), len(results), len(to_check), workers), file=obj)
+    def save_counts(key, get_counts):
+        """Adds a file's counts to the results (a failed file is reported and left out)."""
+        try:
+            counts = get_counts()
+        except Exception as err:
+            for obj in write:
+                print('...WARNING: %s could not be checked (%s: %s)' % (key, type(err).__name__, err), file=obj)
+            return
+        if counts:
+            results[key] = {'stamp': stamp_of[key], 'counts': counts}
+            print('......%s checked' % (key,))
+
+    stamp_of = {key: stamp for (key, fasta_file, stamp) in to_check}
+    try:
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                futures = {pool.submit(fasta_checker, fasta_file): key for (key, fasta_file, stamp) in to_check}
+                for future in concurrent.futures.as_completed(futures):
+                    save_counts(futures[future], future.result)
+        else:
+            for (key, fasta_file, stamp) in to_check:
+                save_counts(key, lambda: fasta_checker(fasta_file))
+    finally:
+        cache.save({'Files': results})   # (keeps whatever finished if the run is stopped)
 
-# write the summary table
-with open(os.path.join(root_path, 'database_analysis.txt'), 'wt') as fout:
-    print(species_list[0].make_header(), file=fout)
+    # print the reports in the directory walk order
+    checked = []
     for species in species_list:
-        print(species.make_row(), file=fout)
+        key = os.path.relpath(species.fasta_file, root_path)
+        if key in results:
+            for (name, count) in results[key]['counts'].items():
+                setattr(species, name, count)
+            print_report(species, write)
+            checked.append(species)
+
+    # finish up the log file
+    fasta_lib.time_stamp_logfile('>>> ending: check_fasta_dir_walk.py', log_obj)
+    log_obj.close()
+
+    # write the summary table
+    if checked:
+        with open(os.path.join(root_path, 'database_analysis.txt'), 'wt') as fout:
+            print(checked[0].make_header(), file=fout)
+            for species in checked:
+                print(species.make_row(), file=fout)
+    return checked
+
+
+if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    # print program name and version
+    print('===================================================================')
+    print(' program check_fasta_dir_walk.py, v1.1.0, Phil Wilmarth, OHSU 2020 ')
+    print('===================================================================')
+
+    # select a root folder (or pass it on the command line)
+    if len(sys.argv) > 1 and os.path.isdir(sys.argv[1]):
+        root_path = sys.argv[1]
+    else:
+        root_path = fasta_lib.get_folder(os.getcwd(), 'Select a Root folder')
+    if not root_path:
+        sys.exit()     # cancel button repsonse
+    main(root_path)
 
 # end
@@ -30,9 +30,9 @@ Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
 
 import os
 import sys
-import copy
 import fasta_lib
 
+@fasta_lib.profile_entry
 def main(fasta_file):
     """Checks entries in a FASTA protein database for identical duplicates.
         Call with FASTA filename, returns a couple of dictionaries
@@ -91,7 +91,8 @@ def main(fasta_file):
     out_obj.close()
 
     # read in and save the proteins that might be duplicates of each other
-    candidates = []
+    # (a ProteinTable keeps them in a few compact buffers)
+    candidates = fasta_lib.ProteinTable()
     i = 0
     dup2 = 0
     index = {}
@@ -99,7 +100,7 @@ def main(fasta_file):
     p = fasta_lib.Protein()
     while f.readNextProtein(p, check_for_errs=False):
         if to_save.get(p.accession, False):
-            candidates.append(copy.deepcopy(p))
+            candidates.append(p)
             index[p.accession] = i
             i += 1
     if len(candidates) == 0:
@@ -128,6 +129,7 @@ def main(fasta_file):
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
 
     # check if database name passed on command line
     if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
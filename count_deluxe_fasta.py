@@ -35,6 +35,7 @@ import re
 import fasta_lib
 
 
+@fasta_lib.profile_entry
 def fasta_counter(fasta_file):
     """Counts entries in a FASTA protein database.
         Call with FASTA filename.
@@ -66,7 +67,7 @@ def fasta_counter(fasta_file):
     summary_obj = open(summary_file, mode='wt')
     summary_obj.write('Accession\tLength\tMW\n')
 
-    # read proteins until EOF; NOTE: checking for errors slows program by factor of 3-4
+    # read proteins until EOF; NOTE: checking for errors adds about 50% to the reading time
     while f.readNextProtein(p, check_for_errs=True):
 
         # count protein sequences
@@ -105,6 +106,7 @@ def fasta_counter(fasta_file):
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # check if database name(s) passed on command line
     if len(sys.argv) > 1:
         fasta_files = sys.argv[1:]
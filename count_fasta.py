@@ -34,6 +34,7 @@ import time
 import fasta_lib
 
 
+@fasta_lib.profile_entry
 def fasta_counter(fasta_file):
     """Counts entries in a FASTA protein database.
         Call with FASTA filename.
@@ -44,35 +45,25 @@ def fasta_counter(fasta_file):
     log_obj = open(os.path.join(_folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: count_fasta.py', log_obj)
+    metrics = fasta_lib.RunMetrics('count_fasta.py', log_obj)
 
-    # create instances of reader object and protein object, initialize counters
-    f = fasta_lib.FastaReader(fasta_file)
-    p = fasta_lib.Protein()
+    # initialize counters
     prot = 0
     head = 0
-    conflict = {}
 
-    # read proteins until EOF; NOTE: checking for errors slows program by factor of 3-4
-    while f.readNextProtein(p, check_for_errs=False):
+    # only header lines are needed so skip parsing the sequences
+    metrics.start_stage(os.path.split(fasta_file)[1])
+    for header in fasta_lib.read_headers(fasta_file):
 
         # count protein sequences
         prot += 1
         if (prot % 500000) == 0:
-            print('......(%s proteins read...)' % ("{0:,d}".format(prot),))
-
-##        # check for duplicate accession
-##        dup = conflict.get(p.accession, False)
-##        if dup:
-##            for obj in write:
-##                print('\n...WARNING: %s is already in FASTA database!\n' % (p.accession,), file=obj)
-##                if p.molwtProtein(show_errs=False) == conflict[p.accession]:
-##                    print('......possible duplicated sequence...', file=obj)
-##        else:
-##            conflict[p.accession] = p.molwtProtein(show_errs=False)
+            metrics.progress(prot)
 
         # count number of header elements
-        control_A = p.description.count(chr(1))
+        control_A = header.count(chr(1))
         head = head + control_A + 1
+    metrics.end_stage(prot)
 
     # print results and return
     for obj in write:
@@ -80,6 +71,7 @@ def fasta_counter(fasta_file):
         if head > prot:
             print('...there were %s header lines' % ("{0:,d}".format(head),), file=obj)
 
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: count_fasta.py', log_obj)
     log_obj.close()
     return
@@ -87,6 +79,7 @@ def fasta_counter(fasta_file):
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # check if database name(s) passed on command line
     if len(sys.argv) > 1:
         fasta_files = sys.argv[1:]
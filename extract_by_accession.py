@@ -0,0 +1,243 @@
+"""'extract_by_accession.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# bulk extraction of proteins by accession list
+
+import os
+import sys
+import argparse
+import fasta_lib
+
+# default output order: "input" (accession list order) or "file" (database order)
+ORDER = 'file'
+
+# use (and make if needed) an accession index for uncompressed databases
+USE_INDEX = True
+
+
+def read_accession_list(acc_file):
+    """Reads accessions (first field on each line) from a text file.
+    Returns list in file order with duplicates removed.
+    """
+    accessions = []
+    seen = set()
+    for line in open(acc_file, 'r'):
+        if not line.strip() or line.startswith('#'):
+            continue
+        acc = line.split()[0]
+        if acc.startswith('>'):
+            acc = acc[1:]
+        if acc not in seen:
+            seen.add(acc)
+            accessions.append(acc)
+    return accessions
+
+def extract_with_index(db_file, accessions, order, out_obj):
+    """Seeks to each requested entry using the persistent accession index.
+    Entries are rewritten with printProtein (like the other modes).
+    Returns the list of accessions that were not found.
+    """
+    index = fasta_lib.FastaIndex(db_file)
+    found = {}      # (offset, length): first request position (avoids writing twice)
+    missing = []
+    for i, acc in enumerate(accessions):
+        spans = index.lookup_all(acc)
+        if not spans:
+            missing.append(acc)
+        for span in spans:
+            found.setdefault(span, i)
+    spans = list(found.keys())
+    if order == 'file':
+        spans.sort()
+    else:
+        spans.sort(key=lambda x: (found[x], x))
+    for (offset, length) in spans:
+        index.read_protein(offset, length).printProtein(out_obj)
+    index.close()
+    return missing
+
+def extract_with_fbin(db_file, accessions, order, out_obj):
+    """Looks up each requested entry in the accession index of a ".fbin" database.
+    Returns the list of accessions that were not found.
+    """
+    table = fasta_lib.ProteinTable.load(db_file)
+    found = {}      # row: first request position (avoids writing twice)
+    missing = []
+    for i, acc in enumerate(accessions):
+        rows = table.find_all(acc)
+        if not rows:
+            missing.append(acc)
+        for row in rows:
+            found.setdefault(row, i)
+    rows = list(found.keys())
+    if order == 'file':
+        rows.sort()
+    else:
+        rows.sort(key=lambda x: (found[x], x))
+    for row in rows:
+        table[row].printProtein(out_obj)
+    table.close()
+    return missing
+
+def extract_by_streaming(db_file, accessions, order, out_obj):
+    """Reads the database once and tests each header against a hashed set.
+    Entries are written as they are read ("file" order) or held until the
+    end and written in accession list order ("input" order).
+    Returns the list of accessions that were not found.
+    """
+    wanted = {}     # accession: request position
+    for i, acc in enumerate(accessions):
+        wanted[acc] = i
+    found = set()
+    held = []       # (first request position, entry number, entry) for "input" order
+    prot_read = 0
+    # (sequences of uncompressed databases are only read for matching entries)
+    f = fasta_lib.FastaReader(db_file, lazy=True)
+    prot = fasta_lib.Protein()
+    while f.readNextProtein(prot, check_for_errs=False):
+        prot_read += 1
+        if (prot_read % 500000) == 0:
+            print('......(%s proteins read...)' % ("{0:,d}".format(prot_read),))
+        hits = []
+        for header in (prot.accession + ' ' + prot.description).split(chr(1)):
+            if not header.strip():
+                continue
+            for key in fasta_lib.accession_keys(header.split()[0]):
+                if key in wanted:
+                    hits.append(wanted[key])
+                    found.add(key)
+        if not hits:
+            continue
+        if order == 'file':
+            prot.printProtein(out_obj)
+        else:
+            held.append((min(hits), prot_read, (prot.new_acc, prot.new_desc, prot.sequence)))
+    if order == 'input':
+        held.sort(key=lambda x: x[:2])
+        for (position, count, entry) in held:
+            prot.new_acc, prot.new_desc, prot.sequence = entry
+            prot.printProtein(out_obj)
+    return [acc for acc in accessions if acc not in found]
+
+@fasta_lib.profile_entry
+def main(acc_file, db_file, order=ORDER, use_index=USE_INDEX):
+    """Extracts proteins whose accessions are in a list from a FASTA database.
+        Accessions can be any part of UniProt accessions ("P12345",
+        "NAME_SPECIES", or "sp|P12345|NAME_SPECIES") or NCBI accessions with
+        or without versions.  Any header of compound nr entries can match.
+        Every entry with a matching key is written once with its full header
+        line (shared keys, like the NAME_SPECIES of isoforms or versionless
+        NCBI accessions, give all of their entries in every mode).
+        Uncompressed databases use a saved accession index (made on first
+        use) for seek-based retrieval; ".fbin" databases use their own
+        accession index; compressed databases are read once.
+    """
+    print('=================================================================')
+    print(' extract_by_accession.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('=================================================================')
+
+    db_folder, db_name = os.path.split(db_file)
+    base_name = db_name.replace('.gz', '').replace('.fbin', '')
+    if not base_name.endswith('.fasta'):
+        base_name = base_name + '.fasta'
+    list_name = os.path.splitext(os.path.basename(acc_file))[0]
+    out_name = os.path.join(db_folder, base_name.replace('.fasta', '_'+list_name+'.fasta'))
+    missing_name = os.path.join(db_folder, base_name.replace('.fasta', '_'+list_name+'_missing.txt'))
+
+    # create a log file to mirror screen output
+    log_obj = open(os.path.join(db_folder, 'fasta_utilities.log'), 'a')
+    write = [None, log_obj]
+    fasta_lib.time_stamp_logfile('\n>>> starting: extract_by_accession.py', log_obj)
+
+    accessions = read_accession_list(acc_file)
+    for obj in write:
+        print('...%s accessions read from %s' %
+              ("{0:,d}".format(len(accessions)), os.path.basename(acc_file)), file=obj)
+        print('...extracting from %s in %s order...' % (db_name, order), file=obj)
+
+    out_obj = open(out_name, 'w')
+    if db_file.endswith('.fbin'):
+        missing = extract_with_fbin(db_file, accessions, order, out_obj)
+    elif use_index and not db_file.endswith('.gz'):
+        missing = extract_with_index(db_file, accessions, order, out_obj)
+    else:
+        missing = extract_by_streaming(db_file, accessions, order, out_obj)
+    out_obj.close()
+
+    # save any accessions that were not found
+    if missing:
+        with open(missing_name, 'w') as missing_obj:
+            for acc in missing:
+                print(acc, file=missing_obj)
+    elif os.path.exists(missing_name):
+        os.remove(missing_name)     # from an earlier run
+
+    for obj in write:
+        print('...%s accessions were found and written to %s' %
+              ("{0:,d}".format(len(accessions) - len(missing)), os.path.basename(out_name)), file=obj)
+        if missing:
+            print('...%s accessions were not found (listed in %s)' %
+                  ("{0:,d}".format(len(missing)), os.path.basename(missing_name)), file=obj)
+
+    fasta_lib.time_stamp_logfile('>>> ending: extract_by_accession.py', log_obj)
+    log_obj.close()
+    return
+
+
+# setup stuff: check for command line args, etc.
+if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    parser = argparse.ArgumentParser(description='Extracts proteins by accession from a FASTA database.')
+    parser.add_argument('-o', '--order', dest='order', choices=['file', 'input'], default=ORDER,
+                        help='write proteins in database order or accession list order')
+    parser.add_argument('-n', '--no-index', dest='use_index', action='store_false', default=USE_INDEX,
+                        help='always read the database instead of using an accession index')
+    parser.add_argument('files', help='accession list file and FASTA database', nargs='*')
+    args = parser.parse_args()
+
+    # browse to any files not passed on the command line
+    default = r'C:\Xcalibur\database'
+    if not os.path.exists(default):
+        default = os.getcwd()
+    if len(args.files) > 0:
+        acc_file = args.files[0]
+    else:
+        acc_file = fasta_lib.get_file(default, [('Text files', '*.txt'), ('All files', '*.*')],
+                                      title_string='Select an accession list file')
+        if acc_file == '': sys.exit() # cancel button response
+    if len(args.files) > 1:
+        db_file = args.files[1]
+    else:
+        db_file = fasta_lib.get_file(default, [('Fasta files', '*.fasta'), ('Zipped files', '*.gz'),
+                                               ('Binary databases', '*.fbin')],
+                                     title_string='Select a FASTA database')
+        if db_file == '': sys.exit() # cancel button response
+
+    main(acc_file, db_file, args.order, args.use_index)
+
+# end
@@ -0,0 +1,208 @@
+"""'extract_by_queries.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# single-pass extraction of many subset databases from one large FASTA file
+
+import os
+import sys
+import fasta_lib
+
+# clean accessions/descriptions or not (and DB-specific cleaning options)
+# NOTE: information can be lost if accessions/descriptions are cleaned
+CLEAN_ACCESSIONS = False
+REF_SEQ_ONLY = False
+KEEP_UNIPROT_ID = False
+
+# flag for case-sensitive string matching (True) or not (False)
+CASE_SENSITIVE = True
+
+# query file format: one criterion per line, "name  type  value", where
+# "name" is the output file tag, "type" is one of the keys below, and
+# "value" is the rest of the line (strings can contain spaces).
+# Lines with the same name are combined into one output file.
+# Lines starting with "#" are comments.
+QUERY_TYPES = ['string', 'accession', 'accession_file', 'taxon',
+               'min_length', 'max_length', 'min_mw', 'max_mw']
+
+
+def read_query_file(query_file, case_sensitive=True):
+    """Parses a query file into a list of ExtractionQuery objects.
+    """
+    criteria = {}   # name: dictionary of ExtractionQuery keyword arguments
+    names = []      # keep names in file order
+    for i, line in enumerate(open(query_file, 'r')):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            name, q_type, value = line.split(None, 2)
+        except ValueError:
+            print('...WARNING: skipping line %s of query file: "%s"' % (i+1, line))
+            continue
+        if q_type not in QUERY_TYPES:
+            print('...WARNING: unknown query type "%s" on line %s' % (q_type, i+1))
+            continue
+        if name not in criteria:
+            criteria[name] = {'strings': [], 'accessions': set(), 'taxa': set()}
+            names.append(name)
+        kwargs = criteria[name]
+        if q_type == 'string':
+            kwargs['strings'].append(value)
+        elif q_type == 'accession':
+            kwargs['accessions'].add(value)
+        elif q_type == 'accession_file':
+            for acc in open(value, 'r'):
+                if acc.strip():
+                    kwargs['accessions'].add(acc.split()[0])
+        elif q_type == 'taxon':
+            kwargs['taxa'].add(abs(int(value)))
+        elif q_type.endswith('_length'):
+            kwargs[q_type] = int(value)
+        else:
+            kwargs[q_type] = float(value)
+    return [fasta_lib.ExtractionQuery(name, case_sensitive=case_sensitive, **criteria[name])
+            for name in names]
+
+def get_taxon_lookup(db_file, db_folder):
+    """Loads the right taxonomy mapping for the database type.
+    The first protein accession decides UniProt or NCBI nr formats.
+    """
+    prot = fasta_lib.Protein()
+    fasta_lib.FastaReader(db_file).readNextProtein(prot)
+    if prot.accession.startswith('sp|') or prot.accession.startswith('tr|'):
+        (sci_to_taxon, id_to_taxon) = fasta_lib.make_uniprot_to_taxon(db_folder)
+        name_to_taxon = fasta_lib.make_all_names_to_taxon(db_folder)
+        return fasta_lib.uniprot_taxon_lookup(sci_to_taxon, name_to_taxon)
+    else:
+        acc_to_taxon = fasta_lib.AccToTaxon(db_folder)
+        acc_to_taxon.create_or_load(db_folder)
+        return fasta_lib.nr_taxon_lookup(acc_to_taxon, REF_SEQ_ONLY)
+
+def describe_query(query):
+    """Makes a short text summary of a query's criteria.
+    """
+    parts = ['string "%s"' % x for x in query.strings]
+    if query.accessions:
+        parts.append('%s accessions' % ("{0:,d}".format(len(query.accessions)),))
+    parts += ['taxon %s' % x for x in sorted(query.taxa)]
+    for attr in ['min_length', 'max_length', 'min_mw', 'max_mw']:
+        if getattr(query, attr) is not None:
+            parts.append('%s %s' % (attr, getattr(query, attr)))
+    return ', '.join(parts)
+
+@fasta_lib.profile_entry
+def main(query_file, db_file):
+    """Extracts many subset databases with one read of a FASTA database.
+        Every query (output file) is tested against each protein as the
+        database is read, so large compressed databases are decompressed
+        and parsed only once no matter how many subsets are made.  Queries
+        can mix header strings, accession lists, taxonomy numbers, and
+        length/MW limits.  Matching proteins are written once per output
+        file with compound (nr) headers limited to the matching headers.
+    """
+    print('=============================================================')
+    print(' extract_by_queries.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('=============================================================')
+
+    db_folder, db_name = os.path.split(db_file)
+    base_name = db_name.replace('.gz', '')
+    if not base_name.endswith('.fasta'):
+        base_name = base_name + '.fasta'
+
+    # create a log file to mirror screen output
+    log_obj = open(os.path.join(db_folder, 'fasta_utilities.log'), 'a')
+    write = [None, log_obj]
+    fasta_lib.time_stamp_logfile('\n>>> starting: extract_by_queries.py', log_obj)
+    metrics = fasta_lib.RunMetrics('extract_by_queries.py', log_obj)
+
+    # get the queries and any taxonomy mapping that they need
+    queries = read_query_file(query_file, CASE_SENSITIVE)
+    if not queries:
+        print('...WARNING: no valid queries in %s' % (query_file,))
+        log_obj.close()
+        return
+    taxon_lookup = None
+    if [q for q in queries if q.taxa]:
+        taxon_lookup = get_taxon_lookup(db_file, db_folder)
+    extractor = fasta_lib.MultiExtractor(queries, taxon_lookup)
+
+    # print the list of queries and open the output files
+    out_files = {}
+    for obj in write:
+        print('...extracting entries for these queries:', file=obj)
+    for i, query in enumerate(queries):
+        fname = base_name.replace('.fasta', '_'+query.name+'.fasta')
+        out_files[query.name] = open(os.path.join(db_folder, fname), 'w')
+        for obj in write:
+            print('......(%s) %s to file ending in "%s"' % (i+1, describe_query(query), query.name), file=obj)
+
+    # one pass through the database for all queries
+    for obj in write:
+        print('...reading %s and extracting entries...' % (db_name,), file=obj)
+    prot_read = extractor.extract(db_file, out_files, CLEAN_ACCESSIONS,
+                                  REF_SEQ_ONLY, KEEP_UNIPROT_ID, metrics)
+    for f in out_files.values():
+        f.close()
+
+    # print out the summary stuff
+    for obj in write:
+        print('...%s protein entries in %s' % ("{0:,d}".format(prot_read), db_name), file=obj)
+        print('...output file summaries...', file=obj)
+        for i, query in enumerate(queries):
+            temp = base_name.replace('.fasta', '_'+query.name+'.fasta')
+            print('......(%s) %s proteins extracted and written to %s' %
+                  (i+1, "{0:,d}".format(query.count), temp), file=obj)
+
+    metrics.summary()
+    fasta_lib.time_stamp_logfile('>>> ending: extract_by_queries.py', log_obj)
+    log_obj.close()
+    return
+
+# check for command line launch and see if any arguments passed
+if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    default = r'C:\Xcalibur\database'
+    if not os.path.exists(default):
+        default = os.getcwd()
+
+    # query file and database can be passed on command line
+    if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
+        query_file = sys.argv[1]
+    else:
+        query_file = fasta_lib.get_file(default, [('Text files', '*.txt'), ('All files', '*.*')],
+                                        title_string='Select a query file')
+        if query_file == '': sys.exit() # cancel button response
+    if len(sys.argv) > 2 and os.path.exists(sys.argv[2]):
+        db_file = sys.argv[2]
+    else:
+        db_file = fasta_lib.get_file(default, [('Zipped files', '*.gz'), ('Fasta files', '*.fasta')],
+                                     title_string='Select a FASTA database')
+        if db_file == '': sys.exit() # cancel button response
+    main(query_file, db_file)
+
+# end
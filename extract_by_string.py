@@ -50,6 +50,7 @@ string_dict = { 'Homo sapiens':'human_string'}
 string_dict = { 'Uncharacterized protein':'uncharacterized_proteins'}
 
 
+@fasta_lib.profile_entry
 def main(string_dict):
     """Main program to extract entries containing strings from databases.
         Simple string search of pattern in combined accession/description lines.
@@ -83,6 +84,7 @@ def main(string_dict):
     log_obj = open(os.path.join(db_folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: extract_by_string.py', log_obj)
+    metrics = fasta_lib.RunMetrics('extract_by_string.py', log_obj)
 
     # print the list of patterns that will be extracted
     string_list = list(string_dict.items())
@@ -106,15 +108,17 @@ def main(string_dict):
         string_files[name] = open(string_files[name], 'w')
 
     # create a FastaReader object, initialize counters, and start reading
-    x = fasta_lib.FastaReader(db_file)
+    # (sequences of uncompressed databases are only read for matching entries)
+    x = fasta_lib.FastaReader(db_file, lazy=True)
     prot = fasta_lib.Protein()
     prot_read = 0
     for obj in write:
         print('...reading %s and extracting entries...' % (db_name,), file=obj)
+    metrics.start_stage(db_name, x)
     while x.readNextProtein(prot, check_for_errs=False):
         prot_read += 1
         if (prot_read % 500000) == 0:
-            print('......(%s proteins read...)' % ("{0:,d}".format(prot_read),))
+            metrics.progress(prot_read)
         written = {}    # make sure protein is written only ONCE per OUTFILE
         header = prot.accession + ' ' + prot.description # recreate the '>' line
         if not CASE_SENSITIVE:  # convert to uppercase
@@ -151,8 +155,10 @@ def main(string_dict):
                 elif prot.accession.startswith('sp|') or prot.accession.startswith('tr|'):
                     prot.parseUniProt(KEEP_UNIPROT_ID)
             prot.printProtein(f)    # write any matching proteins
+            metrics.add('records_written')
 
     # close files
+    metrics.end_stage(prot_read)
     for f in string_files.values():
         f.close()
 
@@ -172,12 +178,14 @@ def main(string_dict):
             print('......(%s) %s proteins extracted and written to %s' %
                   (i+1, "{0:,d}".format(name_count[name]), temp), file=obj)
 
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: extract_by_string.py', log_obj)
     log_obj.close()
     return
 
 # check for command line launch and see if any arguments passed
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     if len(sys.argv) > 1:
         arg_dict = fasta_lib.string_cmd_line_checker(sys.argv)
         if arg_dict:
@@ -41,15 +41,26 @@ Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
 import os
 import sys
 import gzip
-import tarfile
-import urllib.request
-import socket
+import zlib
+import codecs
+import threading
+import queue
 import sqlite3
-import tkinter
-from tkinter import filedialog
+import pickle
+import json
+import time
+
+# NOTE: tkinter (GUI dialogs), the network modules (ftplib, urllib), tarfile,
+# hashlib, and the process/thread pools are imported in the functions that
+# use them.  Most scripts only read and write FASTA files, so importing
+# fasta_lib stays fast and works on computers without a display.
 
 import fasta_lib
 
+# profile the scripts' entry points (set by "--profile", see profile_flag and
+# profile_entry; the FASTA_UTILITIES_PROFILE environment variable also works)
+PROFILE = False
+
 def get_folder(default_location, title_string=None):
     """Dialog box to browse to a folder.  Returns folder path.
 
@@ -59,6 +70,9 @@ def get_folder(default_location, title_string=None):
         and "full_folder_name" is the complete selected folder name.
     Written by Phil Wilmarth, 2008, 2016
     """
+    import tkinter
+    from tkinter import filedialog
+
     # set up GUI elements
     root = tkinter.Tk()
     root.withdraw()
@@ -91,6 +105,9 @@ def get_file(default_location, ext_list, title_string=None):
         "full_file_name" is the complete name of the selected file.
     Written by Phil Wilmarth, OHSU, 2008, 2016.
     """
+    import tkinter
+    from tkinter import filedialog
+
     # set up GUI elements
     root = tkinter.Tk()
     root.withdraw()
@@ -126,6 +143,9 @@ def save_file(default_location, ext_list, default_file='', title_string=None):
         "full_file_name" is the complete name of the desired file.
     Written by Phil Wilmarth, OHSU, 2009, 2016.
     """
+    import tkinter
+    from tkinter import filedialog
+
     # set up GUI elements
     root = tkinter.Tk()
     root.withdraw()
@@ -161,6 +181,9 @@ def get_files(default_location, ext_list, title_string=None):
         "file_name_list" is a tuple of file name(s).
     Written by Phil Wilmarth, OHSU, 2010, 2016.
     """
+    import tkinter
+    from tkinter import filedialog
+
     # set up GUI elements
     root = tkinter.Tk()
     root.withdraw()
@@ -258,6 +281,8 @@ class Protein:
     """Object to hold protein accession numbers, descriptions, and sequences.
     Methods:
         __init_:standard constructor, no parameters.
+        sequence: (property) the sequence string (see set_span)
+        set_span: sets a lazy sequence from a span of mmap bytes
         readProtein: returns next protein from "fasta_reader"
         printProtein: prints sequence in FASTA format
         parseNCBI: cleans up nr entries
@@ -287,6 +312,48 @@ class Protein:
         self.peptides = []
         return
 
+    @property
+    def sequence(self):
+        """Protein sequence string.  Lazy FastaReader objects only save the
+        (mmap, start, end) span of the sequence lines and the string is made
+        the first time it is used (".fbin" spans are memoryviews).  Lines are
+        joined like FastaReader.readNextProtein does it: line ends and
+        trailing whitespace are removed, but not spaces inside a line.
+        """
+        if self._span is not None:
+            (data, start, end) = self._span
+            text = bytes(data[start:end])
+            joined = text.replace(b'\n', b'')
+            if joined.isascii() and (len(joined.translate(None, _WHITESPACE)) == len(joined)):
+                sequence = joined.decode('ascii')   # no spaces or CRs (the usual case)
+            else:
+                lines = text.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n').split('\n')
+                sequence = ''.join([line.rstrip() for line in lines])
+            self._sequence = sequence.upper()
+            self._span = None
+        return self._sequence
+
+    @sequence.setter
+    def sequence(self, value):
+        self._sequence = value
+        self._span = None
+
+    def set_span(self, data, start, end):
+        """Sets the sequence to the lines in data[start:end] (made when used).
+        """
+        self._sequence = None
+        self._span = (data, start, end)
+        return
+
+    def __getstate__(self):
+        """Copies and pickles get the sequence string (not the mmap span).
+        """
+        state = self.__dict__.copy()
+        if self._span is not None:
+            state['_sequence'] = self.sequence
+            state['_span'] = None
+        return state
+
     def readProtein(self, fasta_reader):
         """Gets the next FASTA protein entry from FastaReader object.
         Usage: Boolean = object.readProtein(fasta_reader),
@@ -312,29 +379,9 @@ class Protein:
         if file_obj == None:
             file_obj = sys.stdout
             
-        # print new accession and new descriptor on first line
-        if self.new_desc == '':
-            print('>'+self.new_acc, file=file_obj)
-        else:
-            print('>'+self.new_acc, self.new_desc, file=file_obj)
-        
-        # initialize some things
-        char_count = 0
-        char_line = ''
-        
-        # build up sequence line with "length" characters per line
-        for char in self.sequence:
-            if char_count < length:  # do not have "width" chars yet
-                char_line += char
-                char_count += 1
-            else:                   # line is "width" long so print and reset
-                print(char_line, file=file_obj)
-                char_line = char
-                char_count = 1
-        
-        # print last sequence line (often less than "width" long) and return
-        if len(char_line):
-            print(char_line, file=file_obj)
+        # the entry is formatted with string slices and written in one call
+        # (use a FastaWriter for buffered writing of many entries)
+        file_obj.write(FastaWriter.format_entry(self, length))
         return
 
     def parseNCBI(self, REF_SEQ_ONLY=False):
@@ -706,18 +753,41 @@ class Protein:
 
     # end class
 
+# amino acid characters that are accepted when checking for errors
+VALID_AA = 'XGASPVTCLIJNOBDQKZEMHFRYWU*-'
+_VALID_AA_BYTES = VALID_AA.encode('ascii')
+_WHITESPACE = bytes([c for c in range(128) if chr(c).isspace()])   # ASCII chars str.strip removes
+
+def invalid_chars(line):
+    """Returns the characters of "line" that are not in VALID_AA ('' if none).
+    The valid characters are deleted from the whole line with one
+    bytes.translate call, so a normal line costs about the same as a copy.
+    """
+    if line.isascii():
+        return line.encode('ascii').translate(None, _VALID_AA_BYTES).decode('ascii')
+    return ''.join([c for c in line if c not in VALID_AA])
+
 class FastaReader:
     """Reads FASTA entries from a file-like object.
     methods:
-    __init__: basic constructor, no parameters.    
+    __init__: basic constructor, "lazy" is optional (see below).
     readProtein: reads one FASTA entry from a file object (text or zipped)
         arguments are "next_protein" and "file_obj"
         returns True (next protein) or False (EOF or not FASTA).
+    If "lazy" is set and the file is not compressed, the file is memory
+    mapped and only the header lines are decoded.  Protein objects get the
+    byte span of their sequence lines and the sequence string is only made
+    if it is used (see Protein.sequence).  Header filters then skip all of
+    the sequence work for entries that are not kept.  Compressed files
+    (including BGZF) are read the normal way.
+    Binary ".fbin" databases (see write_fbin) are always read this way:
+    the headers come from the string pool and the sequences are spans of
+    the memory mapped residue bytes.
     written by Phil Wilmarth, OHSU, 2009.
     """
 
-    def __init__(self, fasta_file):
-        """Basic constructor function.  No parameters
+    def __init__(self, fasta_file, lazy=False):
+        """Basic constructor function.  "lazy" uses mmap sequence spans.
         self._last_line retains the previous '>' line and
         self._valid is a dictionary of valid protein FASTA chars.
         """
@@ -725,14 +795,13 @@ class FastaReader:
         self._last_line = 'start value'
         self._file_obj = None
         self._fasta_file = fasta_file
+        self._data = None   # memory mapped file in lazy mode
+        self._table = None  # ProteinTable of a ".fbin" file (_pos is the row)
+        self._pos = 0
+        self._text_bytes = 0
         
-        # list of valid amino acid characters
-        self._valid = {'X':True, 'G':True, 'A':True, 'S':True, 'P':True,
-                       'V':True, 'T':True, 'C':True, 'L':True, 'I':True,
-                       'J':True, 'N':True, 'O':True, 'B':True, 'D':True,
-                       'Q':True, 'K':True, 'Z':True, 'E':True, 'M':True,
-                       'H':True, 'F':True, 'R':True, 'Y':True, 'W':True,
-                       'U':True, '*':True, '-':True }
+        # valid amino acid characters (see VALID_AA and invalid_chars)
+        self._valid = dict.fromkeys(VALID_AA, True)
 
 ##        if not os.path.exists(fasta_file):
 ##            ext_list = [('FASTA files', '*.fasta'), 
@@ -744,6 +813,15 @@ class FastaReader:
         try:
             if fasta_file.endswith('.gz'):
                 self._file_obj = gzip.open(fasta_file, 'rt')
+            elif fasta_file.endswith('.fbin'):
+                self._table = ProteinTable.load(fasta_file)
+            elif lazy:
+                import mmap
+                with open(fasta_file, 'rb') as file_obj:
+                    if os.fstat(file_obj.fileno()).st_size:
+                        self._data = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+                    else:
+                        self._data = b''
             else :
                 self._file_obj = open(fasta_file, 'rt')
         except IOError:
@@ -757,11 +835,16 @@ class FastaReader:
         If "check_for_errs" flag is set, amino acid chars are checked.
         Written by Phil Wilmarth, OHSU, 2009.
         """
+        if self._data is not None:
+            return self._read_span(next_protein, check_for_errs)
+        if self._table is not None:
+            return self._read_row(next_protein, check_for_errs)
+
         # at first call, start reading lines
         if self._last_line == 'start value':
             self._last_line = self._file_obj.readline()
             if not self._last_line:
-                self._file_obj.close()
+                self._close()
                 return(False)
             self._last_line = self._last_line.strip()
         
@@ -775,14 +858,14 @@ class FastaReader:
         
         # return if empty line (EOF) or non-description line
         else:
-            self._file_obj.close()
+            self._close()
             return(False)                    
         
         # reset variables and read in next entry
-        next_protein.sequence = ""
+        sequence = []
         line = self._last_line
         self._last_line = ""
-        bad_char = {}
+        bad_char = set()
         while line:
             line = self._file_obj.readline()
             if not line:
@@ -795,37 +878,1449 @@ class FastaReader:
             # stop reading at next descriptor line (and save line)
             if line.startswith('>'):
                 self._last_line = line.strip()
-                
-                # report bad characters if conditions were met
-                bad_char = sorted(bad_char.keys())
-                if len(bad_char) > 0 and check_for_errs:
-                    print('   WARNING: unknown symbol(s) (%s) in %s' %
-                          (''.join(bad_char), next_protein.accession))
                 break
             
             # add next sequence line to protein's sequence
             else:
                 line = line.rstrip()
                 line = line.upper()
-                if check_for_errs: # checking chars slows down the program
-                    for char in line:
-                        if self._valid.get(char, False):
-                            next_protein.sequence += char
-                        else:
-                            bad_char[char] = True                
-                else: # blindly adding the line is faster...
-                    next_protein.sequence += line
+                if check_for_errs: # whole lines are checked with a translate table
+                    bad = invalid_chars(line)
+                    if bad:
+                        bad_char.update(bad)
+                        sequence.append(line.translate(str.maketrans('', '', bad)))
+                        continue
+                sequence.append(line)
+        next_protein.sequence = ''.join(sequence)
                     
+        # report bad characters if conditions were met
+        if bad_char and check_for_errs:
+            print('   WARNING: unknown symbol(s) (%s) in %s' %
+                  (''.join(sorted(bad_char)), next_protein.accession))
+
         # return (protein info retained in next_protein)
         return True
+
+    def _read_span(self, next_protein, check_for_errs):
+        """Lazy version of readNextProtein (memory mapped file).
+        Only the header line is decoded; the sequence is a byte span.
+        """
+        data = self._data
+        if self._last_line == 'start value':  # first line has to be a header
+            self._last_line = ''
+            end = data.find(b'\n')
+            if end < 0:
+                end = len(data)
+            if not data[:end].strip().startswith(b'>'):
+                self._pos = len(data)
+                return False
+            self._pos = data.find(b'>', 0, end)
+        start = self._pos
+        if data[start:start+1] != b'>':
+            return False
+
+        # get next protein's info from the header line
+        end = data.find(b'\n', start)
+        if end < 0:
+            end = len(data)
+        line = data[start:end].strip().decode('utf-8')
+        next_protein.accession = line.split()[0][1:]
+        next_protein.new_acc = next_protein.accession
+        next_protein.description = line[len(next_protein.accession)+2:]
+        next_protein.new_desc = next_protein.description
+
+        # sequence lines go up to the next header line
+        self._pos = data.find(b'\n>', end)
+        self._pos = len(data) if self._pos < 0 else self._pos + 1
+        next_protein.set_span(data, end, self._pos)
+        if check_for_errs:
+            self._check_sequence(next_protein)
+        return True
+
+    def _read_row(self, next_protein, check_for_errs):
+        """".fbin" version of readNextProtein (next row of the table).
+        """
+        table = self._table
+        i = self._pos
+        if i >= len(table._acc_ids):
+            return False
+        self._pos += 1
+        next_protein.accession = table._string(table._acc_ids[i])
+        next_protein.new_acc = next_protein.accession
+        next_protein.description = table._string(table._desc_ids[i])
+        next_protein.new_desc = next_protein.description
+        next_protein.set_span(table._seq, table._seq_offsets[i], table._seq_offsets[i+1])
+        if check_for_errs:
+            self._check_sequence(next_protein)
+        return True
+
+    def _check_sequence(self, next_protein):
+        """Removes (and reports) invalid characters in a lazy sequence.
+        """
+        bad = invalid_chars(next_protein.sequence)
+        if bad:
+            next_protein.sequence = next_protein.sequence.translate(str.maketrans('', '', bad))
+            print('   WARNING: unknown symbol(s) (%s) in %s' %
+                  (''.join(sorted(set(bad))), next_protein.accession))
+        return
+
+    def _close(self):
+        """Closes the file at EOF (saves the text position for progress).
+        """
+        try:
+            self._text_bytes = self._file_obj.buffer.tell()
+        except (AttributeError, ValueError, OSError):
+            pass
+        self._file_obj.close()
+        return
+
+    def progress(self):
+        """Returns (file bytes read, file size, text bytes read) for progress
+        reports.  For gzip files the first number is the compressed position.
+        Positions include read-ahead buffers, so they are approximate.
+        ".fbin" files give sequence byte positions.
+        """
+        if self._data is not None:
+            return (self._pos, len(self._data), self._pos)
+        if self._table is not None:
+            offsets = self._table._seq_offsets
+            return (offsets[self._pos], offsets[-1], offsets[self._pos])
+        size = os.path.getsize(self._fasta_file)
+        if self._file_obj.closed:   # files are closed at EOF
+            return (size, size, self._text_bytes)
+        buffer = self._file_obj.buffer
+        if isinstance(buffer, gzip.GzipFile):
+            (position, self._text_bytes) = (buffer.fileobj.tell(), buffer.tell())
+        else:
+            position = self._text_bytes = buffer.tell()
+        return (position, size, self._text_bytes)
+
+    def get_position(self):
+        """Returns the reader position between proteins (for checkpoints).
+        """
+        if self._data is not None or self._table is not None:
+            return (self._pos, self._last_line)
+        return (self._file_obj.tell(), self._last_line)
+
+    def set_position(self, position):
+        """Restarts reading at a position from "get_position".
+        """
+        (cookie, self._last_line) = position
+        if self._data is not None or self._table is not None:
+            self._pos = cookie
+        else:
+            self._file_obj.seek(cookie)
+        return
         
     # end class
 
+class FastaStreamParser:
+    """Push-style FASTA parser for data that arrives in pieces (downloads).
+    methods:
+    __init__: "handler" is called with each complete Protein object (the
+        same object is reused, like readNextProtein), "compressed" means the
+        pieces are gzip data, "check_for_errs" drops and reports unknown
+        amino acid characters like FastaReader does
+    feed: parses the next piece of data
+    close: finishes the last protein, returns the number of proteins
+    """
+    def __init__(self, handler, compressed=True, check_for_errs=False):
+        self._handler = handler
+        self._check_for_errs = check_for_errs
+        self._compressed = compressed
+        self._unzip = zlib.decompressobj(wbits=31) if compressed else None
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._partial = ''              # incomplete last line
+        self._protein = Protein()
+        self._sequence = []
+        self._bad_char = set()
+        self._in_protein = False
+        self.count = 0
+        return
+
+    def feed(self, data):
+        """Parses the next piece of (compressed) data.
+        """
+        if self._compressed:
+            text = b''
+            while data:
+                text += self._unzip.decompress(data)
+                if self._unzip.eof:     # gzip files can have several members
+                    data = self._unzip.unused_data
+                    self._unzip = zlib.decompressobj(wbits=31)
+                else:
+                    data = b''
+            data = text
+        lines = (self._partial + self._decoder.decode(data)).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+        return
+
+    def close(self):
+        """Finishes parsing, returns the number of proteins.
+        """
+        if self._compressed:
+            self.feed(self._unzip.flush())
+        self._partial += self._decoder.decode(b'', final=True)
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ''
+        self._finish()
+        return self.count
+
+    def _line(self, line):
+        """Adds one text line to the current protein.
+        """
+        line = line.strip()
+        if not line:
+            return
+        if line.startswith('>'):
+            self._finish()
+            p = self._protein
+            p.accession = line.split()[0][1:]
+            p.new_acc = p.accession
+            p.description = line[len(p.accession)+2:]
+            p.new_desc = p.description
+            self._in_protein = True
+        elif self._in_protein:
+            line = line.upper()
+            if self._check_for_errs:
+                bad = invalid_chars(line)
+                if bad:
+                    self._bad_char.update(bad)
+                    line = line.translate(str.maketrans('', '', bad))
+            self._sequence.append(line)
+        return
+
+    def _finish(self):
+        """Sends a completed protein to the handler.
+        """
+        if not self._in_protein:
+            return
+        p = self._protein
+        p.sequence = ''.join(self._sequence)
+        if self._bad_char:
+            print('   WARNING: unknown symbol(s) (%s) in %s' %
+                  (''.join(sorted(self._bad_char)), p.accession))
+        self._sequence = []
+        self._bad_char = set()
+        self._in_protein = False
+        self.count += 1
+        self._handler(p)
+        return
+
+    # end class
+
+class DigestSet:
+    """Set of short digests for finding repeated sequences or accessions.
+    Methods:
+        __init__: "digest_size" is the number of bytes kept per item
+        seen: returns True if the string was added before (adds it if not)
+    Memory is proportional to the number of different strings, but each
+    one only costs a 16 byte digest instead of the whole sequence.
+    """
+    def __init__(self, digest_size=16):
+        import hashlib
+        self._blake2b = hashlib.blake2b
+        self.digest_size = digest_size
+        self._digests = set()
+        return
+
+    def __len__(self):
+        return len(self._digests)
+
+    def seen(self, text):
+        """Returns True if "text" was seen before, else adds it.
+        """
+        digest = self._blake2b(text.encode('utf-8'), digest_size=self.digest_size).digest()
+        if digest in self._digests:
+            return True
+        self._digests.add(digest)
+        return False
+
+    # end class
+
+class ResidueStats:
+    """Residue class statistics for quality checks of protein sequences.
+    Methods:
+        __init__: "duplicates" also counts repeated sequences (DigestSet);
+            "composition" also counts every amino acid character
+        add: counts one sequence, returns the sequence (without any invalid
+            characters) and the set of invalid characters
+        composition_counts: returns dictionary of residue counts
+    Counts are in the "counts" dictionary (keys in ResidueStats.COUNTS).
+    The 20 standard residues are deleted with one bytes.translate call,
+    so most sequences need no more work.  Only the few characters that
+    are left are tested for stops, gaps, B, J, O, U, X, Z, and characters
+    that are not amino acids.  Composition counts use numpy.bincount on
+    large blocks of sequence bytes (or bytes.count without numpy).
+    """
+    COUNTS = ['prot_count', 'duplicate_count', 'no_start_met_count', 'stop_end_count', 'stop_count',
+              'gap_count', 'B_count', 'J_count', 'O_count', 'U_count', 'X_count', 'Z_count']
+    STANDARD = 'ACDEFGHIKLMNPQRSTVWY'
+    VALID = STANDARD + 'BJOUXZ*-'   # same as FastaReader
+    _flags = [('*', 'stop_count'), ('-', 'gap_count'), ('B', 'B_count'), ('J', 'J_count'),
+              ('O', 'O_count'), ('U', 'U_count'), ('X', 'X_count'), ('Z', 'Z_count')]
+
+    def __init__(self, duplicates=True, composition=False):
+        self.counts = dict.fromkeys(self.COUNTS, 0)
+        self._standard_bytes = self.STANDARD.encode('ascii')
+        self._standard = set(self.STANDARD)
+        self._valid = set(self.VALID)
+        self._digests = DigestSet() if duplicates else None
+        self._composition = dict.fromkeys(self.VALID, 0) if composition else None
+        self._block = []
+        self._block_size = 0
+        self._numpy = None
+        if composition:
+            try:
+                import numpy
+                self._numpy = numpy
+            except ImportError:
+                pass
+        return
+
+    def add(self, sequence):
+        """Counts one (upper case) sequence.
+        Returns (sequence, invalid), where "invalid" is a set of characters
+        that are not amino acids; they are removed from "sequence".
+        """
+        counts = self.counts
+        counts['prot_count'] += 1
+        if sequence.isascii():
+            left = sequence.encode('ascii').translate(None, self._standard_bytes).decode('ascii')
+        else:
+            left = ''.join([c for c in sequence if c not in self._standard])
+        invalid = set()
+        if left:
+            invalid = set(left) - self._valid
+            if invalid:
+                sequence = ''.join([c for c in sequence if c in self._valid])
+                left = ''.join([c for c in left if c in self._valid])
+            for (char, name) in self._flags:
+                if char in left:
+                    counts[name] += 1
+        if not sequence.startswith('M'):
+            counts['no_start_met_count'] += 1
+        if sequence.endswith('*'):
+            counts['stop_end_count'] += 1
+        if self._digests is not None and self._digests.seen(sequence):
+            counts['duplicate_count'] += 1
+        if self._composition is not None:
+            self._block.append(sequence.encode('ascii'))
+            self._block_size += len(sequence)
+            if self._block_size >= 16777216:
+                self._count_block()
+        return sequence, invalid
+
+    def _count_block(self):
+        """Adds the saved sequence bytes to the composition counts.
+        """
+        block = b''.join(self._block)
+        self._block = []
+        self._block_size = 0
+        if self._numpy:
+            hist = self._numpy.bincount(self._numpy.frombuffer(block, dtype=self._numpy.uint8), minlength=256)
+            for char in self._composition:
+                self._composition[char] += int(hist[ord(char)])
+        else:
+            for char in self._composition:
+                self._composition[char] += block.count(char.encode('ascii'))
+        return
+
+    def composition_counts(self):
+        """Returns dictionary of amino acid character counts.
+        """
+        if self._composition is None:
+            return {}
+        self._count_block()
+        return dict(self._composition)
+
+    # end class
+
+class FastaWriter:
+    """Buffered writing of Protein objects in FASTA format.
+    Methods:
+        __init__: "output" is an open text file object or a file name
+            (names ending in ".gz" are gzip compressed); "length" is the
+            number of sequence characters per line (0 for no line wrapping);
+            "buffer_size" is the number of characters saved up per write
+        format_entry: (static) returns the FASTA text for a Protein
+        write: adds a Protein entry to the buffer
+        write_text: adds already formatted FASTA text to the buffer
+        flush: writes any buffered text to the file
+        close: flushes, closes the file if it was opened here, returns
+            the number of entries written
+    Lines are cut with string slices and many entries are joined into
+    each file write, instead of building lines one character at a time.
+    """
+    def __init__(self, output, length=80, buffer_size=1048576, compresslevel=6):
+        if isinstance(output, str):
+            if output.lower().endswith('.gz'):
+                self.file_obj = gzip.open(output, 'wt', compresslevel=compresslevel)
+            else:
+                self.file_obj = open(output, 'w')
+            self._owner = True
+        else:
+            self.file_obj = output
+            self._owner = False
+        self.length = length
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._buffer = []
+        self._size = 0
+        return
+
+    @staticmethod
+    def format_entry(prot, length=80):
+        """Returns FASTA text (header and wrapped sequence lines) for "prot".
+        """
+        if prot.new_desc == '':
+            header = '>' + prot.new_acc + '\n'
+        else:
+            header = '>' + prot.new_acc + ' ' + prot.new_desc + '\n'
+        sequence = prot.sequence
+        if not sequence:
+            return header
+        if (length > 0) and (len(sequence) > length):
+            sequence = '\n'.join([sequence[i:i+length] for i in range(0, len(sequence), length)])
+        return header + sequence + '\n'
+
+    def write(self, prot):
+        """Adds Protein "prot" to the buffer.
+        """
+        self.write_text(self.format_entry(prot, self.length))
+        return
+
+    def write_text(self, text):
+        """Adds FASTA entry text to the buffer.
+        """
+        self._buffer.append(text)
+        self._size += len(text)
+        self.count += 1
+        if self._size >= self.buffer_size:
+            self.flush()
+        return
+
+    def flush(self):
+        """Writes the buffered text.
+        """
+        if self._buffer:
+            self.file_obj.write(''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+        return
+
+    def close(self):
+        """Flushes and closes (if opened here), returns entry count.
+        """
+        self.flush()
+        if self._owner:
+            self.file_obj.close()
+        return self.count
+
+    # end class
+
+class TargetDecoyWriter:
+    """Writes the target and decoy databases in a single pass.
+    Methods:
+        __init__: "base_name" is the output path without the extension;
+            "forward", "reverse", and "both" select the "_for.fasta",
+            "_rev.fasta", and concatenated "_both.fasta" files; if
+            "interleave" is set, each decoy follows its target in the
+            "_both" file (only for search engines that allow that order)
+        write: writes a target Protein and its decoy Protein
+        close: finishes the files and returns list of file names
+    Targets go straight into the "_both" file and decoys are appended at
+    the end from the "_rev" file (if it is wanted) or from a temporary
+    spool file in the output folder.  Only the requested files are made
+    and nothing is read back line by line.  Each entry is formatted once
+    and buffered by FastaWriter objects.
+    """
+    def __init__(self, base_name, forward=False, reverse=False, both=True, interleave=False):
+        import tempfile
+        self.for_name = base_name + '_for.fasta'
+        self.rev_name = base_name + '_rev.fasta'
+        self.both_name = base_name + '_both.fasta'
+        self.interleave = both and interleave
+        self.for_obj = FastaWriter(self.for_name) if forward else None
+        self.rev_obj = FastaWriter(self.rev_name) if reverse else None
+        self.both_obj = FastaWriter(self.both_name) if both else None
+        self.spool = None
+        if both and not (reverse or self.interleave):
+            self.spool = FastaWriter(tempfile.TemporaryFile('w+', dir=os.path.dirname(os.path.abspath(base_name)),
+                                                            prefix='.decoys_', suffix='.fasta'))
+        self.targets = [f for f in (self.for_obj, self.both_obj) if f]
+        self.decoys = [f for f in (self.rev_obj, self.spool) if f]
+        return
+
+    def write(self, prot, rev):
+        """Writes target "prot" and decoy "rev" to the open files.
+        """
+        target = FastaWriter.format_entry(prot)
+        decoy = FastaWriter.format_entry(rev)
+        if self.interleave:
+            self.both_obj.write_text(target)
+            self.both_obj.write_text(decoy)
+            if self.for_obj:
+                self.for_obj.write_text(target)
+        else:
+            for writer in self.targets:
+                writer.write_text(target)
+        for writer in self.decoys:
+            writer.write_text(decoy)
+        return
+
+    def close(self):
+        """Appends the decoys to the "_both" file, closes everything.
+        Returns list of the file names that were written.
+        """
+        import shutil
+        names = []
+        if self.for_obj:
+            self.for_obj.close()
+            names.append(self.for_name)
+        if self.rev_obj:
+            self.rev_obj.close()
+            names.append(self.rev_name)
+        if self.both_obj:
+            self.both_obj.flush()
+            if self.spool:
+                self.spool.flush()
+                self.spool.file_obj.seek(0)
+                shutil.copyfileobj(self.spool.file_obj, self.both_obj.file_obj, 1048576)
+                self.spool.file_obj.close()
+            elif not self.interleave:
+                with open(self.rev_name, 'r') as rev_obj:
+                    shutil.copyfileobj(rev_obj, self.both_obj.file_obj, 1048576)
+            self.both_obj.close()
+            names.append(self.both_name)
+        return names
+
+    # end class
+
+class ProteinTable:
+    """Column storage for a whole protein database.
+    Methods:
+        __init__: makes an empty table; if "intern" is set, identical
+            descriptions are only stored once
+        from_fasta: (class method) reads a FASTA file into a new table
+        append: adds the accession, description, and sequence of a Protein
+        accession, description, sequence: return the strings of a row
+        lengths: returns the sequence length column (array)
+        molwts: returns the average MW column (array, same masses as
+            molwtProtein), computed once and then cached
+        accession_index: returns the accession hash index (array)
+        find: returns the first row number of an accession (or None)
+        find_all: returns all of the row numbers of an accession
+        filter: returns a new table of the rows where function(Protein) is True
+        select: returns a new table of the rows in a list of row numbers
+        save: writes the table to a binary ".fbin" database file
+        load: (class method) memory maps a ".fbin" file (read only)
+        close: releases the memory map of a loaded table
+    len(table), table[i] (a new Protein), table[i:j] (a new table), and
+    iteration (new Protein objects) also work.  All sequences are in one
+    byte buffer with an array of start offsets, and the accessions and
+    descriptions are in one text pool with another offset array.  There
+    are no Python objects per protein, so a 20 million entry database
+    takes about the size of its FASTA file.  Loaded tables use the file
+    pages directly (arrays are memoryview casts of the mmap), so loading
+    is quick and only the rows that are used are ever read.  Table files
+    use the native byte order and are checked when loaded.
+
+    ".fbin" file layout (all sections are 8 byte aligned):
+        header: magic, byte order check, rows, strings, sequence bytes,
+            text bytes, index slots, (reserved)
+        sequence offsets (rows + 1), text offsets (strings + 1),
+        accession and description string numbers (rows each),
+        lengths (rows), average MWs (rows, doubles),
+        accession index (slots), text pool (UTF-8), sequences (one byte
+        per residue)
+    Residues are kept as their one byte letters rather than packed into 5
+    bits: unpacking in Python would cost more than reading the bytes, and
+    byte sequences can be used straight from the memory map.  The index is
+    an open addressing hash table (linear probing, CRC-32 of the key) of
+    row numbers + 1 (0 is an empty slot) with every accession key (see
+    accession_keys) of every header, so "find" only reads a couple of rows.
+    """
+    MAGIC = b'FUFBIN01'
+    HEADER = '=8s7q'    # magic, byte order check, rows, strings, seq bytes, text bytes, index slots, reserved
+    ORDER_CHECK = 0x0102030405060708
+
+    def __init__(self, intern=True):
+        import array
+        self._seq = bytearray()
+        self._seq_offsets = array.array('q', [0])
+        self._text = bytearray()
+        self._text_offsets = array.array('q', [0])
+        self._acc_ids = array.array('q')
+        self._desc_ids = array.array('q')
+        self._interned = {} if intern else None
+        self._lengths = None
+        self._molwts = None
+        self._index = None
+        self._mmap = None
+        self._views = []
+        return
+
+    @classmethod
+    def from_fasta(cls, fasta_file, check_for_errs=False, intern=True):
+        """Returns a new table of all of the proteins in "fasta_file".
+        """
+        table = cls(intern)
+        f = FastaReader(fasta_file)
+        p = Protein()
+        while f.readNextProtein(p, check_for_errs=check_for_errs):
+            table.append(p)
+        return table
+
+    def _add_text(self, text, intern):
+        """Adds a string to the text pool, returns its number.
+        """
+        if intern:
+            text_id = self._interned.get(text)
+            if text_id is not None:
+                return text_id
+        text_id = len(self._text_offsets) - 1
+        self._text += text.encode('utf-8')
+        self._text_offsets.append(len(self._text))
+        if intern:
+            self._interned[text] = text_id
+        return text_id
+
+    def append(self, prot):
+        """Adds the accession, description, and sequence of Protein "prot".
+        """
+        if self._mmap is not None:
+            raise ValueError('loaded protein tables are read only')
+        self._acc_ids.append(self._add_text(prot.accession, False))
+        self._desc_ids.append(self._add_text(prot.description, self._interned is not None))
+        self._seq += prot.sequence.encode('utf-8')
+        self._seq_offsets.append(len(self._seq))
+        self._lengths = None
+        self._molwts = None
+        self._index = None
+        return
+
+    def __len__(self):
+        return len(self._acc_ids)
+
+    def _row(self, i):
+        """Checks row number "i" (negative counts from the end).
+        """
+        rows = len(self._acc_ids)
+        if i < 0:
+            i += rows
+        if not 0 <= i < rows:
+            raise IndexError('protein table row out of range')
+        return i
+
+    def _string(self, text_id):
+        return str(self._text[self._text_offsets[text_id]:self._text_offsets[text_id+1]], 'utf-8')
+
+    def accession(self, i):
+        """Returns the accession of row "i".
+        """
+        return self._string(self._acc_ids[self._row(i)])
+
+    def description(self, i):
+        """Returns the description of row "i".
+        """
+        return self._string(self._desc_ids[self._row(i)])
+
+    def sequence(self, i):
+        """Returns the sequence of row "i".
+        """
+        i = self._row(i)
+        return bytes(self._seq[self._seq_offsets[i]:self._seq_offsets[i+1]]).decode('utf-8')
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.select(range(*key.indices(len(self))))
+        i = self._row(key)
+        p = Protein()
+        p.accession = p.new_acc = self._string(self._acc_ids[i])
+        p.description = p.new_desc = self._string(self._desc_ids[i])
+        p.sequence = bytes(self._seq[self._seq_offsets[i]:self._seq_offsets[i+1]]).decode('utf-8')
+        return p
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def lengths(self):
+        """Returns the sequence length column (cached array).
+        """
+        if self._lengths is None:
+            import array
+            import operator
+            offsets = self._seq_offsets
+            self._lengths = array.array('q', map(operator.sub, offsets[1:], offsets[:-1]))
+        return self._lengths
+
+    def molwts(self):
+        """Returns the average MW column (cached array).
+        Residues are counted with bytes.count (or numpy in blocks of rows),
+        so the values can differ from molwtProtein in the last digits.
+        """
+        if self._molwts is not None:
+            return self._molwts
+        import array
+        p = Protein()
+        p.setMasses()
+        masses = [(ord(aa), mass) for (aa, mass) in p.ave_masses.items() if len(aa) == 1 and mass]
+        start_mass = 18.01 + 1.007825
+        offsets = self._seq_offsets
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is None:
+            molwts = array.array('d')
+            seq = self._seq
+            for i in range(len(self)):
+                residues = bytes(seq[offsets[i]:offsets[i+1]])
+                molwts.append(start_mass + sum([mass * residues.count(aa) for (aa, mass) in masses]))
+        else:
+            lookup = np.zeros(256)
+            for (aa, mass) in masses:
+                lookup[aa] = mass
+            starts = np.frombuffer(offsets, dtype=np.int64)
+            seq = np.frombuffer(self._seq, dtype=np.uint8)
+            molwts = array.array('d', bytes(8 * len(self)))
+            values = np.frombuffer(molwts, dtype=np.float64)
+            first = 0
+            while first < len(self):    # about 4 million residues at a time
+                last = int(np.searchsorted(starts, starts[first] + 4194304, side='right')) - 1
+                last = min(max(last, first + 1), len(self))
+                rows = np.repeat(np.arange(last - first), np.diff(starts[first:last+1]))
+                sums = np.bincount(rows, lookup[seq[starts[first]:starts[last]]], last - first)
+                values[first:last] = start_mass + sums
+                first = last
+        self._molwts = molwts
+        return molwts
+
+    def _row_keys(self, i):
+        """Returns the accession keys of all of the headers of row "i".
+        """
+        keys = set()
+        line = self._string(self._acc_ids[i]) + ' ' + self._string(self._desc_ids[i])
+        for header in line.split(chr(1)):
+            if header.strip():
+                keys.update(accession_keys(header.split()[0]))
+        return keys
+
+    def accession_index(self):
+        """Returns the accession hash index (cached array, see find).
+        """
+        if self._index is not None:
+            return self._index
+        import array
+        hashes = array.array('I')
+        rows = array.array('q')
+        for i in range(len(self)):
+            for key in self._row_keys(i):
+                hashes.append(zlib.crc32(key.encode('utf-8')))
+                rows.append(i + 1)
+        slots = 8
+        while slots < 2 * len(hashes):  # at most half full
+            slots *= 2
+        mask = slots - 1
+        index = array.array('q', bytes(8 * slots))
+        for (key_hash, row) in zip(hashes, rows):
+            slot = key_hash & mask
+            while index[slot]:
+                slot = (slot + 1) & mask
+            index[slot] = row
+        self._index = index
+        return index
+
+    def find(self, accession):
+        """Returns the first row number with "accession" (any key of any
+        header, like FastaIndex.lookup) or None.
+        """
+        rows = self.find_all(accession)
+        return rows[0] if rows else None
+
+    def find_all(self, accession):
+        """Returns the sorted list of every row number with "accession"
+        (keys like "NAME_SPECIES" or versionless NCBI accessions can be in
+        several rows, like FastaIndex.lookup_all).
+        """
+        index = self.accession_index()
+        mask = len(index) - 1
+        slot = zlib.crc32(accession.encode('utf-8')) & mask
+        rows = set()    # (other keys of a row can be in the same probe chain)
+        while index[slot]:
+            row = index[slot] - 1
+            if (row not in rows) and (accession in self._row_keys(row)):
+                rows.add(row)
+            slot = (slot + 1) & mask
+        return sorted(rows)
+
+    def select(self, rows):
+        """Returns a new table of the rows in "rows" (list of row numbers).
+        """
+        table = ProteinTable(self._interned is not None)
+        for i in rows:
+            table.append(self[i])
+        return table
+
+    def filter(self, function):
+        """Returns a new table of the rows where "function(protein)" is True.
+        """
+        table = ProteinTable(self._interned is not None)
+        for p in self:
+            if function(p):
+                table.append(p)
+        return table
+
+    def save(self, file_name):
+        """Writes the table to "file_name" (a ".fbin" database).  The length
+        and MW columns and the accession index are made if needed.
+        """
+        import struct
+        rows = len(self)
+        strings = len(self._text_offsets) - 1
+        index = self.accession_index()
+        with open(file_name, 'wb') as f:
+            f.write(struct.pack(self.HEADER, self.MAGIC, self.ORDER_CHECK, rows, strings,
+                                len(self._seq), len(self._text), len(index), 0))
+            for column in (self._seq_offsets, self._text_offsets, self._acc_ids, self._desc_ids,
+                           self.lengths(), self.molwts(), index):
+                f.write(column)
+            f.write(self._text)
+            f.write(bytes(-len(self._text) % 8))    # keeps the sections 8 byte aligned
+            f.write(self._seq)
+        return
+
+    @classmethod
+    def load(cls, file_name):
+        """Memory maps a ".fbin" file written by "save", returns the table.
+        """
+        import mmap
+        import struct
+        with open(file_name, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < struct.calcsize(cls.HEADER):
+                raise ValueError('%s is not a .fbin protein database' % file_name)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, check, rows, strings, seq_bytes, text_bytes, slots, reserved) = struct.unpack_from(cls.HEADER, mm)
+        if magic != cls.MAGIC or check != cls.ORDER_CHECK:
+            mm.close()
+            raise ValueError('%s is not a .fbin protein database (or has a different byte order)' % file_name)
+        table = cls(intern=False)
+        view = memoryview(mm)
+        table._views.append(view)
+        position = struct.calcsize(cls.HEADER)
+
+        def section(size, fmt=None):
+            nonlocal position
+            part = view[position:position+size]
+            position += size
+            if fmt:
+                part = part.cast(fmt)
+            table._views.append(part)
+            return part
+
+        table._seq_offsets = section(8 * (rows + 1), 'q')
+        table._text_offsets = section(8 * (strings + 1), 'q')
+        table._acc_ids = section(8 * rows, 'q')
+        table._desc_ids = section(8 * rows, 'q')
+        table._lengths = section(8 * rows, 'q')
+        table._molwts = section(8 * rows, 'd')
+        table._index = section(8 * slots, 'q')
+        table._text = section(text_bytes)
+        section(-text_bytes % 8)
+        table._seq = section(seq_bytes)
+        table._mmap = mm
+        return table
+
+    def close(self):
+        """Releases the memory map of a loaded table.
+        """
+        if self._mmap is not None:
+            self._lengths = self._molwts = self._index = None
+            for view in reversed(self._views):
+                view.release()
+            self._views = []
+            self._mmap.close()
+            self._mmap = None
+        return
+
+    # end class
+
+def write_fbin(fasta_file, fbin_file=None, check_for_errs=False):
+    """Converts a FASTA file (can be ".gz") to a binary ".fbin" database.
+    The default "fbin_file" is the FASTA file name with a ".fbin" extension.
+    The whole database is held in memory while it is converted (about the
+    size of the FASTA text).  Returns the ".fbin" file name.
+    """
+    if fbin_file is None:
+        base_name = fasta_file[:-3] if fasta_file.endswith('.gz') else fasta_file
+        fbin_file = os.path.splitext(base_name)[0] + '.fbin'
+    table = ProteinTable.from_fasta(fasta_file, check_for_errs=check_for_errs, intern=False)
+    table.save(fbin_file + '.tmp')
+    os.replace(fbin_file + '.tmp', fbin_file)
+    return fbin_file
+
+def read_headers(fasta_file, block_size=4194304, offset=0, with_offsets=False):
+    """Generator of FASTA header lines (without the leading ">").
+    Reads raw (decompressed if ".gz") byte blocks and only decodes the
+    header lines, so sequence lines are never split or decoded.  Much
+    faster than FastaReader or "readline" loops for passes that only need
+    accessions and descriptions.  Trailing whitespace is removed.
+    "offset" is a (decompressed) byte position of a ">" to start from.  If
+    "with_offsets" is set, (offset, header) tuples are generated instead;
+    saved offsets can be used to restart a pass (see Checkpoint).
+    For ".fbin" files the offsets are row numbers.
+    """
+    if fasta_file.endswith('.fbin'):
+        table = ProteinTable.load(fasta_file)
+        try:
+            for i in range(offset, len(table)):
+                header = (table.accession(i) + ' ' + table.description(i)).rstrip()
+                if with_offsets:
+                    yield (i, header)
+                else:
+                    yield header
+        finally:
+            table.close()
+        return
+    if fasta_file.endswith('.gz'):
+        file_obj = gzip.open(fasta_file, 'rb')
+    else:
+        file_obj = open(fasta_file, 'rb')
+    with file_obj:
+        if offset:
+            file_obj.seek(offset)
+        buff = b'\n'    # a first ">" is treated like one after a newline
+        buff_start = offset - 1 # file position of buff[0]
+        while True:
+            block = file_obj.read(block_size)
+            if not block:
+                break
+            buff += block
+            pos = 0
+            while True:
+                start = buff.find(b'\n>', pos)
+                if start == -1:
+                    buff_start += len(buff) - 1
+                    buff = buff[-1:]    # newline might be before a ">" in the next block
+                    break
+                end = buff.find(b'\n', start + 2)
+                if end == -1:
+                    buff_start += start
+                    buff = buff[start:] # header continues in the next block
+                    break
+                header = buff[start+2:end].rstrip().decode('utf-8', 'replace')
+                if with_offsets:
+                    yield (buff_start + start + 1, header)
+                else:
+                    yield header
+                pos = end
+        if buff.startswith(b'\n>'):     # last line without a newline
+            header = buff[2:].rstrip().decode('utf-8', 'replace')
+            if with_offsets:
+                yield (buff_start + 1, header)
+            else:
+                yield header
+    return
+
+# header accession fields that are database tags rather than identifiers
+_ACCESSION_TAGS = {'gi', 'ref', 'sp', 'tr', 'gb', 'emb', 'dbj', 'pir', 'prf',
+                   'pdb', 'tpg', 'tpe', 'tpd', 'lcl', 'gnl'}
+
+def accession_keys(accession):
+    """Returns the set of lookup keys for one header accession string.
+    UniProt accessions like "sp|P12345|NAME_SPECIES" give the full string,
+    "P12345", and "NAME_SPECIES".  NCBI accessions ("WP_012345.1" or older
+    "gi|123|ref|NP_001.2|" forms) also give the versionless accessions.
+    """
+    keys = {accession}
+    for part in accession.split('|'):
+        if part and part not in _ACCESSION_TAGS:
+            keys.add(part)
+            keys.add(part.split('.')[0])
+    return keys
+
+class ExtractionQuery:
+    """One subset database to make during a single-pass extraction.
+    Header criteria ("strings", "accessions", "taxa") are OR'ed together
+    and are tested against each header of compound (chr(1)) nr header lines.
+    Only the matching headers are kept in the output entry.  Length and
+    molecular weight limits are AND'ed with the header criteria at the
+    protein level.  A query with only limits keeps the whole header line.
+    """
+    def __init__(self, name, strings=None, accessions=None, taxa=None,
+                 min_length=None, max_length=None, min_mw=None, max_mw=None,
+                 case_sensitive=True):
+        self.name = name
+        self.case_sensitive = case_sensitive
+        self.strings = list(strings or [])
+        if not case_sensitive:
+            self.strings = [x.upper() for x in self.strings]
+        self.accessions = set(accessions or [])
+        self.taxa = set(taxa or [])
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_mw = min_mw
+        self.max_mw = max_mw
+        self.count = 0      # number of proteins written for this query
+        return
+
+    def has_header_criteria(self):
+        """True if the query tests header lines."""
+        return bool(self.strings or self.accessions or self.taxa)
+
+    def has_limits(self):
+        """True if the query has any length or MW limits."""
+        return any(x is not None for x in (self.min_length, self.max_length,
+                                           self.min_mw, self.max_mw))
     
+    def needs_mw(self):
+        """True if the query has MW limits."""
+        return (self.min_mw is not None) or (self.max_mw is not None)
+
+    # end class
+
+class MultiExtractor:
+    """Evaluates many ExtractionQuery objects in one pass over a FASTA file.
+    Methods:
+        __init__: takes the query list and an optional "taxon_lookup"
+            function (header string -> taxon number) for taxon queries.
+        match: returns (query, header) pairs for one Protein object.
+        extract: reads a FASTA file once and writes all query subsets.
+    Each query is compiled into the minimal set of per-protein work: MW is
+    only computed if some query has MW limits, compound headers are only
+    split if some query tests headers, and accession keys, uppercase
+    headers, and taxon lookups are only made (once per header) if needed.
+    """
+    def __init__(self, queries, taxon_lookup=None):
+        self.queries = list(queries)
+        self.taxon_lookup = taxon_lookup
+        self._limited = [q.has_limits() for q in self.queries]
+        self._need_mw = any(q.needs_mw() for q in self.queries)
+        self._need_upper = any(q.strings and not q.case_sensitive for q in self.queries)
+        self._need_keys = any(q.accessions for q in self.queries)
+        self._need_taxon = any(q.taxa for q in self.queries)
+        if self._need_taxon and taxon_lookup is None:
+            raise ValueError('taxon queries need a "taxon_lookup" function')
+        return
+
+    def match(self, prot):
+        """Returns list of (query, header) pairs for "prot".
+        "header" is the accession/description text to write (compound
+        headers are rejoined with chr(1)).  Empty list if nothing matched.
+        """
+        # protein-level limits are the cheapest tests so do them first
+        length = len(prot.sequence)
+        molwt = None
+        active = []
+        for query, limited in zip(self.queries, self._limited):
+            if limited:
+                if query.min_length is not None and length < query.min_length:
+                    continue
+                if query.max_length is not None and length > query.max_length:
+                    continue
+                if query.needs_mw():
+                    if molwt is None:
+                        molwt = prot.molwtProtein(show_errs=False)
+                    if query.min_mw is not None and molwt < query.min_mw:
+                        continue
+                    if query.max_mw is not None and molwt > query.max_mw:
+                        continue
+            active.append(query)
+        if not active:
+            return []
+
+        # queries without header criteria get the whole line
+        line = prot.accession + ' ' + prot.description
+        matches = {}
+        header_queries = []
+        for query in active:
+            if query.has_header_criteria():
+                header_queries.append(query)
+            else:
+                matches[query] = [line]
+        
+        # test each header of compound lines against remaining queries
+        if header_queries:
+            for header in line.split(chr(1)):
+                if not header.strip():
+                    continue    # blank header line or empty chr(1) segment
+                upper = header.upper() if self._need_upper else None
+                keys = None
+                taxon = None
+                for query in header_queries:
+                    found = False
+                    if query.strings:
+                        text = header if query.case_sensitive else upper
+                        for pattern in query.strings:
+                            if pattern in text:
+                                found = True
+                                break
+                    if not found and query.accessions:
+                        if keys is None:
+                            keys = accession_keys(header.split()[0])
+                        found = not query.accessions.isdisjoint(keys)
+                    if not found and query.taxa:
+                        if taxon is None:
+                            taxon = self.taxon_lookup(header)
+                        found = taxon in query.taxa
+                    if found:
+                        try:
+                            matches[query].append(header)
+                        except KeyError:
+                            matches[query] = [header]
+        
+        # keep the query order in the results
+        return [(q, chr(1).join(matches[q])) for q in self.queries if q in matches]
+
+    def extract(self, fasta_file, out_files, clean_accessions=False,
+                ref_seq_only=False, keep_uniprot_id=False, metrics=None):
+        """Reads "fasta_file" once and writes matches for every query.
+        "out_files" is a dictionary of query name to open file objects.
+        "metrics" is an optional RunMetrics object for progress and rates.
+        Returns the number of proteins read.
+        """
+        f = fasta_lib.FastaReader(fasta_file)
+        prot = fasta_lib.Protein()
+        prot_read = 0
+        if metrics is None:
+            metrics = RunMetrics('MultiExtractor')
+        metrics.start_stage(os.path.basename(fasta_file), f)
+        while f.readNextProtein(prot, check_for_errs=False):
+            prot_read += 1
+            if (prot_read % 500000) == 0:
+                metrics.progress(prot_read)
+            for query, header in self.match(prot):
+                query.count += 1
+                metrics.add('records_written')
+                prot.new_acc = header.split()[0] if header.strip() else ''
+                prot.new_desc = header[(len(prot.new_acc)+1):]
+                if clean_accessions:
+                    saved = (prot.accession, prot.description)
+                    prot.accession, prot.description = prot.new_acc, prot.new_desc
+                    if prot.accession.startswith('gi|'):
+                        prot.parseNCBI(ref_seq_only)
+                    elif prot.accession.startswith('sp|') or prot.accession.startswith('tr|'):
+                        prot.parseUniProt(keep_uniprot_id)
+                    prot.accession, prot.description = saved
+                prot.printProtein(out_files[query.name])
+        metrics.end_stage(prot_read)
+        return prot_read
+
+    # end class
+
+class FastaIndex:
+    """Persistent accession -> (offset, length) index for an uncompressed FASTA file.
+    Methods:
+        __init__: opens (or builds) the SQLite index file next to "fasta_file"
+        lookup(acc): returns (offset, length) of the first entry or None
+        lookup_all(acc): returns (offset, length) of every entry (file order)
+        read_entry(offset, length): returns the raw FASTA entry text
+        read_protein(offset, length): returns the entry as a Protein
+        close: closes the index and FASTA file
+    Every accession key of every header (see accession_keys) is indexed, so
+    UniProt "sp|P12345|NAME_SPECIES" entries can be found by any part and
+    compound nr entries by any of their (versioned or versionless)
+    accessions.  Keys can be shared by several entries (isoforms with the
+    same NAME_SPECIES, versionless NCBI accessions).  The index is rebuilt
+    if the FASTA file size or time (or the index format) changes.
+    """
+    VERSION = 2     # 2: keys are not unique (every entry is indexed)
+
+    def __init__(self, fasta_file, rebuild=False):
+        if fasta_file.endswith('.gz'):
+            raise ValueError('FASTA index needs an uncompressed file')
+        self.fasta_file = fasta_file
+        self.index_file = fasta_file + '.acc_index.sq3'
+        stat = os.stat(fasta_file)
+        self._stamp = '%s:%s:%s' % (stat.st_size, int(stat.st_mtime), self.VERSION)
+        self.conn = sqlite3.connect(self.index_file)
+        if rebuild or not self._is_current():
+            self._build()
+        self._file_obj = open(fasta_file, 'rb')
+        return
+
+    def _is_current(self):
+        """Checks if the saved index matches the FASTA file.
+        """
+        try:
+            c = self.conn.execute("SELECT value FROM meta WHERE key='stamp'")
+            row = c.fetchone()
+        except sqlite3.OperationalError:    # new or incomplete index file
+            return False
+        return (row is not None) and (row[0] == self._stamp)
+
+    def _build(self):
+        """Scans the FASTA file once and saves all header accession offsets.
+        """
+        print('...making accession index for %s...' % (os.path.basename(self.fasta_file),))
+        c = self.conn.cursor()
+        c.execute('DROP TABLE IF EXISTS meta')
+        c.execute('DROP TABLE IF EXISTS acc_index')
+        c.execute('CREATE TABLE meta(key text PRIMARY KEY NOT NULL, value text)')
+        c.execute('''CREATE TABLE acc_index(
+                        acc text NOT NULL,
+                        offset integer NOT NULL,
+                        length integer NOT NULL)''')
+
+        def save(line, start, end):
+            keys = set()
+            for header in line[1:].decode('utf-8', 'replace').split(chr(1)):
+                if header.strip():
+                    keys.update(accession_keys(header.split()[0]))
+            c.executemany('INSERT INTO acc_index (acc, offset, length) VALUES (?, ?, ?)',
+                          [(key, start, end - start) for key in keys])
+
+        prot_count = 0
+        offset = 0
+        start, header = None, None
+        with open(self.fasta_file, 'rb') as fasta:
+            for line in fasta:
+                if line.startswith(b'>'):
+                    if header is not None:
+                        save(header, start, offset)
+                    start, header = offset, line.rstrip()
+                    prot_count += 1
+                    if (prot_count % 1000000) == 0:
+                        print('......(%s proteins indexed)' % ("{0:,d}".format(prot_count),))
+                offset += len(line)
+            if header is not None:
+                save(header, start, offset)
+        c.execute('CREATE INDEX acc_index_acc ON acc_index (acc, offset)')
+        c.execute("INSERT INTO meta (key, value) VALUES ('stamp', ?)", (self._stamp,))
+        self.conn.commit()
+        c.close()
+        return
+
+    def lookup(self, acc):
+        """Returns (offset, length) of the first entry with accession "acc"
+        or None if not indexed.
+        """
+        c = self.conn.execute('SELECT offset, length FROM acc_index WHERE acc=? ORDER BY offset LIMIT 1', (acc,))
+        return c.fetchone()
+
+    def lookup_all(self, acc):
+        """Returns the (offset, length) of every entry with accession "acc".
+        """
+        c = self.conn.execute('SELECT offset, length FROM acc_index WHERE acc=? ORDER BY offset', (acc,))
+        return c.fetchall()
+
+    def read_entry(self, offset, length):
+        """Returns the raw FASTA entry text (header and sequence lines).
+        """
+        self._file_obj.seek(offset)
+        return self._file_obj.read(length).decode('utf-8')
+
+    def read_protein(self, offset, length):
+        """Returns the entry as a Protein (parsed like FastaReader does).
+        """
+        self._file_obj.seek(offset)
+        data = self._file_obj.read(length)
+        end = data.find(b'\n')
+        if end < 0:
+            end = len(data)
+        line = data[:end].strip().decode('utf-8')
+        p = Protein()
+        p.accession = line.split()[0][1:]
+        p.new_acc = p.accession
+        p.description = line[len(p.accession)+2:]
+        p.new_desc = p.description
+        p.set_span(data, end, len(data))
+        return p
+
+    def close(self):
+        """Closes the index database and the FASTA file.
+        """
+        try:
+            self._file_obj.close()
+            self.conn.close()
+        except:
+            pass
+        return
+
+    # end class
+
+def nr_taxon_lookup(acc_to_taxon, REF_SEQ_ONLY=False):
+    """Returns a header -> taxon number function for NCBI nr headers.
+    "acc_to_taxon" is a loaded AccToTaxon object.  Non-RefSeq headers
+    give taxon 0 if "REF_SEQ_ONLY" is set.
+    """
+    def lookup(header):
+        accession = header.split()[0].split('.')[0]
+        if REF_SEQ_ONLY and '_' not in accession:
+            return 0
+        return acc_to_taxon.get(accession, 0)
+    return lookup
+
+def uniprot_taxon_lookup(sci_to_taxon, name_to_taxon):
+    """Returns a header -> taxon number function for UniProt headers.
+    Species names (OS= field) are mapped with the "speclist.txt" dictionary
+    first and the NCBI names dictionary second (as in the extract scripts).
+    """
+    def lookup(header):
+        try:
+            (spec_id, spec_name) = uniprot_parse_line(header)
+        except IndexError:  # not a UniProt style header
+            return 0
+        taxon = sci_to_taxon.get(spec_name, 0)
+        if taxon == 0:
+            taxon = name_to_taxon.get(spec_name, 0)
+        return taxon
+    return lookup
+
+
+
+class Checkpoint:
+    """Saves and restores the state of a long database pass.
+    Methods:
+        __init__: "checkpoint_file" is where the state is pickled and
+            "source_file" is the database being read, or a list of them
+            (a checkpoint is not used if any size or time stamp changed).
+        load: returns the saved state dictionary (or None)
+        due: True if "interval" seconds have passed since the last save
+        save: flushes any output files and saves the state dictionary and
+            the output file lengths
+        restore_outputs: truncates output files to their saved lengths
+        remove: deletes the checkpoint file after a pass has finished
+    The state dictionary holds whatever the pass needs to restart: the
+    input position (a read_headers offset or FastaReader.get_position),
+    counters, and dictionaries.  Saves are atomic (temp file and rename).
+    """
+    def __init__(self, checkpoint_file, source_file, interval=600.0):
+        self.checkpoint_file = checkpoint_file
+        if isinstance(source_file, str):
+            stat = os.stat(source_file)
+            self._stamp = (stat.st_size, int(stat.st_mtime))
+        else:
+            self._stamp = [(os.stat(f).st_size, int(os.stat(f).st_mtime)) for f in source_file]
+        self.interval = interval
+        self._last_save = time.time()
+        return
+
+    def load(self):
+        """Returns the saved state dictionary or None if no usable checkpoint.
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        with open(self.checkpoint_file, 'rb') as fin:
+            saved = pickle.load(fin)
+        if saved.get('stamp') != self._stamp:
+            print('...WARNING: database changed since checkpoint, starting over')
+            return None
+        return saved
+
+    def due(self):
+        """True if it is time to save another checkpoint.
+        """
+        return (time.time() - self._last_save) >= self.interval
+
+    def save(self, state, out_files=None):
+        """Saves "state" (a dictionary) and lengths of "out_files" (name: file object).
+        """
+        lengths = {}
+        for name, file_obj in (out_files or {}).items():
+            file_obj.flush()
+            lengths[name] = file_obj.tell()
+        saved = {'stamp': self._stamp, 'state': state, 'lengths': lengths}
+        temp_file = self.checkpoint_file + '.tmp'
+        with open(temp_file, 'wb') as fout:
+            pickle.dump(saved, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, self.checkpoint_file)
+        self._last_save = time.time()
+        return
+
+    def restore_outputs(self, saved, out_names):
+        """Truncates output files (name: path) to their checkpointed lengths.
+        Files can then be reopened in append mode.
+        """
+        for name, path in out_names.items():
+            length = saved['lengths'].get(name, 0)
+            if os.path.exists(path):
+                os.truncate(path, length)
+            else:
+                open(path, 'w').close()
+        return
+
+    def remove(self):
+        """Deletes the checkpoint file (the pass is finished).
+        """
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+        return
+
+    # end class
+
+def resume_flag(argv):
+    """Removes any "--resume" option from "argv" and returns True if found.
+    """
+    found = '--resume' in argv
+    while '--resume' in argv:
+        argv.remove('--resume')
+    return found
+
+def ftp_file_stamp(ftp, file_name):
+    """Returns [modification time, size] of a file on an FTP site.
+    MDTM and SIZE are cheap one-line commands, so this is a quick way to see
+    if a file has changed without downloading it.  Returns None if the site
+    does not support the commands.
+    """
+    import ftplib
+    try:
+        mdtm = ftp.sendcmd('MDTM ' + file_name).split()[-1]
+        ftp.voidcmd('TYPE I')
+        size = ftp.size(file_name)
+    except ftplib.all_errors:
+        return None
+    return [mdtm, size]
+
+class CatalogCache:
+    """Versioned JSON file for saving the proteome manager catalogs.
+    Methods:
+        __init__: "cache_file" is the full path name, "version" is the
+            format version of the saved data
+        load: returns the saved dictionary (None if there is no file, it
+            cannot be read, or it was written by a different version)
+        save: writes a dictionary (the file is replaced in one step)
+    Plain JSON dictionaries load much faster than pickled class objects.
+    """
+    def __init__(self, cache_file, version):
+        self.cache_file = cache_file
+        self.version = version
+        return
+
+    def load(self):
+        """Returns the saved dictionary or None.
+        """
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as fin:
+                data = json.load(fin)
+        except (OSError, ValueError):
+            return None
+        if data.get('cache_version') != self.version:
+            return None
+        return data
+
+    def save(self, data):
+        """Saves "data" (a JSON-compatible dictionary).
+        """
+        data = dict(data, cache_version=self.version)
+        temp_name = self.cache_file + '.tmp'
+        with open(temp_name, 'w', encoding='utf-8') as fout:
+            json.dump(data, fout, separators=(',', ':'))
+        os.replace(temp_name, self.cache_file)
+        return
+
+    # end class
+
 def get_uniprot_version():
     """Gets UniProt version numbers from online release notes.
     Written by Phil Wilmarth, OHSU, 2009.
     """
+    import urllib.request
     # set up to read the online UniProt release notes file
     print('...getting database version numbers...')
     versions = {'uniprot':'XX.X', 'sprot':'XX.X', 'trembl':'XX.X'}
@@ -849,7 +2344,6 @@ def download_uniprot(db, folder, versions):
     Written by Phil Wilmarth, OHSU, 2009.
     """
     # check if files are already downloaded, if not fetch them from uniprot site
-    socket.setdefaulttimeout(120.)
     print('...downloading databases and taxonomy files...')
     db_name = 'uniprot_%s_%s.fasta.gz' % (db, versions[db],)
     base_address = 'ftp://ftp.expasy.org/databases/uniprot/current_release/knowledgebase/complete/'
@@ -861,18 +2355,7 @@ def download_uniprot(db, folder, versions):
                          (os.path.join(folder, 'speclist.txt'),
                          'ftp://ftp.ebi.ac.uk/pub/databases/uniprot/current_release/knowledgebase/complete/docs/speclist.txt')]
     files_addresses.reverse()
-    for (file_name, address) in files_addresses:
-        if os.path.exists(file_name):
-            pass
-        else:
-            print('...downloading', file_name)
-            x = reporter()
-            try:
-                urllib.request.urlretrieve(address, file_name, reporthook=x.report)
-            except:
-                print('...WARNING: download may have hung at EOF or other error')
-            finally:
-                urllib.request.urlcleanup()
+    Downloader(timeout=120.0).fetch_all(files_addresses)
     return
 
 def download_ncbi(nr_folder):
@@ -892,38 +2375,431 @@ def download_ncbi(nr_folder):
                         (os.path.join(nr_folder, 'taxdump.tar.gz'),
                          'ftp://ftp.ncbi.nih.gov/pub/taxonomy/taxdump.tar.gz') ]
     files_addresses.reverse()
-    socket.setdefaulttimeout(240.)
-    for (file_name, address) in files_addresses:
+    Downloader(timeout=240.0, md5=True).fetch_all(files_addresses)   # NCBI has ".md5" files
+    return
+
+def file_md5(file_name, block_size=1048576):
+    """Returns the MD5 hex digest of a file.
+    """
+    import hashlib
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as fin:
+        while True:
+            block = fin.read(block_size)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
+
+class Downloader:
+    """Resumable, verified, concurrent downloads from FTP or HTTP(S) sites.
+    Methods:
+        __init__: "timeout" (seconds), "retries" per file, "workers" for
+            concurrent downloads, and "md5" to check against "address.md5"
+            files (NCBI provides these).
+        fetch: downloads one file, returns True if complete and verified;
+            an optional "make_sink" function returns an object whose "write"
+            is also given every block and whose "close" is called when the
+            file is complete (for processing data as it arrives); after a
+            failed attempt the sink's "abort" (if it has one, otherwise
+            "close") is called so it can delete any partial output
+        fetch_all: downloads a list of (file_name, address) concurrently
+        cancel: stops the downloads (between blocks, ".part" files are kept)
+    Data goes into "file_name.part" and is renamed to "file_name" only after
+    the size (and checksum, if available) has been verified.  An existing
+    ".part" file is continued with an FTP REST or HTTP Range request, so an
+    interrupted download does not start over.  Any host:port in the
+    address is used (a local test server works like a real site).
+    """
+    def __init__(self, timeout=120.0, retries=5, workers=3, md5=False):
+        self.timeout = timeout
+        self.retries = retries
+        self.workers = workers
+        self.md5 = md5
+        self.block_size = 1048576
+        self.report_size = 268435456   # progress every 256 MB
+        self.cancelled = threading.Event()
+        return
+
+    def cancel(self):
+        """Stops any downloads at their next block (fetch returns False).
+        """
+        self.cancelled.set()
+
+    def fetch_all(self, files_addresses):
+        """Downloads (file_name, address) pairs; files that exist are skipped.
+        Returns list of file names that could not be downloaded.
+        """
+        import concurrent.futures
+        to_get = [(f, a) for (f, a) in files_addresses if not os.path.exists(f)]
+        failed = []
+        if not to_get:
+            return failed
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.fetch, address, file_name): file_name
+                       for (file_name, address) in to_get}
+            for future in concurrent.futures.as_completed(futures):
+                if not future.result():
+                    failed.append(futures[future])
+        for file_name in failed:
+            print('...WARNING: %s could not be downloaded' % (file_name,))
+        return failed
+
+    def fetch(self, address, file_name, make_sink=None):
+        """Downloads "address" to "file_name" (resuming any partial file).
+        With a "make_sink", a file that is already present is read back
+        through a sink, and downloads restart from the beginning.
+        """
+        import ftplib
         if os.path.exists(file_name):
-            pass
+            if make_sink:
+                sink = make_sink()
+                try:
+                    self._replay(file_name, sink)
+                except BaseException:
+                    self._abort(sink)
+                    raise
+            return True
+        print('...downloading', file_name)
+        part_name = file_name + '.part'
+        checksum = self._remote_md5(address) if self.md5 else None
+        for attempt in range(self.retries):
+            if self.cancelled.is_set():
+                break
+            sink = None
+            try:
+                if make_sink:
+                    if os.path.exists(part_name):
+                        os.remove(part_name)    # a sink needs every block
+                    sink = make_sink()
+                size = self._transfer(address, part_name, sink)
+                actual = os.path.getsize(part_name)
+                if (size is not None) and (actual != size):
+                    if actual > size:
+                        os.remove(part_name)
+                    raise IOError('%s of %s bytes received' % (actual, size))
+                if checksum and (file_md5(part_name) != checksum):
+                    os.remove(part_name)
+                    raise IOError('MD5 checksum did not match')
+                os.replace(part_name, file_name)
+                if sink:
+                    sink.close()
+                print('...%s finished (%s bytes)' % (os.path.basename(file_name), "{0:,d}".format(actual)))
+                return True
+            except (OSError, EOFError) + ftplib.all_errors as err:
+                self._abort(sink)
+                print('...WARNING: download of %s failed (%s), attempt %s of %s' %
+                      (os.path.basename(file_name), err, attempt+1, self.retries))
+                if self.cancelled.is_set():
+                    break   # the ".part" file is kept for the next run
+                if isinstance(err, ftplib.error_perm) or getattr(err, 'code', 0) in (403, 404):
+                    if os.path.exists(part_name) and not os.path.getsize(part_name):
+                        os.remove(part_name)
+                    break   # missing file, retrying will not help
+                if attempt < self.retries - 1:  # (no wait after the last attempt)
+                    time.sleep(min(5 * 2**attempt, 120))
+            except BaseException:   # sink errors, etc. (not retried)
+                self._abort(sink)
+                raise
+        return False
+
+    def _abort(self, sink):
+        """Drops the sink of a failed attempt (see fetch).
+        """
+        if sink is None:
+            return
+        try:
+            if hasattr(sink, 'abort'):
+                sink.abort()
+            else:
+                sink.close()
+        except Exception as err:    # a half fed sink can fail to close
+            print('...WARNING: download sink could not be closed (%s)' % (err,))
+        return
+
+    def _replay(self, file_name, sink):
+        """Passes the blocks of a local file to "sink".
+        """
+        with open(file_name, 'rb') as fin:
+            while True:
+                block = fin.read(self.block_size)
+                if not block:
+                    break
+                sink.write(block)
+        sink.close()
+
+    def _transfer(self, address, part_name, sink=None):
+        """Appends the rest of "address" to "part_name".
+        Returns the expected total size (or None if the site does not say).
+        """
+        offset = os.path.getsize(part_name) if os.path.exists(part_name) else 0
+        if address.lower().startswith('ftp://'):
+            return self._transfer_ftp(address, part_name, offset, sink)
         else:
-            print('...downloading', file_name)
-            x = reporter()
+            return self._transfer_http(address, part_name, offset, sink)
+
+    def _ftp_connect(self, address):
+        """Returns logged in FTP connection and the remote path.
+        """
+        import ftplib
+        import urllib.parse
+        parsed = urllib.parse.urlparse(address)
+        ftp = ftplib.FTP()
+        ftp.connect(parsed.hostname, parsed.port or 21, timeout=self.timeout)
+        ftp.login(parsed.username or 'anonymous', parsed.password or '')
+        ftp.voidcmd('TYPE I')
+        return ftp, urllib.parse.unquote(parsed.path)
+
+    def _transfer_ftp(self, address, part_name, offset, sink=None):
+        """FTP transfer, restarting at "offset" with REST.
+        """
+        import ftplib
+        ftp, path = self._ftp_connect(address)
+        try:
             try:
-                urllib.request.urlretrieve(address, file_name, reporthook=x.report)
-            except:
-                print('...WARNING: download may have hung at EOF or other error')
-            finally:
-                urllib.request.urlcleanup()
-    return
+                size = ftp.size(path)
+            except ftplib.error_perm:   # SIZE not supported
+                size = None
+            if (size is not None) and (offset > size):
+                offset = 0
+            if (size is not None) and (offset == size):
+                return size
+            with open(part_name, 'ab' if offset else 'wb') as fout:
+                writer = self._writer(fout, offset, size, part_name, sink)
+                ftp.retrbinary('RETR ' + path, writer, blocksize=self.block_size, rest=offset or None)
+            ftp.quit()
+        finally:
+            ftp.close()
+        return size
+
+    def _transfer_http(self, address, part_name, offset, sink=None):
+        """HTTP transfer, restarting at "offset" with a Range request.
+        """
+        import urllib.request
+        import urllib.error
+        request = urllib.request.Request(address)
+        if offset:
+            request.add_header('Range', 'bytes=%s-' % (offset,))
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as err:
+            if err.code == 416:     # nothing left to send
+                return offset
+            raise
+        with response:
+            if offset and (response.status != 206):     # Range was ignored
+                offset = 0
+            length = response.headers.get('Content-Length')
+            size = (offset + int(length)) if length else None
+            with open(part_name, 'ab' if offset else 'wb') as fout:
+                writer = self._writer(fout, offset, size, part_name, sink)
+                while True:
+                    block = response.read(self.block_size)
+                    if not block:
+                        break
+                    writer(block)
+        return size
+
+    def _writer(self, fout, offset, size, part_name, sink=None):
+        """Makes a block writing function that also prints progress.
+        """
+        progress = [offset, offset]     # bytes so far, bytes at last report
+        name = os.path.basename(part_name)[:-5]
+        def write(block):
+            if self.cancelled.is_set():
+                raise IOError('download cancelled')
+            fout.write(block)
+            if sink:
+                sink.write(block)
+            progress[0] += len(block)
+            if progress[0] - progress[1] >= self.report_size:
+                progress[1] = progress[0]
+                if size:
+                    print('......%s: %s of %s bytes (%.2f%%)' %
+                          (name, "{0:,d}".format(progress[0]), "{0:,d}".format(size),
+                           100.0*progress[0]/size))
+                else:
+                    print('......%s: %s bytes' % (name, "{0:,d}".format(progress[0])))
+        return write
+
+    def _remote_md5(self, address):
+        """Gets the checksum from "address.md5" (None if not available).
+        """
+        import ftplib
+        import urllib.request
+        try:
+            if address.lower().startswith('ftp://'):
+                ftp, path = self._ftp_connect(address + '.md5')
+                lines = []
+                try:
+                    ftp.retrlines('RETR ' + path, lines.append)
+                    ftp.quit()
+                finally:
+                    ftp.close()
+                text = '\n'.join(lines)
+            else:
+                with urllib.request.urlopen(address + '.md5', timeout=self.timeout) as response:
+                    text = response.read().decode('utf-8')
+            return text.split()[0].lower()
+        except (OSError, EOFError, IndexError) + ftplib.all_errors:
+            print('...WARNING: no MD5 checksum available for', address)
+            return None
 
+    # end class
 
-class reporter():
-    """Prints download progress to console.
+class DownloadPipeline:
+    """Overlaps downloads with the CPU-bound processing of downloaded files.
+    Methods:
+        __init__: "downloader" is a Downloader (its "workers" attribute sets
+            the number of concurrent downloads), "processes" sets the size
+            of the processing pool (None uses all cores)
+        start: runs a list of jobs in a background thread (returns at once)
+        run: runs a list of jobs and returns the names of failed jobs
+            (names of finished jobs are in "completed")
+        is_alive: True while the jobs started with "start" are running
+        stop: cancels the downloads and the jobs that have not started
+        poll: returns the progress messages queued since the last call
+    A job is (name, [(file_name, address), ...], process, args), where a
+    file can also be (file_name, address, make_sink) to process its data
+    on the download thread as it arrives (see Downloader.fetch). When all of
+    a job's files are downloaded, "process(*args)" runs in a worker process
+    while later downloads continue.  "process" must be a module-level
+    function (so it can be pickled) and returns a message string.  The jobs
+    can be a generator; it is consumed on the pipeline thread.  Messages are
+    printed and also queued so a GUI can show them from its own thread.
     """
-    def __init__(self):
-        self.packets = 0
-        self.size = 0
-        self.buff = 8192
-        
-    def report(self, packets, buff, size):
-        # this monitors the download progress
-        if packets % 4096 == 0:
-            sub_total = packets * buff
-            print('......%s of %s bytes (%.2f%%)' %
-                  ("{0:,d}".format(sub_total), "{0:,d}".format(size), float(100*sub_total)/size))
+    def __init__(self, downloader=None, processes=None):
+        self.downloader = downloader or Downloader()
+        self.processes = processes or os.cpu_count() or 1
+        self.messages = queue.Queue()
+        self.failed = []
+        self.completed = []
+        self._thread = None
+        self._stop = threading.Event()
         return
 
+    def report(self, message):
+        """Prints a progress message and queues it for "poll".
+        """
+        print(message)
+        self.messages.put(message)
+
+    def poll(self):
+        """Returns list of messages queued since the last call.
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def start(self, jobs):
+        """Runs "jobs" in a background thread (see "is_alive" and "poll").
+        """
+        self._thread = threading.Thread(target=self.run, args=(jobs,), daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        """True if the background thread is still running.
+        """
+        return bool(self._thread and self._thread.is_alive())
+
+    def stop(self):
+        """Cancels queued jobs and running downloads (for quitting a GUI).
+        Processing steps that have already started run to the end.
+        """
+        # (a flag rather than shutdown(cancel_futures=True): futures cancelled
+        # that way are never returned by as_completed and "run" would hang)
+        self._stop.set()
+        self.downloader.cancel()
+
+    def run(self, jobs):
+        """Downloads and processes "jobs", returns list of failed job names.
+        """
+        import concurrent.futures
+        import multiprocessing
+        self.failed = []
+        self.completed = []
+        # "spawn" workers: forking a process that has running threads is not safe
+        context = multiprocessing.get_context('spawn')
+        downloads = {}
+        try:
+            with concurrent.futures.ProcessPoolExecutor(self.processes, mp_context=context) as process_pool, \
+                 concurrent.futures.ThreadPoolExecutor(self.downloader.workers) as download_pool:
+                try:
+                    for job in jobs:
+                        if self._stop.is_set():
+                            break
+                        downloads[download_pool.submit(self._download, job)] = job
+                        self.report('...queued %s for download' % (job[0],))
+                except Exception as err:    # the jobs generator failed (FTP listing, etc.)
+                    self.report('...WARNING: making the job list failed (%s)' % (err,))
+                    self.failed.append('job listing')
+                processing = {}
+                for future in concurrent.futures.as_completed(downloads):
+                    (name, files, process, args) = downloads[future]
+                    if self._stop.is_set():
+                        self.report('...%s cancelled' % (name,))
+                        self.failed.append(name)
+                        continue
+                    try:
+                        ok = future.result()
+                    except Exception as err:
+                        self.report('...WARNING: download of %s failed (%s)' % (name, err))
+                        self.failed.append(name)
+                        continue
+                    if not ok:
+                        self.report('...WARNING: download of %s failed' % (name,))
+                        self.failed.append(name)
+                        continue
+                    self.report('...%s downloaded, processing' % (name,))
+                    try:
+                        processing[process_pool.submit(process, *args)] = name
+                    except Exception as err:    # broken process pool
+                        self.report('...WARNING: processing of %s failed (%s)' % (name, err))
+                        self.failed.append(name)
+                waiting = dict(processing)
+                if not self._stop.is_set():
+                    for future in concurrent.futures.as_completed(processing):
+                        self._processed(future, waiting.pop(future))
+                        if self._stop.is_set():
+                            break
+                # after "stop", jobs that have not started are cancelled
+                for (future, name) in waiting.items():
+                    if future.cancel():
+                        self.report('...%s cancelled' % (name,))
+                        self.failed.append(name)
+                    else:
+                        self._processed(future, name)
+        except Exception as err:    # pools could not start, etc.
+            self.report('...WARNING: download pipeline failed (%s)' % (err,))
+            self.failed.append('download pipeline')
+        self.report('Done: %s jobs, %s failed' % ("{0:,d}".format(len(downloads)), len(self.failed)))
+        return self.failed
+
+    def _processed(self, future, name):
+        """Reports the result of a job's processing step (waits for it).
+        """
+        try:
+            self.report(future.result() or ('...%s is done' % (name,)))
+            self.completed.append(name)
+        except Exception as err:
+            self.report('...WARNING: processing of %s failed (%s)' % (name, err))
+            self.failed.append(name)
+
+    def _download(self, job):
+        """Downloads the files for one job, returns True if all were fetched.
+        """
+        (name, files, process, args) = job
+        ok = True
+        for (file_name, address, *make_sink) in files:
+            if self._stop.is_set():
+                return False
+            self.report('Downloading %s' % (os.path.basename(file_name),))
+            ok = self.downloader.fetch(address, file_name, *make_sink) and ok
+        return ok
+
     # end class
 
 
@@ -932,6 +2808,7 @@ def expand_species(folder, db, taxon_dict, min_sequence_count, min_seq_per_speci
     """Expands any taxon nodes numbers into all member taxon numbers.
     Written by Phil Wilmarth, OHSU, 2009.
     """
+    import tarfile
     VERBOSE = False
     
     # open taxonomy nodes file
@@ -1162,6 +3039,7 @@ def make_taxon_to_sci_name(folder):
     """Makes the taxon_to_sci_name dictionary.
     Written by Phil Wilmarth, OHSU, 2009.
     """
+    import tarfile
     print('...making taxon_to_sci_name dictionary...')
     archive_name = os.path.join(folder, 'taxdump.tar.gz')
     archive = tarfile.open(archive_name)
@@ -1225,6 +3103,7 @@ def make_all_names_to_taxon(folder):
     """Makes the all_names_to_taxon dictionary.
     Written by Phil Wilmarth, OHSU, 2009.
     """
+    import tarfile
     print('...making all_names_to_taxon dictionary...')
     archive_name = os.path.join(folder, 'taxdump.tar.gz')
     archive = tarfile.open(archive_name)
@@ -1247,8 +3126,11 @@ def make_all_names_to_taxon(folder):
     names.close()
     return all_names_to_taxon
 
-def uniprot_species_frequency(database_name):
+def uniprot_species_frequency(database_name, resume=False, metrics=None):
     """Compiles species frequency info from Sprot or Trembl databases.
+    Progress is checkpointed to "database_name.checkpoint" and a scan can
+    be restarted from there if "resume" is set.  "metrics" is an optional
+    RunMetrics object for progress and rates.
     Written by Phil Wilmarth, OHSU, 2009.
     """
     # read all of the protein descriptions and parse out species names
@@ -1259,19 +3141,28 @@ def uniprot_species_frequency(database_name):
     name_freq = {}
     name_to_spec_id = {}
     prot_count = 0
-    f = gzip.open(database_name, 'rt')
-    while True:
-        line = f.readline()
-        if not line: break
+    offset = 0
+    checkpoint = Checkpoint(database_name + '.checkpoint', database_name)
+    saved = checkpoint.load() if resume else None
+    if saved:
+        (offset, name_freq, name_to_spec_id, prot_count) = saved['state']
+        print('...resuming from checkpoint after %s proteins' % ("{0:,d}".format(prot_count),))
+    if metrics is None:
+        metrics = RunMetrics('uniprot_species_frequency')
+    metrics.start_stage(os.path.basename(database_name), None, prot_count)
+    for (position, line) in read_headers(database_name, offset=offset, with_offsets=True):
+        if checkpoint.due():
+            checkpoint.save((position, name_freq, name_to_spec_id, prot_count))
         
         # get species name, id; save in dictionary; make frequency totals
-        if line.startswith('>'):
-            prot_count += 1
-            if (prot_count % 500000) == 0:
-                print('......(%s proteins read...)' % ("{0:,d}".format(prot_count),))
-            (spec_id, name) = uniprot_parse_line(line)
-            name_to_spec_id[name] = spec_id
-            fasta_lib.add_or_increment(name, name_freq)            
+        prot_count += 1
+        if (prot_count % 500000) == 0:
+            metrics.progress(prot_count)
+        (spec_id, name) = uniprot_parse_line(line)
+        name_to_spec_id[name] = spec_id
+        fasta_lib.add_or_increment(name, name_freq)            
+    metrics.end_stage(prot_count)
+    checkpoint.remove()
     return name_freq, name_to_spec_id, prot_count
 
 def uniprot_parse_line(line):
@@ -1486,6 +3377,317 @@ def get_taxon_from_name(db, name, dict_list):
         taxon = sci2tax.get(name, name2tax.get(name, -1))
     return taxon
 
+# set to True (or set the FASTA_UTILITIES_METRICS environment variable) to add
+# JSON lines with run metrics to the "fasta_utilities.log" files
+METRICS_JSON = False
+
+def format_seconds(seconds):
+    """Returns "h:mm:ss" text for a number of seconds.
+    """
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+class RunMetrics:
+    """Stage timers, counters, rates, and ETA for long runs.
+    Methods:
+        __init__: "name" is the script name; "log_obj" is the open log file
+            for the summary and for JSON lines (if "json_lines" is set, or
+            METRICS_JSON, or the FASTA_UTILITIES_METRICS environment variable)
+        start_stage: starts timing a stage; "reader" (a FastaReader) gives
+            the file position for percent done and ETA; "records" is the
+            starting count (for resumed runs)
+        progress: prints records read, rate, percent done, and ETA
+        add: adds to a named counter ("records_written", "lookups", etc.)
+        end_stage: stops the stage timer and saves the stage numbers
+        summary: prints stage times, counters, and rates (screen and log)
+    The ETA uses the file (compressed) byte position, so it works for gzip
+    files.  Each JSON line is one event object ("start", "progress", "stage",
+    or "summary") and starts with "{" to be easy to find in the log text.
+    """
+    def __init__(self, name, log_obj=None, json_lines=None):
+        if json_lines is None:
+            json_lines = METRICS_JSON or os.environ.get('FASTA_UTILITIES_METRICS', '') not in ('', '0')
+        self.name = name
+        self.log_obj = log_obj
+        self.json_lines = json_lines and (log_obj is not None)
+        self.counters = {}
+        self.stages = []
+        self._start = time.perf_counter()
+        self._stage = None
+        return
+
+    def start_stage(self, stage, reader=None, records=0):
+        """Starts timing "stage" (ends any stage that is running).
+        """
+        if self._stage is not None:
+            self.end_stage()
+        self._stage = stage
+        self._reader = reader
+        self._stage_start = time.perf_counter()
+        self._first_records = records
+        self._records = records
+        self._first_position = reader.progress()[0] if reader else 0
+        self._stage_counters = dict(self.counters)
+        self._json('start', {'stage': stage})
+        return
+
+    def add(self, counter, value=1):
+        """Adds "value" to "counter".
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + value
+        return
+
+    def _status(self, records):
+        """Dictionary of the current stage numbers.
+        """
+        elapsed = time.perf_counter() - self._stage_start
+        status = {'stage': self._stage, 'records': records, 'seconds': round(elapsed, 3),
+                  'records_per_sec': round((records - self._first_records) / elapsed, 1) if elapsed else None}
+        if self._reader is not None:
+            (position, size, text_bytes) = self._reader.progress()
+            status.update({'bytes_read': position, 'file_bytes': size, 'bytes_decompressed': text_bytes})
+            done = position - self._first_position
+            if size and done > 0:
+                status['percent_done'] = round(100.0 * position / size, 1)
+                status['eta_sec'] = round(elapsed * (size - position) / done)
+        return status
+
+    def progress(self, records, unit='proteins'):
+        """Prints a progress line for "records" read so far, returns the numbers.
+        """
+        self._records = records
+        status = self._status(records)
+        text = '......(%s %s read' % ("{0:,d}".format(records), unit)
+        if status['records_per_sec']:
+            text += ', %s/sec' % ("{0:,d}".format(int(status['records_per_sec'])),)
+        if 'eta_sec' in status:
+            text += ', %.1f%% done, ETA %s' % (status['percent_done'], format_seconds(status['eta_sec']))
+        print(text + ')')
+        self._json('progress', status)
+        return status
+
+    def end_stage(self, records=None):
+        """Stops the stage timer, returns the stage numbers.
+        """
+        if self._stage is None:
+            return None
+        if records is not None:
+            self._records = records
+        status = self._status(self._records)
+        status['counters'] = dict([(k, v - self._stage_counters.get(k, 0)) for (k, v) in self.counters.items()
+                                   if v != self._stage_counters.get(k, 0)])
+        self.stages.append(status)
+        self._json('stage', status)
+        self._stage = None
+        return status
+
+    def summary(self):
+        """Ends any stage and prints the run metrics to the screen and log file.
+        """
+        self.end_stage()
+        elapsed = time.perf_counter() - self._start
+        for obj in [None, self.log_obj]:
+            print('...run metrics (%s total):' % (format_seconds(elapsed),), file=obj)
+            for stage in self.stages:
+                print('......%s: %s records in %s (%s/sec)' %
+                      (stage['stage'], "{0:,d}".format(stage['records']), format_seconds(stage['seconds']),
+                       "{0:,d}".format(int(stage['records_per_sec'] or 0))), file=obj)
+            for (counter, value) in sorted(self.counters.items()):
+                print('......%s: %s (%s/sec)' % (counter.replace('_', ' '), "{0:,d}".format(value),
+                                                 "{0:,d}".format(int(value / elapsed) if elapsed else 0)), file=obj)
+            if self.log_obj is None:
+                break
+        self._json('summary', {'seconds': round(elapsed, 3), 'stages': self.stages, 'counters': self.counters})
+        return
+
+    def _json(self, event, data):
+        """Writes one JSON line to the log file (if turned on).
+        """
+        if self.json_lines:
+            record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'run': self.name, 'event': event}
+            record.update(data)
+            print(json.dumps(record), file=self.log_obj)
+            self.log_obj.flush()
+        return
+
+    # end class
+
+_profiling = False  # only the outer entry point is profiled
+
+def profile_flag(argv):
+    """Removes any "--profile" option from "argv" and returns True if found.
+    Scripts call this before checking their own arguments; a found option
+    turns on profiling of the entry point (see PROFILE and profile_entry).
+    """
+    global PROFILE
+    found = '--profile' in argv[1:]
+    while '--profile' in argv[1:]:
+        argv.remove('--profile')
+    if found:
+        PROFILE = True
+    return found
+
+def profile_entry(function):
+    """Decorator for script entry points (main, fasta_counter, etc.).
+    If PROFILE is set (see profile_flag) or the FASTA_UTILITIES_PROFILE
+    environment variable is not empty or "0", the call is run under cProfile
+    and tracemalloc and a report is written (see write_profile_report).
+    Otherwise the function is called as usual.
+    """
+    import functools
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        global _profiling
+        enabled = PROFILE or os.environ.get('FASTA_UTILITIES_PROFILE', '') not in ('', '0')
+        if not enabled or _profiling:
+            return function(*args, **kwargs)
+        import cProfile
+        import tracemalloc
+        _profiling = True
+        profiler = cProfile.Profile()
+        tracemalloc.start(1)
+        sampler = MemorySampler()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+            (current, peak) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            _profiling = False
+            write_profile_report(function, args, kwargs, profiler, elapsed, peak, sampler)
+    return wrapper
+
+class MemorySampler:
+    """Samples traced memory (tracemalloc) in a background thread.
+    Methods:
+        __init__: starts sampling every "interval" seconds
+        stop: stops the sampling thread
+    "samples" is a list of (seconds, MB), "peak" is the most traced memory
+    seen (bytes), and "snapshot" is a tracemalloc snapshot taken near the
+    peak (the allocation sites there, rather than what is left at the end).
+    Snapshots are slow for big heaps, so a new high only takes one if the
+    last one is "snapshot_wait" seconds old or the high grew by more than
+    "snapshot_growth" (a fraction); "snapshot_bytes" is the memory in use
+    when it was taken.  There is always a snapshot after stop.
+    """
+    def __init__(self, interval=1.0, snapshot_wait=30.0, snapshot_growth=0.1):
+        self.interval = interval
+        self.snapshot_wait = snapshot_wait
+        self.snapshot_growth = snapshot_growth
+        self.samples = []
+        self.peak = 0
+        self.snapshot = None
+        self.snapshot_bytes = 0
+        self._snapshot_time = None
+        self._start = time.perf_counter()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self._sample()
+        return
+
+    def _sample(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return
+        now = time.perf_counter()
+        current = tracemalloc.get_traced_memory()[0]
+        self.samples.append((round(now - self._start, 1), round(current / 1048576.0, 1)))
+        if current <= self.peak:
+            return
+        self.peak = current
+        if (self._snapshot_time is None or (now - self._snapshot_time) >= self.snapshot_wait or
+                current > self.snapshot_bytes * (1.0 + self.snapshot_growth)):
+            self._take_snapshot(current)
+        return
+
+    def _take_snapshot(self, current):
+        import tracemalloc
+        self.snapshot = tracemalloc.take_snapshot()
+        self.snapshot_bytes = current
+        self._snapshot_time = time.perf_counter()
+        return
+
+    def stop(self):
+        """Stops sampling (takes one last sample, and a snapshot if there is none).
+        """
+        import tracemalloc
+        self._done.set()
+        self._thread.join()
+        self._sample()
+        if self.snapshot is None and tracemalloc.is_tracing():
+            self._take_snapshot(tracemalloc.get_traced_memory()[0])
+        return
+
+    # end class
+
+def profile_folder(args, kwargs):
+    """Folder for the profile report: the folder of the first file or
+    folder argument (where the log file goes), or the current folder.
+    """
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, str) and value and os.path.exists(value):
+            return value if os.path.isdir(value) else os.path.dirname(os.path.abspath(value))
+    return os.getcwd()
+
+def write_profile_report(function, args, kwargs, profiler, elapsed, peak, sampler):
+    """Writes the cProfile statistics ("*.prof", for pstats or other viewers)
+    and a text report with the run time, peak memory, memory samples, the
+    top allocation sites, fasta_lib function times, and the top functions.
+    """
+    import io
+    import pstats
+    folder = profile_folder(args, kwargs)
+    name = os.path.splitext(os.path.basename(function.__code__.co_filename))[0]
+    base = os.path.join(folder, '%s_profile_%s' % (name, time.strftime('%Y%m%d_%H%M%S')))
+    profiler.dump_stats(base + '.prof')
+    try:
+        import resource     # not on Windows
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1048576.0 if sys.platform == 'darwin' else 1024.0)
+    except ImportError:
+        peak_rss = None
+
+    # functions in fasta_lib sorted by their own time
+    stats = pstats.Stats(profiler)
+    lib_rows = []
+    for ((file_name, line, func), (cc, ncalls, tottime, cumtime, callers)) in stats.stats.items():
+        if os.path.basename(file_name) == 'fasta_lib.py':
+            lib_rows.append((tottime, cumtime, ncalls, '%s (line %s)' % (func, line)))
+    lib_rows.sort(reverse=True)
+
+    with open(base + '.txt', 'w') as fout:
+        print('profile of %s.%s on %s' % (name, function.__name__, time.ctime()), file=fout)
+        print('command line: %s' % (' '.join([sys.executable] + sys.argv),), file=fout)
+        print('elapsed time: %.3f sec (cProfile and tracemalloc slow the run down)' % (elapsed,), file=fout)
+        print('peak traced Python memory: %.1f MB' % (peak / 1048576.0,), file=fout)
+        if peak_rss is not None:
+            print('peak resident memory: %.1f MB' % (peak_rss,), file=fout)
+        step = max(1, len(sampler.samples) // 20)
+        print('memory samples (sec: MB): %s' %
+              (', '.join(['%s: %s' % sample for sample in sampler.samples[::step]]),), file=fout)
+        if sampler.snapshot is not None:
+            print('\ntop memory allocation sites (at %.1f MB, largest sample %.1f MB):' %
+                  (sampler.snapshot_bytes / 1048576.0, sampler.peak / 1048576.0), file=fout)
+            for stat in sampler.snapshot.statistics('lineno')[:10]:
+                print('   %s' % (stat,), file=fout)
+        print('\nfasta_lib functions (sorted by own time):', file=fout)
+        print('%12s %12s %12s  %s' % ('calls', 'own sec', 'total sec', 'function'), file=fout)
+        for (tottime, cumtime, ncalls, func) in lib_rows[:40]:
+            print('%12s %12.3f %12.3f  %s' % ("{0:,d}".format(ncalls), tottime, cumtime, func), file=fout)
+        print('\ntop functions by cumulative time:', file=fout)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(30)
+        print(text.getvalue(), file=fout)
+    print('...profile report written to %s.txt (stats in %s.prof)' % (base, os.path.basename(base)))
+    return base + '.txt'
+
 def time_stamp_logfile(message, file_obj):
     """Prints message and time stamp to a log file.
     Written by Phil Wilmarth, OHSU, 2009.
@@ -0,0 +1,87 @@
+"""'fasta_to_fbin.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# converts FASTA databases to the binary ".fbin" format (see fasta_lib.write_fbin)
+
+import os
+import sys
+import time
+import fasta_lib
+
+
+@fasta_lib.profile_entry
+def main(fasta_file):
+    """Writes a ".fbin" copy of "fasta_file" (can be ".gz") in the same folder.
+        FastaReader (and all of the scripts that use it) read ".fbin" files
+        directly, and extract_by_accession.py uses their accession index.
+    """
+    # create a log file to mirror screen output
+    folder = os.path.dirname(fasta_file)
+    log_obj = open(os.path.join(folder, 'fasta_utilities.log'), 'a')
+    write = [None, log_obj]
+    fasta_lib.time_stamp_logfile('\n>>> starting: fasta_to_fbin.py', log_obj)
+
+    start = time.perf_counter()
+    fbin_file = fasta_lib.write_fbin(fasta_file)
+    table = fasta_lib.ProteinTable.load(fbin_file)
+    for obj in write:
+        print('...%s proteins (%s residues) from %s written to %s in %s' %
+              ("{0:,d}".format(len(table)), "{0:,d}".format(sum(table.lengths())),
+               os.path.basename(fasta_file), os.path.basename(fbin_file),
+               fasta_lib.format_seconds(time.perf_counter() - start)), file=obj)
+    table.close()
+
+    fasta_lib.time_stamp_logfile('>>> ending: fasta_to_fbin.py', log_obj)
+    log_obj.close()
+    return
+
+
+# setup stuff: check for command line args, etc.
+if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    # check if database name(s) passed on command line
+    if len(sys.argv) > 1:
+        fasta_files = sys.argv[1:]
+
+    # if not, browse to database file
+    else:
+        database = r'C:\Xcalibur\database'  # set a default to speed up browsing
+        if not os.path.exists(database):
+            database = os.getcwd()
+        fasta_files = fasta_lib.get_files(database,
+                                          [('FASTA files', '*.fasta'), ('Zipped FASTA files', '*.gz'), ('All files', '*.*')],
+                                          'Select FASTA databases to convert')
+        if not fasta_files: sys.exit()     # cancel button response
+
+    print('==========================================================')
+    print(' fasta_to_fbin.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('==========================================================')
+    for fasta_file in fasta_files:
+        main(fasta_file)
+
+# end
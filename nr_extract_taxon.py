@@ -56,7 +56,8 @@ taxon_dict = { 9606:'human_refseq',
 taxon_dict = { 8459: 'Testudines_8459'}
 taxon_dict = { 8476: 'Terrapins_8476'}
 
-def main(taxon_dict):
+@fasta_lib.profile_entry
+def main(taxon_dict, resume=False):
     """Main program to extract entries by taxon ID from NCBI nr databases.
         Each gi number (of each header) is looked up to find associated taxon
         number for comparison to desired taxon numbers.  A separate protein
@@ -69,6 +70,8 @@ def main(taxon_dict):
         on during extraction, some information may be lost.  This could make
         subsequent database processing (such as extracting by text string) fail.
         Cleaning is best done as a last step (i.e. in "reverse_fasta.py").
+        Progress is checkpointed and, if "resume" is set, an interrupted
+        extraction restarts from its last checkpoint.
     """
     print('====================================================================')
     print(' nr_extract_taxon.py, v.1.1.0, written by Phil Wilmarth, OHSU, 2017 ')
@@ -90,6 +93,7 @@ def main(taxon_dict):
     log_obj = open(os.path.join(ncbi_folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: nr_extract_taxon.py', log_obj)
+    metrics = fasta_lib.RunMetrics('nr_extract_taxon.py', log_obj)
 
     # get the saved gi number to taxon number {int:int} dictionary
     acc_to_taxon = fasta_lib.AccToTaxon(ncbi_folder)
@@ -122,9 +126,17 @@ def main(taxon_dict):
         name_count[name] = 0
         taxon_count[taxon] = 0
 
+    # restart from a checkpoint (truncate outputs to saved lengths) or start new
+    checkpoint = fasta_lib.Checkpoint(os.path.join(ncbi_folder, nr_db+'_extract.checkpoint'), nr_file)
+    saved = checkpoint.load() if resume else None
+    mode = 'w'
+    if saved:
+        checkpoint.restore_outputs(saved, taxon_files)
+        mode = 'a'
+
     # open the output filenames
     for name in taxon_files.keys():
-        taxon_files[name] = open(taxon_files[name], 'w')
+        taxon_files[name] = open(taxon_files[name], mode)
 
     # loop over all proteins in nr
     x = fasta_lib.FastaReader(nr_file)
@@ -132,25 +144,37 @@ def main(taxon_dict):
     prot_read = 0
     not_found = 0
     skipped = 0
+    if saved:
+        state = saved['state']
+        x.set_position(state['position'])
+        prot_read, not_found, skipped = state['prot_read'], state['not_found'], state['skipped']
+        taxon_count, name_count = state['taxon_count'], state['name_count']
+        for obj in write:
+            print('...resuming from checkpoint after %s proteins' % ("{0:,d}".format(prot_read),), file=obj)
     for obj in write:
         print('...reading %s and extracting entries...' % (nr_name,), file=obj)
+    metrics.start_stage(nr_name, x, prot_read)
+    lookups = 0
 
-    # checking for errors slows down program by about a factor of 3 or 4
+    # checking for errors adds about 50% to the reading time
     while x.readNextProtein(prot, check_for_errs=False):
         prot_read += 1
         if (prot_read % 1000000) == 0:
-            print('......(%s proteins read...)' % ("{0:,d}".format(prot_read),))
+            metrics.progress(prot_read)
         written = {}
         line = prot.accession + ' ' + prot.description
         prot.new_desc = ''
 
         # extract the gi numbers for each header
         for header in line.split(chr(1)):
+            if not header.strip():
+                continue
             accession_with_version = header.split()[0]
             accession = accession_with_version.split('.')[0]
             if REF_SEQ_ONLY and '_' not in accession:
                 continue    # skip proteins without RefSeq entries
             taxon = acc_to_taxon.get(accession, False)
+            lookups += 1
 
             # see if taxon number for this gi is in our desired list
             if taxon:
@@ -185,6 +209,16 @@ def main(taxon_dict):
             if CLEAN_ACCESSIONS:
                 prot.parseNCBI(REF_SEQ_ONLY)
             prot.printProtein(f)
+            metrics.add('records_written')
+
+        # save progress now and then so a crash or reboot can be resumed
+        if (prot_read % 10000) == 0 and checkpoint.due():
+            checkpoint.save({'position': x.get_position(), 'prot_read': prot_read,
+                             'not_found': not_found, 'skipped': skipped,
+                             'taxon_count': taxon_count, 'name_count': name_count}, taxon_files)
+
+    metrics.add('taxon_lookups', lookups)
+    metrics.end_stage(prot_read)
 
     # print out number of matches and close files
     for obj in write:
@@ -207,23 +241,29 @@ def main(taxon_dict):
             print('......(%s) %s proteins extracted and written to %s' %
                   (i+1, "{0:,d}".format(name_count[name]), nr_db+'_'+name+'.fasta'), file=obj)
 
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: nr_extract_taxon.py', log_obj)
     log_obj.close()
     for f in taxon_files.values():
         f.close()
+    checkpoint.remove()
     return
 
 
 # check for command line launch and see if any arguments passed
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    # "--resume" restarts an interrupted extraction from its last checkpoint
+    resume = fasta_lib.resume_flag(sys.argv)
+
     # if arguments make sure they are taxon name pairs
     if len(sys.argv) > 1:
         arg_dict = fasta_lib.taxon_cmd_line_checker(sys.argv)
         if arg_dict:
-            main(arg_dict)
+            main(arg_dict, resume)
         else:
             sys.exit()  # error in command line arguments
     else:
-        main(taxon_dict)
+        main(taxon_dict, resume)
 
 # end
@@ -31,19 +31,80 @@ Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
 import os
 import sys
 import time
-import gzip
+import gc
+import multiprocessing
+from collections import Counter
 import fasta_lib
 
 # minimum sequence count cutoff for output table
 # NOTE: There are a LOT of species with less than 10 sequences
 min_sequence_count = 10
 
+# number of worker processes for the nr scan (0 uses all cores, 1 is serial)
+NUM_WORKERS = 0
+CHUNK_SIZE = 20000  # header lines sent to a worker at a time
 
-def main(db, folder):
+def header_chunks(fasta_file, offset=0):
+    """Generator of (header lines, offset of the next header) from "fasta_file".
+    The offset is None for the last chunk.
+    """
+    lines = []
+    for (position, line) in fasta_lib.read_headers(fasta_file, offset=offset, with_offsets=True):
+        if len(lines) == CHUNK_SIZE:
+            yield (lines, position)
+            lines = []
+        lines.append(line)
+    if lines:
+        yield (lines, None)
+
+def parse_chunk(chunk):
+    """Parses a chunk of header lines (done in the workers).
+    Returns (list of accession lists, one per protein, next_offset).
+    """
+    (lines, next_offset) = chunk
+    return [[header.split()[0].split('.')[0] for header in line.split(chr(1)) if header.strip()]
+            for line in lines], next_offset
+
+def count_chunk(proteins, acc_to_taxon):
+    """Counts taxon and RefSeq taxon frequencies for a chunk of parsed proteins.
+    Each protein counts once per taxon (and once per RefSeq taxon).  The
+    lookups are done here in the main process: forked workers reading the
+    large mapping dictionary would write to its pages (reference counts)
+    and each end up with a private copy of much of it.
+    Returns (taxon_freq, reftax_freq, prot, spec_prot, ref_prot, undef_gi,
+    lookups).
+    """
+    taxon_freq = Counter()
+    reftax_freq = Counter()
+    spec_prot = 0
+    ref_prot = 0
+    undef_gi = 0
+    lookups = 0
+    for accessions in proteins:
+        taxa = {}       # dictionaries keep first-seen order
+        reftaxa = {}
+        for acc in accessions:
+            tax = acc_to_taxon.get(acc, -1)
+            lookups += 1
+            if tax == -1:
+                undef_gi += 1
+            taxa[tax] = None
+            if '_' in acc:  # according to NCBI underscore char only in RefSeq
+                reftaxa[tax] = None
+        spec_prot += len(taxa)
+        ref_prot += len(reftaxa)
+        taxon_freq.update(taxa.keys())
+        reftax_freq.update(reftaxa.keys())
+    return taxon_freq, reftax_freq, len(proteins), spec_prot, ref_prot, undef_gi, lookups
+
+
+@fasta_lib.profile_entry
+def main(db, folder, resume=False):
     """Fetches and analyzes the species names in the ncbi nr fasta database.
 
     Arguments:
     "nr_folder" is the full path name where "nr.gz" will be.  No return values.
+    If "resume" is set, the scan restarts from the last checkpoint (if any).
 
     Saves the main lookup dictionary and a summary text file that
     can be loaded into EXCEL or a word processor.
@@ -58,6 +119,7 @@ def main(db, folder):
     log_obj = open(os.path.join(folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: nr_get_analyze.py', log_obj)
+    metrics = fasta_lib.RunMetrics('nr_get_analyze.py', log_obj)
 
     # make sure the files are present or download if not
     fasta_lib.download_ncbi(folder)
@@ -72,43 +134,63 @@ def main(db, folder):
     # make the taxon frequency dictionary for the proteins in nr.gz
     nr_name = os.path.split(folder)[1] + '.gz'
     for obj in write:
-        print('...processing %s (this takes a few hours...)' % (nr_name,), file=obj)
-    taxon_freq = {}
-    reftax_freq = {}
+        print('...processing %s with %s workers (this can take a while...)' % (nr_name, NUM_WORKERS or os.cpu_count()), file=obj)
+    taxon_freq = Counter()
+    reftax_freq = Counter()
     prot = 0
     spec_prot = 0
     ref_prot = 0
     undef_gi = 0
-    fasta_file = gzip.open(os.path.join(folder, nr_name), mode='rt')
-    while True:
-        line = fasta_file.readline()
-        if not line:
-            break
-        else:
-            line = line.rstrip()
-        if line.startswith('>'):
-            prot += 1
-            chunk = 1000000
-            if (prot % chunk) == 0:
-                print('......(%s proteins read)' % ("{0:,d}".format(prot),))
-            tax_list = []
-            reftax_list = []
-            for header in line[1:].split(chr(1)):   # need to remove the leading ">" character
-                acc_ver = header.split()[0]
-                acc = acc_ver.split('.')[0]
-                tax = acc_to_taxon.get(acc, -1)
-                if tax == -1:
-                    undef_gi += 1
-                if tax  not in tax_list:
-                    spec_prot += 1
-                    tax_list.append(tax)
-                if '_' in acc and tax not in reftax_list:   # according to NCBI underscore char only in RefSeq
-                    ref_prot +=1
-                    reftax_list.append(tax)
-            for tax in tax_list:
-                fasta_lib.add_or_increment(tax, taxon_freq)
-            for reftax in reftax_list:
-                fasta_lib.add_or_increment(reftax, reftax_freq)
+
+    # checkpoints are saved periodically so a long scan can be resumed
+    nr_path = os.path.join(folder, nr_name)
+    checkpoint = fasta_lib.Checkpoint(os.path.join(folder, 'nr_get_analyze.checkpoint'), nr_path)
+    offset = 0
+    saved = checkpoint.load() if resume else None
+    if saved:
+        state = saved['state']
+        offset = state['offset']
+        taxon_freq, reftax_freq = state['taxon_freq'], state['reftax_freq']
+        prot, spec_prot = state['prot'], state['spec_prot']
+        ref_prot, undef_gi = state['ref_prot'], state['undef_gi']
+        for obj in write:
+            print('...resuming from checkpoint after %s proteins' % ("{0:,d}".format(prot),), file=obj)
+
+    # one reader process feeds header chunks to the parsing workers and the
+    # taxon lookups are counted here. Chunk results come back in file order
+    # so the totals (and the output file) are the same as a serial pass.
+    workers = NUM_WORKERS or os.cpu_count() or 1
+    chunks = header_chunks(nr_path, offset)
+    pool = None
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        gc.freeze()     # (workers' garbage collections leave inherited objects alone)
+        pool = multiprocessing.get_context('fork').Pool(workers)
+        gc.unfreeze()
+        results = pool.imap(parse_chunk, chunks)
+    else:
+        results = map(parse_chunk, chunks)
+    chunk = 1000000
+    metrics.start_stage(nr_name, None, prot)
+    for (proteins, next_offset) in results:
+        (chunk_taxon, chunk_reftax, chunk_prot, chunk_spec, chunk_ref, chunk_undef,
+         lookups) = count_chunk(proteins, acc_to_taxon)
+        metrics.add('taxon_lookups', lookups)
+        if ((prot + chunk_prot) // chunk) > (prot // chunk):
+            metrics.progress(prot + chunk_prot)
+        taxon_freq.update(chunk_taxon)
+        reftax_freq.update(chunk_reftax)
+        prot += chunk_prot
+        spec_prot += chunk_spec
+        ref_prot += chunk_ref
+        undef_gi += chunk_undef
+        if next_offset and checkpoint.due():
+            checkpoint.save({'offset': next_offset, 'taxon_freq': taxon_freq, 'reftax_freq': reftax_freq,
+                             'prot': prot, 'spec_prot': spec_prot, 'ref_prot': ref_prot,
+                             'undef_gi': undef_gi})
+    if pool:
+        pool.close()
+        pool.join()
+    metrics.end_stage(prot)
 
     # make the name frequency dictionary from the taxon frequency dictionary
     name_freq = {}
@@ -134,13 +216,18 @@ def main(db, folder):
         print('...%s entries had undefined taxon ID numbers...' % ("{0:,d}".format(undef_gi),), file=obj)
         print('...there were', "{0:,d}".format(len(name_freq)), 'species names...', file=obj)
 
+    checkpoint.remove()
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: nr_get_analyze.py', log_obj)
     log_obj.close()
     return
 
 
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # get the path to nr.gz and call main function to download, etc.
+    # ("--resume" restarts an interrupted scan from its last checkpoint)
+    resume = fasta_lib.resume_flag(sys.argv)
 
     # check if nr.gz file path is passed on command line
     if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
@@ -156,7 +243,7 @@ if __name__ == '__main__':
 
     # if folder name starts with 'nr_', then skip creating a new folder
     if os.path.split(selection)[1].startswith('nr_'):
-        main('nr', selection)
+        main('nr', selection, resume)
 
     # otherwise create a new folder with date stamp
     else:
@@ -165,6 +252,6 @@ if __name__ == '__main__':
         folder = os.path.join(selection, 'nr_'+curr_date)
         if not os.path.exists(folder):
             os.mkdir(folder)
-        main('nr', folder)
+        main('nr', folder, resume)
 
 # end
@@ -0,0 +1,164 @@
+"""'proteome_batch.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# headless (no GUI) downloads for the UniProt and Ensembl proteome managers
+
+import os
+import sys
+import time
+import json
+import ftplib
+import argparse
+import fasta_lib
+import proteome_engine
+
+# defaults for the processing steps
+MAKE_TARGET = False     # target sequences with contaminants
+MAKE_DECOY = True       # concatenated target/decoy sequences with contaminants
+
+
+def download(engine, species_file, folder, contams, target, decoy, downloads, processes, summary):
+    """Finds the species in the catalog and runs the download pipeline.
+        Results are saved in the "summary" dictionary.
+    """
+    engine.contams_database = contams
+    engine.logout()
+
+    # find the species to download
+    entries, not_found = engine.entries_for_species(species_file)
+    summary['requested'] = len(entries) + len(not_found)
+    summary['not_found'] = [str(x) if not isinstance(x, tuple) else '%s (%s)' % x for x in not_found]
+    for item in summary['not_found']:
+        print('...WARNING: %s is not in the current catalog' % (item,))
+    print('...%s of %s species found in the catalog' %
+          ("{0:,d}".format(len(entries)), "{0:,d}".format(summary['requested'])))
+
+    # download and process in parallel
+    download_path = engine.make_download_folder(folder)
+    summary['folder'] = download_path
+    jobs = engine.download_jobs(entries, download_path, target, decoy)
+    pipeline = fasta_lib.DownloadPipeline(fasta_lib.Downloader(workers=downloads), processes)
+    pipeline.run(jobs)
+    summary['completed'] = list(pipeline.completed)
+    summary['failed'] = list(pipeline.failed)
+    return
+
+@fasta_lib.profile_entry
+def main(database, species_file, folder, all_files=False, target=MAKE_TARGET, decoy=MAKE_DECOY,
+         contams=None, downloads=proteome_engine.DOWNLOADS, processes=None):
+    """Downloads and processes the proteomes listed in a species file without the GUI.
+        "database" is "uniprot" or "ensembl". "species_file" is a saved species
+        list from the matching manager (or one taxonomy number per line for
+        UniProt). Files go into a release folder inside "folder". "all_files"
+        adds the UniProt additional (isoform) sequences. Returns a summary
+        dictionary.
+    """
+    print('=============================================================')
+    print(' proteome_batch.py, v.1.0.0, fasta_utilities, OHSU, 2026 ')
+    print('=============================================================')
+
+    start = time.time()
+    script_path = os.path.dirname(os.path.realpath(__file__))
+    contams = contams or os.path.join(script_path, proteome_engine.DEFAULT_CONTAMS)
+    summary = {'database': database, 'species_file': os.path.abspath(species_file),
+               'release': None, 'folder': None, 'requested': 0, 'not_found': [],
+               'completed': [], 'failed': [], 'error': None, 'seconds': 0.0}
+
+    # load (or refresh) the catalog
+    try:
+        if database == 'uniprot':
+            banned = list(proteome_engine.UNIPROT_BANNED)
+            if all_files:
+                banned.remove('additional')
+            engine = proteome_engine.UniProtEngine(proteome_engine.UNIPROT_URL, proteome_engine.REF_PROT_PATH,
+                                                   proteome_engine.KINGDOM_PATHS, banned,
+                                                   script_path, proteome_engine.DEFAULT_CONTAMS)
+            engine.parse_README()
+            summary['release'] = engine.date
+        else:
+            text = proteome_engine.EnsemblEngine.fetch_species_page()
+            engine = proteome_engine.EnsemblEngine(proteome_engine.ENSEMBL_URL, proteome_engine.PROT_PATH, text,
+                                                   proteome_engine.ENSEMBL_BANNED,
+                                                   script_path, proteome_engine.DEFAULT_CONTAMS)
+            engine.create_raw_table()
+            engine.parse_raw_table()
+            summary['release'] = engine.version
+    except (SystemExit, ValueError) + ftplib.all_errors as err:
+        summary['error'] = 'catalog could not be loaded (%s)' % (err,)
+        summary['seconds'] = round(time.time() - start, 1)
+        return summary
+
+    # the summary is always returned (and written), even if something fails
+    try:
+        download(engine, species_file, folder, contams, target, decoy, downloads, processes, summary)
+    except Exception as err:
+        summary['error'] = 'batch run failed (%s: %s)' % (type(err).__name__, err)
+        print('...WARNING: %s' % (summary['error'],))
+    summary['seconds'] = round(time.time() - start, 1)
+    return summary
+
+
+# setup stuff: check for command line args, etc.
+if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    parser = argparse.ArgumentParser(description='Downloads UniProt or Ensembl proteomes without the GUI. '
+                                     'A JSON summary is the last line of output.')
+    parser.add_argument('database', choices=['uniprot', 'ensembl'], help='which proteome site to use')
+    parser.add_argument('species_file', help='species list file saved by the proteome manager')
+    parser.add_argument('-f', '--folder', dest='folder', default=os.getcwd(),
+                        help='parent folder for the downloads (default: current folder)')
+    parser.add_argument('-a', '--all', dest='all_files', action='store_true', default=False,
+                        help='also get UniProt additional (isoform) sequences')
+    parser.add_argument('-t', '--target', dest='target', action='store_true', default=MAKE_TARGET,
+                        help='make target sequences with contaminants')
+    parser.add_argument('-d', '--no-decoy', dest='decoy', action='store_false', default=MAKE_DECOY,
+                        help='do not make concatenated target/decoy sequences with contaminants')
+    parser.add_argument('-c', '--contams', dest='contams', default=None,
+                        help='contaminants FASTA file (default: %s)' % proteome_engine.DEFAULT_CONTAMS)
+    parser.add_argument('-n', '--downloads', dest='downloads', type=int, default=proteome_engine.DOWNLOADS,
+                        help='number of simultaneous downloads')
+    parser.add_argument('-p', '--processes', dest='processes', type=int, default=None,
+                        help='number of processing workers (default: all cores)')
+    parser.add_argument('-s', '--summary', dest='summary', default=None,
+                        help='also write the JSON summary to this file')
+    args = parser.parse_args()
+
+    try:
+        summary = main(args.database, args.species_file, args.folder, args.all_files, args.target, args.decoy,
+                       args.contams, args.downloads, args.processes)
+    except Exception as err:    # anything unexpected still gets a summary
+        summary = {'database': args.database, 'species_file': os.path.abspath(args.species_file),
+                   'completed': [], 'failed': [], 'error': 'batch run failed (%s: %s)' % (type(err).__name__, err)}
+    text = json.dumps(summary, sort_keys=True)
+    if args.summary:
+        with open(args.summary, 'w') as fout:
+            print(text, file=fout)
+    print(text)
+    sys.exit(1 if (summary['error'] or summary['failed']) else 0)
+
+# end
@@ -0,0 +1,988 @@
+"""'proteome_engine.py' part of the fasta_utilities collection, OHSU.
+
+The MIT License (MIT)
+
+Copyright (c) 2017 Phillip A. Wilmarth and OHSU
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Direct questions to:
+Technology & Research Collaborations, Oregon Health & Science University,
+Ph: 503-494-8200, FAX: 503-494-4729, Email: techmgmt@ohsu.edu.
+"""
+# Non-GUI parts of UniProt_reference_proteome_manager.py and
+# Ensembl_proteome_manager.py: catalogs, filtering, downloading and
+# processing. Used by the GUIs and by proteome_batch.py (no tkinter here).
+
+# Built-in module imports
+import os
+import sys
+import time
+import ftplib
+import re
+import ast
+import functools
+import threading
+import concurrent.futures
+import urllib.request
+
+# Imports dependent on other files
+# This module only uses built-in modules, no external downloads required
+import fasta_lib
+import Ensembl_fixer
+import reverse_fasta
+
+# UniProt site information
+UNIPROT_URL = 'ftp.uniprot.org'
+REF_PROT_PATH = '/pub/databases/uniprot/current_release/knowledgebase/reference_proteomes/'
+KINGDOM_PATHS = ('Archaea', 'Bacteria', 'Eukaryota', 'Viruses')
+UNIPROT_BANNED = ["DNA", "gene2acc", "idmapping", "additional"]
+
+# Ensembl site information
+ENSEMBL_URL = 'ftp.ensembl.org'
+PROT_PATH = '/pub/current_fasta'
+PARSE_URL = r'http://www.ensembl.org/info/about/species.html'
+ENSEMBL_BANNED = ["README", "CHECKSUMS", "abinitio.fa.gz"]
+
+DEFAULT_CONTAMS = 'Thermo_contams.fasta'
+
+# Number of simultaneous FTP connections used to walk the proteome folders
+FTP_CONNECTIONS = 8
+# Version of the saved catalog formats (change if the entry fields change)
+CATALOG_VERSION = 1
+# Number of simultaneous database downloads (FASTA processing uses all cores)
+DOWNLOADS = 3
+
+# Helper Classes
+class FTPListingPool:
+    """Fetches FTP directory listings concurrently over a bounded set of connections.
+
+    Each worker thread keeps its own logged-in FTP connection. Failed
+    listings reconnect and retry with an increasing wait.
+
+    methods:
+        list_dir(path): returns the LIST lines for "path" (None if failed)
+        list_dirs(paths): returns a dictionary of path to LIST lines
+        close(): closes all of the FTP connections
+    """
+    def __init__(self, url, connections=4, retries=5, timeout=60.0):
+        """Create object and set some state attributes."""
+        self.url = url                  # Url of FTP site
+        self.connections = connections  # Maximum number of simultaneous FTP connections
+        self.retries = retries          # Number of retries for each listing
+        self.timeout = timeout          # Socket timeout (seconds)
+        self._local = threading.local() # Holds each thread's FTP connection
+        self._lock = threading.Lock()
+        self._all_ftp = []              # Every connection made (for closing)
+
+    def _connect(self):
+        """Returns this thread's FTP connection, logging in if needed."""
+        ftp = getattr(self._local, 'ftp', None)
+        if ftp is None:
+            ftp = ftplib.FTP(timeout=self.timeout)
+            try:
+                ftp.connect(str(self.url))
+                ftp.login()
+            except BaseException:   # (530 too many users, etc.)
+                ftp.close()
+                raise
+            self._local.ftp = ftp
+            with self._lock:
+                self._all_ftp.append(ftp)
+        return ftp
+
+    def _drop(self):
+        """Closes this thread's (broken) FTP connection."""
+        ftp = getattr(self._local, 'ftp', None)
+        self._local.ftp = None
+        if ftp is not None:
+            try:
+                ftp.close()
+            except Exception:
+                pass
+
+    def list_dir(self, path):
+        """Returns the LIST lines for "path" or None if all retries fail."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(2 ** (attempt - 1), 30))  # back off: 1, 2, 4, ... seconds
+                print('......fetching listing %s retry: %d' % (path, attempt))
+            listing = []
+            try:
+                ftp = self._connect()
+                ftp.cwd(path)
+                ftp.retrlines('LIST', listing.append)
+                return listing
+            except ftplib.error_perm as err:
+                if str(err).startswith('550'):
+                    return None     # missing folder, retrying will not help
+                self._drop()        # 530 (too many connections, login), etc. can clear up
+            except (ftplib.all_errors + (EOFError,)):
+                self._drop()
+        return None
+
+    def list_dirs(self, paths):
+        """Returns a dictionary of path to LIST lines (None for failures)."""
+        listings = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.connections) as executor:
+            for path, listing in zip(paths, executor.map(self.list_dir, paths)):
+                listings[path] = listing
+        return listings
+
+    def close(self):
+        """Closes all of the FTP connections."""
+        with self._lock:
+            all_ftp, self._all_ftp = self._all_ftp, []
+        for ftp in all_ftp:
+            try:
+                ftp.quit()
+            except Exception:
+                try:
+                    ftp.close()
+                except Exception:
+                    pass
+# end class
+
+class ReadMeEntry:
+    """Container for data parsed from README table rows.
+    """
+    # Regular expression for parsing README table rows       
+    parser = re.compile('^(\S+)\s([0-9]+)\s(.+?)\s+([0-9]+)\s+([0-9]+)\s+([0-9]+)\s+(.*)$')
+        
+    # List of characters that cannot be in folder names
+    illegal_pattern = r"[\\#%&{}/<>*?:]"
+
+    # Attributes saved in the catalog cache
+    fields = ('kingdom', 'proteome_ID', 'tax_ID', 'oscode', 'main_fasta', 'additional_fasta',
+              'gene2acc', 'species_name', 'short_name', 'ftp_download_list', 'ftp_file_path')
+
+    def __init__(self, line_entry):
+        """Create placeholders for variables and then parse the line"""
+        self.kingdom = ""                           # Major phylogenic categories
+        self.proteome_ID = ""                       # UniProt refence proteome designation
+        self.tax_ID = ""                            # NCBI taxonomy number
+        self.oscode = ""                            # UniProt OSCODE string
+        self.main_fasta = ""                        # Number of entries in the main fasta file
+        self.additional_fasta = ""                  # Number of entries in the additional fasta file
+        self.gene2acc = ""                          # Number of entries in the gene2acc file
+        self.species_name = ""                      # Latin species name
+        self.short_name = ""                        # Shortened species name with underscores
+        self.ftp_download_list = []                 # FTP downloadable files for each species
+        self.ftp_file_path = ""                     # Kingdom branch path at FTP site
+        self.download_folder_name = ""              # More descriptive folder name to hold download files
+
+        if line_entry is not None:
+            self.set_attributes(line_entry)  # Populate object attributes
+            self.make_short_name()            # Makes some shorter species names
+
+    def to_dict(self):
+        """Returns the attributes to save in the catalog cache."""
+        return {field: getattr(self, field) for field in self.fields}
+
+    @classmethod
+    def from_dict(cls, values):
+        """Makes an entry from a catalog cache dictionary."""
+        entry = cls(None)
+        for field in cls.fields:
+            setattr(entry, field, values[field])
+        return entry
+
+    # Parse README table line
+    def set_attributes(self, line):
+        """Parse attributes from table line."""
+        m = self.parser.match(line)
+
+        # This can be used to skip over rows before or after the main table
+        if not m:   
+            raise ValueError('Invalid line')
+
+        # Get the matching groups and load attributes
+        groups = m.groups()
+        self.proteome_ID = groups[0]
+        self.tax_ID = groups[1]
+        self.oscode = groups[2]
+        self.main_fasta = groups[3]
+        self.additional_fasta = groups[4]
+        self.gene2acc = groups[5]
+        self.species_name = groups[6]
+
+    def make_short_name(self):
+        """To get a shorter species name to add to download filenames.
+
+        Pattern is one or more words with capital first letter and one
+        lower-case word.
+        """
+        m = re.match(r"([A-Z][a-z]+\s)+[a-z]+", self.species_name)
+        if m:
+            self.short_name = re.sub(r"\s", "_", m.group())
+            if self.short_name.endswith('_sp'):
+                self.short_name = self.short_name[:-3]
+                
+    def make_folder_name(self, date, dash=True):
+        """ This function will remove any characters from the species
+        name that are in the remove characters list, and make a folder name
+        with date, proteome ID, and fixed species name.
+        """
+        # Remove invalid folder name characters
+        fixed_name = re.sub(self.illegal_pattern, " ", self.species_name).strip()
+        if dash:
+            fixed_name = fixed_name.replace(" ", "-")
+        else:
+            fixed_name = fixed_name.replace(" ", "_")
+
+        # Make the local download folder name
+        self.download_folder_name = '_'.join([date, self.proteome_ID, fixed_name])
+
+    def _snoop(self):
+        """Diagnostic print of attributes."""
+        print('kingdom:', self.kingdom)
+        print('proteome ID:', self.proteome_ID)
+        print('tax ID:', self.tax_ID)
+        print('Oscode:', self.oscode)
+        print('Fasta entries:', self.main_fasta)
+        print('Additional entries:', self.additional_fasta)
+        print('Gene To Acc entries:', self.gene2acc)
+        print('species name:', self.species_name)
+        print('short name:', self.short_name)
+        print('download list:', self.ftp_download_list)
+        print('ftp file path:', self.ftp_file_path)
+        print('download folder name:', self.download_folder_name)         
+    
+class AnimalEntry:
+    """Container for Ensembl proteome entries."""
+    # Attributes saved in the catalog cache (constructor arguments first)
+    fields = ('common_name', 'latin_name', 'tax_ID', 'ensembl_assembly', 'accession', 'genebuild_method',
+              'variation_database', 'reg_database', 'pre_assembly', 'folder_name', 'ftp_file_path')
+
+    def __init__(self, c_n, l_n, taxid, e_a, acc, g_m, v_d, r_d, p_a):
+        """Basic constructor - sets most attributes."""
+        self.common_name = c_n          # Species Common Name (string)
+        self.latin_name = l_n           # Species Latin Name (string)
+        self.tax_ID = taxid             # Taxonomy ID Number (int)
+        self.ensembl_assembly = e_a     # Ensembl assembly (string?)
+        self.accession = acc            # Ensembl accession
+        self.genebuild_method = g_m     # Gene build method
+        self.variation_database = v_d   # Variation database name
+        self.reg_database = r_d         # Regular database
+        self.pre_assembly = p_a         # Pre-assembly information
+        self.folder_name = ""           # Folder Name for each species
+        self.ftp_file_path = ""         # Species ftp download path
+
+    def to_dict(self):
+        """Returns the attributes to save in the catalog cache."""
+        return {field: getattr(self, field) for field in self.fields}
+
+    @classmethod
+    def from_dict(cls, values):
+        """Makes an entry from a catalog cache dictionary."""
+        entry = cls(*[values[field] for field in cls.fields[:9]])
+        entry.folder_name = values["folder_name"]
+        entry.ftp_file_path = values["ftp_file_path"]
+        return entry
+
+    def _dump(self):
+        """Diagnostic dump"""
+        print('\ncommon name:', self.common_name)
+        print('latin name:', self.latin_name)
+        print('tax ID:', self.tax_ID)
+        print('assembly:', self.ensembl_assembly)
+        print('accession:', self.accession)
+        print('gene build method:', self.genebuild_method)
+        print('variation DB:', self.variation_database)
+        print('regular DB:', self.reg_database)
+        print('pre-assembly:', self.pre_assembly)
+        print('folder:', self.folder_name)
+        print('ftp file path:', self.ftp_file_path)
+
+def read_species_file(species_file):
+    """Reads a species list file (like "default_UniProt_species.txt").
+    Each line is a saved display row (a Python list) or just a taxonomy number.
+    Returns list of rows (lists).
+    """
+    rows = []
+    with open(species_file, 'r') as fin:
+        for line in fin:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            row = ast.literal_eval(line)
+            if not isinstance(row, (list, tuple)):
+                row = [row]
+            rows.append(list(row))
+    return rows
+
+# Processing functions (run in worker processes)
+def uniprot_make_fasta_files(uniprot_dir_path, download_folder, fasta_files, short_name,
+                             proteome_ID, species_name, forward, both, contams_database):
+    """Uncompresses canonical FASTA file and does some analysis. Also
+    combines fasta and additional fasta files with decompression.
+    Adds contaminants and decoys if "forward" or "both" (see reverse_fasta.py).
+    """
+    # Make the output file names
+    combined_files = []
+    fasta_file = fasta_files[0].replace('.fasta.gz', '')
+    fasta_file = fasta_file + '_' + short_name + '_canonical.fasta'
+    combined_files.append(fasta_file)
+    fasta_obj_list = [open(os.path.join(uniprot_dir_path, fasta_file), 'w')]
+    if len(fasta_files) == 2:
+        fasta_file = fasta_files[1].replace('_additional.fasta.gz', '')
+        fasta_file = fasta_file + '_' + short_name + '_all.fasta'
+        fasta_obj_list.append(open(os.path.join(uniprot_dir_path, fasta_file), 'w'))
+        combined_files.append(fasta_file)
+
+    # Set up to read the fasta file entries and init counters
+    print('proteome:', proteome_ID, 'species:', species_name)
+    p = fasta_lib.Protein()
+
+    # Read entries and write to new file
+    for i, fasta in enumerate(fasta_files):
+        sp_count = 0
+        iso_count = 0
+        tr_count = 0
+        p_count = 0
+        f = fasta_lib.FastaReader(os.path.join(download_folder, fasta))
+        while f.readNextProtein(p, False):
+            p_count += 1
+            if p.accession.startswith('sp|'):
+                sp_count += 1
+            if p.accession.startswith('tr|'):
+                tr_count += 1
+            if ('-' in p.accession) or ('Isoform of' in p.description):
+                iso_count += 1
+            if i == 0:
+                for obj in fasta_obj_list:
+                    p.printProtein(obj)
+            else:
+                p.printProtein(fasta_obj_list[i])
+
+        # Print stats
+        print('...database:', fasta)
+        print('......tot_count: %s, sp count: %s, tr count: %s, isoform count: %s' %
+              ("{0:,}".format(p_count), "{0:,}".format(sp_count),
+               "{0:,}".format(tr_count), "{0:,}".format(iso_count)))
+
+    # Close output file(s)
+    for obj in fasta_obj_list:
+        obj.close()
+
+    # Add forward/reverse/contams
+    if forward or both:
+        for file in combined_files:
+            reverse_fasta.main(os.path.join(uniprot_dir_path, file), forward, False, both,
+                               contam_path=contams_database)
+    return '{} is done'.format(species_name)
+
+def ensembl_process_databases(fasta_file, forward, both, contams_database):
+    """Adds contaminants and decoys to a fixed FASTA file if "forward" or "both".
+    More documentation on how reverse_fasta works can be found in the reverse_fasta.py file.
+    """
+    if forward or both:
+        print('contams:', contams_database)
+        reverse_fasta.main(fasta_file, forward, False, both, contam_path=contams_database)
+    return '{} is done'.format(os.path.basename(fasta_file))
+
+class UniProtEngine:
+    """Catalog, selection, and download logic for the UniProt reference proteomes.
+    The GUI in UniProt_reference_proteome_manager.py builds on this class.
+    """
+    def __init__(self, url, ref_prot_path, kingdom_paths, banned_list, script_path, default_contams):
+        """Create object and set some state attributes."""
+        self.url = url                          # Url of UniProt FTP site
+        self.ftp = None                         # FTP object (set in login method)
+        self.ref_prot_path = ref_prot_path      # Specifies top level directory of the Uniprot ftp database
+        self.kingdom_paths = kingdom_paths      # List of directory names where files are located (kingdoms)
+        self.all_entries = []                   # List of selected entry object attributes
+        self.banned_full = banned_list          # Full ist of extra file patterns to be skipped when downloading
+        self.banned_list = banned_list          # List of extra file patterns to be skipped when downloading
+        self.date = ""                          # This should be a UniProt version (i.e. 2017.07 for July, 2017 release)        
+        self.script_path = script_path          # Path location of script
+        self.contams_database = os.path.join(self.script_path, default_contams)
+        self.data = None                        # Data from catalog cache (UniProt reference proteome entries and release date)
+        self.catalog = fasta_lib.CatalogCache(os.path.join(script_path, 'UniProt_current_release.json'),
+                                              CATALOG_VERSION)
+        self.kingdom_listings = {}              # Proteome folder listing lines for each kingdom
+        self.folder_files = {}                  # Proteome file names for each proteome folder
+        self.pipeline = None                    # Background download and processing pipeline
+
+    def fatal(self, message):
+        """Stops the program after a connection failure."""
+        print('...FATAL:', message)
+        sys.exit(1)
+
+    # FTP support
+    def login(self):
+        """Open an FTP connection and login."""
+        self.ftp = ftplib.FTP()
+        self.ftp.connect(str(self.url))
+        self.ftp.login()
+
+    def logout(self):
+        """Close the FTP connection."""
+        try:
+            self.ftp.quit()
+        except:
+            pass # Catch error if no FTP connection to close (already timed out)
+
+    def _fetch_README(self):
+        """fetches the README file from FTP site with error testing and retries.
+        Has a hard failure if file cannot be downloaded."""
+        retry = 0
+        listing = []
+        while retry < 10:
+            try:
+                self.login()
+                self.ftp.cwd(self.ref_prot_path)  # move into README file location
+                self.ftp.retrlines('RETR README', listing.append)
+                print('...README was retrieved OK')
+                return listing
+            except:
+                # wait 15 seconds and retry
+                time.sleep(15)
+                retry += 1
+                print('...fetching README retry:', retry)
+
+        # ftp connection not working so terminate
+        if retry == 10:
+            self.fatal('unable to make FTP connection. Try again later.')
+
+    # ReadMeEntry support         
+    def readme_stamp(self):
+        """Gets the README modification time and size (a cheap check for a new release)."""
+        try:
+            self.login()
+            self.ftp.cwd(self.ref_prot_path)
+        except ftplib.all_errors:
+            return None
+        return fasta_lib.ftp_file_stamp(self.ftp, 'README')
+
+    def load_all_entries(self, stamp):
+        """Loads reference proteome entries from the catalog cache.
+        If the cache does not exist or the README "stamp" changed, returns False.
+        """
+        # get data from cache file (kept for an incremental refresh)
+        self.data = self.catalog.load()
+        if not self.data:
+            return False
+
+        # if the README has not changed, then load entries from cache file
+        if stamp and stamp == self.data["Stamp"]:
+            self.date = self.data["Date"]
+            self.all_entries = [ReadMeEntry.from_dict(x) for x in self.data["Entries"]]
+            self.kingdom_listings = self.data["Listings"]
+            self.folder_files = self.data["Folders"]
+            print('...catalog for release %s is current' % self.date)
+            return True
+        else:
+            return False
+        
+    def save_entries(self, stamp):
+        """Saves list of all entry objects (reference proteomes) and the kingdom
+        listings into the catalog cache (the current release only, updated monthly).
+        """
+        self.catalog.save({"Date": self.date, "Stamp": stamp, "Listings": self.kingdom_listings,
+                           "Folders": self.folder_files,
+                           "Entries": [entry.to_dict() for entry in self.all_entries]})
+
+    def parse_README(self):
+        """Fetches the README file and parses the table in "ReadMeEntry" objects.
+        A new release only refreshes the proteome folders whose listings changed.
+        """
+        # Try to load entry objects from cache file unless the README changed
+        stamp = self.readme_stamp()
+        if self.load_all_entries(stamp):
+            return     # exits here if cached entries were OK
+
+        # get the release version information
+        listing = self._fetch_README()
+        for line in listing:
+            if "release" in line.lower():
+                version = line.replace(',', '')
+                version = version.replace('_', '.')
+                self.date = version.split()[1]
+
+        # README was touched but the release is the same
+        if self.data and self.data["Date"] == self.date:
+            self.all_entries = [ReadMeEntry.from_dict(x) for x in self.data["Entries"]]
+            self.kingdom_listings = self.data["Listings"]
+            self.folder_files = self.data["Folders"]
+            self.save_entries(stamp)
+            return
+        
+        # Find and parse the table
+##        header_index = listing.index('Proteome_ID Tax_ID  OSCODE     #(1)    #(2)    #(3)  Species Name')
+        header_index = listing.index('Proteome_ID	Tax_ID	OSCODE	SUPERREGNUM	#(1)	#(2)	#(3)	Species Name')
+        for line in listing[header_index:]:
+            try:
+                entry = ReadMeEntry(line)
+            except ValueError:
+                continue
+            self.all_entries.append(entry)
+
+        # Add the kingdom categories and download file lists
+        self.get_kingdoms(self.data)
+
+        # save the entry list
+        self.save_entries(stamp)
+
+    def get_kingdoms(self, previous=None):
+        """Walks the kingdom FTP pages and sets additional entry attributes.
+        Directory listings are fetched concurrently over a small pool of FTP connections.
+        Proteome folders that are unchanged since the "previous" catalog are not listed again.
+        """
+        # folder listings and file lists from the previous catalog
+        old_listings = previous["Listings"] if previous else {}
+        old_files = previous["Folders"] if previous else {}
+
+        pool = FTPListingPool(self.url, FTP_CONNECTIONS)
+        try:
+            # get the proteome subfolder listings for each kingdom
+            kingdom_listings = pool.list_dirs([self.ref_prot_path + kingdom for kingdom in self.kingdom_paths])
+            subdir_paths = []
+            self.kingdom_listings = {}
+            for kingdom in self.kingdom_paths:
+                kingdom_path = self.ref_prot_path + kingdom
+                listing = kingdom_listings[kingdom_path]
+
+                # ftp connection not working so terminate
+                if listing is None:
+                    self.fatal('unable to make FTP connection. Try again later.')
+                print('...%s listing was retrieved OK' % kingdom)
+                self.kingdom_listings[kingdom] = {}
+                for line in listing:
+                    subdir = line.strip().split()[-1] # Get the subfolder name
+                    self.kingdom_listings[kingdom][subdir] = line.strip()
+                    subdir_paths.append((kingdom, subdir, kingdom_path + '/' + subdir))
+
+            # get the file list for every new or changed proteome subfolder
+            changed = [path for (kingdom, subdir, path) in subdir_paths
+                       if (old_listings.get(kingdom, {}).get(subdir) != self.kingdom_listings[kingdom][subdir])
+                       or (path not in old_files)]
+            print('...fetching %s of %s proteome listings with %s connections' %
+                  ("{0:,d}".format(len(changed)), "{0:,d}".format(len(subdir_paths)), FTP_CONNECTIONS))
+            subdir_listings = pool.list_dirs(changed)
+        finally:
+            pool.close()
+
+        # get the actual proteome file names of interest
+        entry_dict = {entry.proteome_ID: entry for entry in self.all_entries}
+        kingdom_counts = {kingdom: 0 for kingdom in self.kingdom_paths}
+        self.folder_files = {}
+        for (kingdom, subdir, path) in subdir_paths:
+            if path in subdir_listings:
+                listing = subdir_listings[path]
+                if listing is None:
+                    print('......WARNING: proteome listing %s could not be fetched' % path)
+                    continue
+                proteome = {} # holds file names for each proteome in the subfolder
+                for line in listing:
+                    line = line.strip() # Want last item, so strip EOL
+                    fname = line.split()[-1] # Get the file name
+                    if fname.split('_')[0].startswith('UP'):
+                        key = fname.split('_')[0]   # Parse the reference proteome string
+                        proteome.setdefault(key, []).append(fname)
+            else:
+                proteome = old_files[path]  # unchanged since last time
+            self.folder_files[path] = proteome
+
+            # Save all filenames and the FTP folder for each species
+            for key, fnames in proteome.items():
+                entry = entry_dict.get(key)
+                if entry:
+                    entry.ftp_download_list = list(fnames)
+                    entry.kingdom = kingdom
+                    entry.ftp_file_path = path  # save file path in new variable
+                    kingdom_counts[kingdom] += 1
+
+        for kingdom in self.kingdom_paths:
+            print(kingdom, 'count is', kingdom_counts[kingdom])
+
+        return
+
+    # selection and download support
+    def select_entries(self, kingdoms, tax_entry='', species_entry=''):
+        """Returns entries in the "kingdoms" whose taxonomy number contains
+        "tax_entry" and whose species name contains "species_entry".
+        """
+        selected = [entry for entry in self.all_entries if entry.kingdom in kingdoms]
+        selected = [entry for entry in selected if tax_entry in entry.tax_ID]
+        species_entry = species_entry.lower()
+        return [entry for entry in selected if species_entry in entry.species_name.lower()]
+
+    def entries_for_species(self, species_file):
+        """Returns (entries, missing taxonomy numbers) for a species list file."""
+        tax_ids = [int(row[0]) for row in read_species_file(species_file)]
+        tax_ids = sorted(set(tax_ids), key=tax_ids.index)
+        entries = [entry for entry in self.all_entries if int(entry.tax_ID) in tax_ids]
+        found = set(int(entry.tax_ID) for entry in entries)
+        return entries, [tax for tax in tax_ids if tax not in found]
+
+    def banned_file(self, fname):
+        """False if fname in banned list."""
+        skip = False
+        for ban in self.banned_list:
+            if ban.lower() in fname.lower():
+                skip = True
+        return skip
+
+    def download_jobs(self, download_entries, uniprot_dir_path, forward, both):
+        """Makes one pipeline job per species: its files and the processing step arguments."""
+        # Add normalized folder name attribute
+        [entry.make_folder_name(self.date) for entry in download_entries]
+
+        jobs = []
+        for entry in download_entries:
+            # Set local location for the download
+            download_folder = os.path.join(uniprot_dir_path, entry.download_folder_name)
+            try:
+                os.mkdir(download_folder)
+            except FileExistsError:
+                pass
+            except OSError:
+                print("OSError")
+                print('Download for this entry failed:')
+                entry._snoop()
+                continue
+
+            # Skip any files that we do not want to download
+            files = [file for file in entry.ftp_download_list if not self.banned_file(file)]
+            downloads = [(os.path.join(download_folder, "{}_{}".format(self.date, file)),
+                          'ftp://{}{}/{}'.format(self.url, entry.ftp_file_path, file)) for file in files]
+            fasta_files = sorted(["{}_{}".format(self.date, file) for file in files if 'fasta' in file.lower()])
+            if not fasta_files:
+                print('...WARNING: no FASTA files for', entry.species_name)
+                continue
+            args = (uniprot_dir_path, download_folder, fasta_files, entry.short_name,
+                    entry.proteome_ID, entry.species_name, forward, both, self.contams_database)
+            jobs.append((entry.species_name, downloads, uniprot_make_fasta_files, args))
+        return jobs
+
+    def make_download_folder(self, parent_folder):
+        """Makes (if needed) and returns the release folder for downloads."""
+        uniprot_dir_path = os.path.join(parent_folder, r"UniProt_{}".format(self.date))
+        try:
+            os.mkdir(uniprot_dir_path)
+        except FileExistsError:
+            pass
+        return uniprot_dir_path
+# end class
+
+class EnsemblEngine:
+    """Catalog, selection, and download logic for the Ensembl proteomes.
+    The GUI in Ensembl_proteome_manager.py builds on this class.
+    """
+    def __init__(self, url, prot_path, text, banned_list, script_location, default_contams):
+        """Create object and set some state attributes."""
+        self.url = url                          # Url of Ensembl FTP site
+        self.ensembl_prot_path = prot_path      # Location of Ensembl databases
+        self.ensembl_ftp = os.path.dirname(prot_path)   # top level where databases are
+        self.ftp = None                         # FTP object (set in login method)
+        self.text = text                        # HTML text of webpage
+        self.raw_table = []                     # HTML text of just animals table
+        self.animal_list = []                   # List of all AnimalEntry objects
+        self.banned_list = banned_list          # List of file identifiers to be omitted when downloading
+        self.release = ''                       # Ensembl release number
+        self.version = ''                       # string like "v89"
+        self.script_location = script_location  # Script path location
+        self.contams_database = os.path.join(self.script_location, default_contams)
+        self.data = None                        # Holds catalog information saved from last session
+        self.catalog = fasta_lib.CatalogCache(os.path.join(script_location, 'Ensembl_current_release.json'),
+                                              CATALOG_VERSION)
+        self.stamp = None                       # current_README modification time and size
+        self.pipeline = None                    # Background download and processing pipeline
+        
+        # List of characters that cannot be in folder names
+        self.illegal_characters = r"[\\#%&{}/<>*?:]"
+
+    @staticmethod
+    def fetch_species_page(parse_url=PARSE_URL):
+        """Gets HTML page from Ensembl for parsing."""
+        response = urllib.request.urlopen(parse_url)
+        return response.read().decode('utf-8')
+
+    # FTP support
+    def login(self):
+        """Open an FTP connection and login."""
+        self.ftp = ftplib.FTP()
+        self.ftp.connect(str(self.url))
+        self.ftp.login()
+
+    def logout(self):
+        """Close the FTP connection."""
+        try:
+            self.ftp.quit()
+        except:
+            pass # we will get error if there is no FTP connection to close
+
+    # some parsing support        
+    def clean_common_name(self, name):
+        """Removes some odd characters from common names."""
+        p = re.compile(r"alt=\"(.*?)\"")
+        m = p.search(name)
+        return m.groups()[0]
+
+    def clean_latin_name(self, name):
+        """Removes some odd characters from latin names."""
+        p = re.compile(r"<i\b[^>]*>(.*?)</i>")
+        m = p.search(name)
+        return m.groups()[0]
+
+    def create_raw_table(self):
+        """Finds table boundaries in the HTML page."""
+        # Setup html file to find required information 
+        # Find start and end of h3 header block
+        TEXT = self.text
+        if "<td" in TEXT:
+            start_ind = TEXT.index("<td")
+        if "</table>" in TEXT:
+           end_ind = TEXT.index("</table>")
+
+        # Text Block that needs to be parsed
+        self.raw_table = TEXT[start_ind:end_ind]
+
+    # Ensembl Animal Entry support
+    def load_all_entries(self):
+        """Loads Ensembl proteome entries from the catalog cache.
+        A cheap MDTM/SIZE check of current_README is tried first; the file is
+        only read if it changed. If the cache does not exist or is out-of-date, returns False.
+        """
+        # see if current_README changed since the catalog was saved
+        self.login()
+        self.ftp.cwd(self.ensembl_ftp)  # move into current_README file location
+        self.stamp = fasta_lib.ftp_file_stamp(self.ftp, 'current_README')
+        self.data = self.catalog.load()
+        if self.data and self.stamp and self.stamp == self.data["Stamp"]:
+            release = self.data["Release"]
+        else:
+            # get the contents of current_README file
+            listing = []
+            self.ftp.retrlines('RETR current_README', listing.append)
+
+            # Get the current release version from current_README
+            for line in listing:
+                if "Ensembl Release" in line:
+                    items = line.split()
+                    release = int(items[items.index('Release') + 1])
+
+        # see if cache file exists
+        if not self.data:
+            print('catalog file not present')
+            self.release = release
+            self.version = "v{}".format(self.release)
+            return False
+
+        # get data from cache file
+        self.release = self.data["Release"]
+        self.version = "v{}".format(self.release)
+
+        # if cached version matches current database version, then load entries from cache file
+        if self.release == release:
+            self.animal_list = [AnimalEntry.from_dict(x) for x in self.data["Entries"]]
+            if self.stamp != self.data["Stamp"]:
+                self.save_entries()    # save the new README stamp
+            return True
+        else:
+            print('saved release is out-of-date')
+            self.release = release  # set this to the current release version
+            self.version = "v{}".format(self.release)
+            return False
+
+    def parse_raw_table(self):
+        """Gets Ensembl proteome entries. Looks for catalog file first and checks if current, if not fetches from web."""
+        if self.load_all_entries():
+            return  # cached entries were read in and were current
+        else:
+            print('fetching data from web')
+            # Parse header into animal list
+            # Need an alternative path for missing entries where gene build method is "import"
+            parser = re.compile(r'<td\b[^>]*>(.*?)</td>|</span\b[^>]*>(.*?)</span>')
+            matched_groups = parser.findall(self.raw_table)
+            parsed = []
+            for i in range(0, len(matched_groups), 9):  # Split 1D list into 2D so that each animal has 9 attributes
+                animal = matched_groups[i:i+9]
+                parsed.append(animal)
+                
+            # We want to remove the empty space produced by alternative path in regex
+            for animal in parsed:
+                for i in range(len(animal)):
+                    for path in animal[i]:
+                        if path:
+                            animal[i] = path
+                common_name = self.clean_common_name(animal[0])
+                latin_name = self.clean_latin_name(animal[1])
+                tax_id = animal[2]
+                if not str(tax_id).isdigit():  # In case tax_id is something other than a number
+                    tax_id = "000"
+
+                # Create main animal entry
+                animal_obj = AnimalEntry(common_name, latin_name, tax_id, animal[3], animal[4],
+                                         animal[5], animal[6], animal[7], animal[8])
+
+                # Set animal object's folder name (ftp download path is set in remove_invalid_animals method)
+                folder_name = "{}__{}__{}".format(animal_obj.common_name, animal_obj.latin_name, animal_obj.tax_ID)
+                folder_name = re.sub(self.illegal_characters, "_", folder_name)
+                animal_obj.folder_name = folder_name
+
+                # save animal record
+                self.animal_list.append(animal_obj)
+                
+            self.remove_invalid_animals()   # FTP paths are set in this method
+
+            # save the fetched species information
+            self.save_entries()
+
+    def remove_invalid_animals(self):
+        """Make sure animals in species table have actual FTP links."""
+        # if we cant find the animal directory, remove it from animal list
+        del_list = []
+        actual_list = self.get_animal_directory() # get list of FTP folders
+        actual_set = set(actual_list)
+        for i, animal in enumerate(self.animal_list):
+            if animal.ensembl_assembly == '-':  # no ftp if no assembly?
+                print('no FTP files:', animal.common_name)
+                del_list.append(i)
+            else:
+                test_name = animal.latin_name.lower().replace(" ", "_")
+                if test_name not in actual_set:
+                    match = self.double_check_animal(test_name, actual_list)
+                    if match:
+                        download_path = r"{}/{}/pep/".format(self.ensembl_prot_path, match)
+                        animal.ftp_file_path = download_path
+                    else:
+                        print('unknown animal:', animal.common_name)
+                        del_list.append(i)
+                else:
+                    download_path = r"{}/{}/pep/".format(self.ensembl_prot_path, test_name)
+                    animal.ftp_file_path = download_path
+
+        # delete list items (work backwards)
+        print('starting animal list length:', len(self.animal_list))
+        del_list = del_list[::-1]
+        for i in del_list:
+            del(self.animal_list[i])
+        print('ending animal list length:', len(self.animal_list))
+
+    def double_check_animal(self, test_name, actual_list):
+        """Latin species names in table do not always match FTP folder names (gorilla and dog)"""
+        test_set = set(test_name.split('_'))
+        for actual in actual_list:
+            actual_set = set(actual.split('_'))
+            if (actual_set < test_set) or (actual_set == test_set):
+                return actual
+        else:
+            return None
+
+    def get_animal_directory(self):
+        """Get list of folder names from the FTP site"""
+        self.login()
+        self.ftp.cwd(self.ensembl_prot_path)
+        listing = []
+        self.ftp.retrlines('LIST', listing.append)  # get list of folders
+        listing = [x.split()[-1].strip() for x in listing]
+        return listing
+        
+    def save_entries(self):
+        """Saves full left display list to make subsequent launches faster."""
+        self.catalog.save({"Release": self.release, "Stamp": self.stamp,
+                           "Entries": [entry.to_dict() for entry in self.animal_list]})
+
+    # selection and download support
+    def select_entries(self, tax_entry='', species_entry=''):
+        """Returns animals whose taxonomy number contains "tax_entry" and whose
+        common or latin name contains "species_entry".
+        """
+        species_entry = species_entry.lower()
+        selected = [entry for entry in self.animal_list if tax_entry in entry.tax_ID]
+        return [entry for entry in selected
+                if species_entry in entry.common_name.lower()
+                or species_entry in entry.latin_name.lower()]
+
+    def entries_for_species(self, species_file):
+        """Returns (entries, missing (common name, taxonomy number) pairs) for a species list file."""
+        wanted = []
+        for row in read_species_file(species_file):
+            pair = (str(row[0]), int(row[2]))
+            if pair not in wanted:
+                wanted.append(pair)
+        entries = [entry for pair in wanted for entry in self.animal_list
+                   if (pair[1] == int(entry.tax_ID)) and (pair[0] == entry.common_name)]
+        found = set((entry.common_name, int(entry.tax_ID)) for entry in entries)
+        return entries, [pair for pair in wanted if pair not in found]
+
+    def make_download_folder(self, parent_folder):
+        """Makes (if needed) and returns the release folder for downloads."""
+        ensembl_dir_path = os.path.join(parent_folder, r"Ensembl_v{}".format(self.release))
+        try:
+            os.mkdir(ensembl_dir_path)
+        except FileExistsError:
+            pass
+        return ensembl_dir_path
+
+    def download_jobs(self, download_entries, ensembl_dir_path, forward, both):
+        """Generator of pipeline jobs, one per selected FASTA file.
+        Runs on the pipeline thread, so it uses its own FTP connection.
+        """
+        ftp = ftplib.FTP()
+        ftp.connect(str(self.url))
+        ftp.login()
+        for entry in download_entries:
+            # Create a folder for each species
+            download_folder = os.path.join(ensembl_dir_path, entry.folder_name)
+            try:
+                os.mkdir(download_folder)
+            except FileExistsError:
+                pass
+                
+            # Create a list of all files in each species folder
+            listing = []
+            ftp.cwd(entry.ftp_file_path)
+            ftp.retrlines('LIST', listing.append)
+            
+            # Make a job for each selected entry's fasta file
+            for line in listing:
+                line = line.strip() # Want last item, so strip EOL
+                fname = line.split()[-1] # Get the file name
+                
+                # Skip any files that we do not want to download
+                if self.banned_file(fname):
+                    continue
+                fixed_fname = "{}__{}__{}".format(self.version, entry.common_name, fname)
+                fixed_fname = re.sub(self.illegal_characters, "_", fixed_fname)
+                file_location = os.path.join(download_folder, fixed_fname)
+                address = 'ftp://{}{}{}'.format(self.url, entry.ftp_file_path, fname)
+
+                # descriptions are fixed as the data arrives (no second pass over the file)
+                make_sink = functools.partial(Ensembl_fixer.StreamFixer, file_location, up_one=True)
+                new_fasta_file = Ensembl_fixer.fixed_file_name(file_location, up_one=True)
+                args = (new_fasta_file, forward, both, self.contams_database)
+                yield (fname, [(file_location, address, make_sink)], ensembl_process_databases, args)
+        try:
+            ftp.quit()
+        except ftplib.all_errors:
+            pass
+
+    def banned_file(self, fname):
+        """False if fname in banned list."""
+        skip = False
+        for ban in self.banned_list:
+            if ban.lower() in fname.lower():
+                skip = True
+        return skip
+# end class
+
+# end
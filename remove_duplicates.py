@@ -51,6 +51,7 @@ def find_identities(prot, candidates, skip, fasta_file, out_obj):
                 print('......%s "%s"' % (p.accession, p.description[:60]), file=out_obj)
     return ident
 
+@fasta_lib.profile_entry
 def main(fasta_file):
     """Checks entries in a FASTA protein database for identical duplicates.
         Call with FASTA filename, returns a couple of dictionaries
@@ -72,6 +73,7 @@ def main(fasta_file):
     nr_obj = open(nr_database, 'w')
     write = [None, out_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: check_for_duplicates.py', out_obj)
+    metrics = fasta_lib.RunMetrics('remove_duplicates.py', out_obj)
     #
 
     # create instances of reader object and protein object, initialize counters
@@ -82,8 +84,11 @@ def main(fasta_file):
     conflicts = {}      # keeps track of seq len and MW
 
     # read proteins until EOF
+    metrics.start_stage('find candidates', f)
     while f.readNextProtein(p, check_for_errs=False):
         prot += 1
+        if (prot % 500000) == 0:
+            metrics.progress(prot)
         control_A = p.description.count(chr(1))
         head = head + control_A + 1
         dup_data = (p.seqlenProtein(), p.molwtProtein())
@@ -96,6 +101,7 @@ def main(fasta_file):
                 candidates[duplicate] = [copy.deepcopy(p)]
         else:
             conflicts[dup_data] = p.accession
+    metrics.end_stage(prot)
 
     # get list of proteins to test for identity
     to_test = {}
@@ -108,25 +114,32 @@ def main(fasta_file):
     f = fasta_lib.FastaReader(fasta_file)
     p = fasta_lib.Protein()
     print('Processing:', fasta_file, file=out_obj)    # header line to log file
+    metrics.start_stage('write nonredundant', f)
+    read = 0
     while f.readNextProtein(p, check_for_errs=False):
+        read += 1
+        if (read % 500000) == 0:
+            metrics.progress(read)
         if to_test.get(p.accession, False):
             dup += find_identities(p, candidates, skip, fasta_file, out_obj)
         if skip.get(p.accession, False):
             continue
         p.printProtein(nr_obj)
+        metrics.add('records_written')
+    metrics.end_stage(read)
+    nr_obj.close()
 
     for obj in [None, out_obj]:
         print('\nThere were', prot, 'total sequences in:', os.path.basename(fasta_file), file=obj)
         print('There were', dup, 'identical sequences removed\n\n', file=obj)
-        try:
-            obj.close()
-        except AttributeError:
-            pass
+    metrics.summary()
+    out_obj.close()
     return
 
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # check if database name passed on command line
     if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
         fasta_file = sys.argv[1]
@@ -39,8 +39,14 @@ MAKE_FORWARD = True
 MAKE_REVERSE = False
 MAKE_BOTH = True
 
+# write each decoy right after its target in the concatenated file
+# NOTE: most search engines are fine with this, but check yours first
+INTERLEAVE = False
 
-def main(fasta_file, forward=False, reverse=False, both=True, log_obj=None, contam_path=""):
+
+@fasta_lib.profile_entry
+def main(fasta_file, forward=False, reverse=False, both=True, log_obj=None, contam_path="",
+         interleave=INTERLEAVE):
     """Adds contaminants and reverses entries for a FASTA protein database.
 
     Call with single fasta file name.
@@ -48,6 +54,8 @@ def main(fasta_file, forward=False, reverse=False, both=True, log_obj=None, cont
     if "reverse", make reversed sequences with reversed contaminants,
     if "both", make concatenated target/decoy with contaminants.
     "contam_path" is optional fullpath name of a contaminants database to use instead of default
+    if "interleave", decoys follow their targets in the concatenated file.
+    The database is read once and only the requested files are written.
     """
     decoy_string = 'REV_'   # the string to denote decoy sequences
     ######################################
@@ -56,18 +64,12 @@ def main(fasta_file, forward=False, reverse=False, both=True, log_obj=None, cont
     # or pass in a "contams_path"
     ######################################
     
-    # open the "forward" and "reversed" output files
+    # open the requested output files ("_for", "_rev", and/or "_both")
     if fasta_file.lower().endswith('.gz'):
         _file = os.path.splitext(fasta_file[:-3])[0]
     else:
         _file = os.path.splitext(fasta_file)[0]
-    for_name = _file + '_for.fasta'
-    for_file_obj = open(for_name, 'w')
-    rev_name = _file + '_rev.fasta'
-    rev_file_obj = open(rev_name, 'w')
-
-    # create the name for the concatenated file (if later needed)
-    both_name = _file + '_both.fasta'
+    writer = fasta_lib.TargetDecoyWriter(_file, forward, reverse, both, interleave)
     
     # create a log file to mirror screen output
     _folder = os.path.split(fasta_file)[0]
@@ -75,6 +77,8 @@ def main(fasta_file, forward=False, reverse=False, both=True, log_obj=None, cont
         log_obj = open(os.path.join(_folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: reverse_fasta.py', log_obj)
+    metrics = fasta_lib.RunMetrics('reverse_fasta.py', log_obj)
+    per_protein = forward + reverse + 2*both   # entries written for each protein read
     
     # create instances protein object and initialize counter
     prot = fasta_lib.Protein()
@@ -101,9 +105,8 @@ def main(fasta_file, forward=False, reverse=False, both=True, log_obj=None, cont
         f = fasta_lib.FastaReader(_file)
         while f.readNextProtein(prot, check_for_errs=True):
             p_contam += 1
-            prot.printProtein(for_file_obj)
-            rev = prot.reverseProtein(decoy_string)
-            rev.printProtein(rev_file_obj)
+            writer.write(prot, prot.reverseProtein(decoy_string))
+            metrics.add('records_written', per_protein)
         for obj in write:
             print('...there were %s contaminant entries in %s' %
                   ("{0:,d}".format(p_contam), os.path.split(_file)[1]), file=obj)
@@ -111,65 +114,51 @@ def main(fasta_file, forward=False, reverse=False, both=True, log_obj=None, cont
         for obj in write:
             print('...WARNING: contaminants were not added', file=obj)
         
-    # read proteins until EOF and write proteins to "forward" and "reversed" files
+    # read proteins until EOF and write targets and decoys
     f = fasta_lib.FastaReader(fasta_file)
     
     # error checking slows program execution, turn on if needed.
     # Reading and writing sequences always removes spaces and blank lines.
+    metrics.start_stage(os.path.split(fasta_file)[1], f)
     while f.readNextProtein(prot, check_for_errs=False):
         if prot.sequence.endswith('*'):
             prot.sequence = prot.sequence[:-1]
         p_read += 1
-        prot.printProtein(for_file_obj)    # write to "forward" file
-        rev = prot.reverseProtein(decoy_string)
-        rev.printProtein(rev_file_obj)   # write to "reversed" file
-    for_file_obj.close()
-    rev_file_obj.close()
+        if (p_read % 500000) == 0:
+            metrics.progress(p_read)
+        writer.write(prot, prot.reverseProtein(decoy_string))
+        metrics.add('records_written', per_protein)
+    writer.close()
+    metrics.end_stage(p_read)
     for obj in write:
         print('...%s proteins read from %s' %
               ("{0:,d}".format(p_read), os.path.split(fasta_file)[1]), file=obj) 
     
-    # make concatenated output file if desired and print summary stats
+    # print summary stats
     if both:
-        both_file_obj = open(both_name, 'w')
-        for_file_obj = open(for_name, 'r')
-        rev_file_obj = open(rev_name, 'r')
-        while True:
-            line = for_file_obj.readline()
-            if not line: break
-            both_file_obj.write(str(line))
-        while True:
-            line = rev_file_obj.readline()
-            if not line: break
-            both_file_obj.write(str(line))
-        both_file_obj.close()
         for obj in write:
             print('...%s total proteins written to %s' %
-                  ("{0:,d}".format(2*(p_contam+p_read)), os.path.split(both_name)[1]), file=obj)
+                  ("{0:,d}".format(2*(p_contam+p_read)), os.path.split(writer.both_name)[1]), file=obj)
     
     if forward:
         for obj in write:
             print('...%s proteins written to %s' %
-                  ("{0:,d}".format(p_contam+p_read), os.path.split(for_name)[1]), file=obj)
+                  ("{0:,d}".format(p_contam+p_read), os.path.split(writer.for_name)[1]), file=obj)
     if reverse:
         for obj in write:
             print('...%s proteins reversed and written to %s' %
-                  ("{0:,d}".format(p_contam+p_read), os.path.split(rev_name)[1]), file=obj)
+                  ("{0:,d}".format(p_contam+p_read), os.path.split(writer.rev_name)[1]), file=obj)
     
-    # close files and delete unwanted files
-    for_file_obj.close()
-    rev_file_obj.close()
+    # close log file
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: reverse_fasta.py', log_obj)
     log_obj.close()
-    if not forward:
-        os.remove(for_name)
-    if not reverse:
-        os.remove(rev_name)
     return
 
 
 # setup stuff: check for command line args, etc.
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # set up command line arguments
     parser = argparse.ArgumentParser(description='Makes databases with contaminants and decoys.',
                                      prefix_chars='-+')
@@ -191,6 +180,12 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--both', dest='both',
                         help='does not makes forward and reversed sequences with contaminants',
                         action='store_false', default=MAKE_BOTH)
+    parser.add_argument('+i', '++interleave', dest='interleave',
+                        help='writes each decoy right after its target in the concatenated file',
+                        action='store_true', default=INTERLEAVE)
+    parser.add_argument('-i', '--interleave', dest='interleave',
+                        help='writes all targets before all decoys in the concatenated file',
+                        action='store_false', default=INTERLEAVE)
     parser.add_argument('-v', '--version', action='version', version='%(prog)s version 1.1.2')
     parser.add_argument('files', help='list of FASTA files to process', nargs='*')
 
@@ -200,11 +195,13 @@ if __name__ == '__main__':
         forward = args.forward
         reverse = args.reverse
         both = args.both
+        interleave = args.interleave
         fasta_files = args.files
     else:   # options set to hardcoded defaults if interactive mode or no passed commands
         forward = MAKE_FORWARD
         reverse = MAKE_REVERSE
         both = MAKE_BOTH
+        interleave = INTERLEAVE
         fasta_files = []
     
     # if no FASTA files, browse to database file(s)
@@ -226,7 +223,7 @@ if __name__ == '__main__':
     os.chdir('.')   # set location to where script lives - the contaminants should be there
     for fasta_file in fasta_files:
         try:
-            main(fasta_file, forward, reverse, both)
+            main(fasta_file, forward, reverse, both, interleave=interleave)
         except IOError:   # FastaReader class raises exception if file not found
             print('...WARNING: %s not found' % fasta_file)
             pass
@@ -36,6 +36,7 @@ import fasta_lib
 min_sequence_count = 0
 
 
+@fasta_lib.profile_entry
 def main(db, folder, versions):
     """Fetches and analyzes the species names in Sprot database.
 
@@ -83,6 +84,7 @@ def main(db, folder, versions):
 
 
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # get path to uniprot databases and call main function to download, etc.
     # check if folder path is passed on command line
     versions = fasta_lib.get_uniprot_version()
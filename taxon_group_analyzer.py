@@ -34,6 +34,7 @@ import tarfile
 import fasta_lib
 
 
+@fasta_lib.profile_entry
 def main(node_taxon):
     """Program to process taxonomy nodes file and find groups of species.
     """
@@ -112,6 +113,7 @@ def main(node_taxon):
 
 # check for command line launch and see if a taxonomy number was passed
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
 
     # if arguments make sure it is an integer
     node_taxon = 0
@@ -0,0 +1,37 @@
+"""'tests/test_checkpoint.py' part of the fasta_utilities collection, OHSU.
+
+A checkpoint is only used if none of its database files changed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fasta_lib
+
+import pytest
+
+
+@pytest.fixture
+def databases(tmp_path):
+    db_files = []
+    for name in ('uniprot_sprot.fasta.gz', 'uniprot_trembl.fasta.gz'):
+        db_file = tmp_path / name
+        db_file.write_bytes(b'x' * 100)
+        db_files.append(str(db_file))
+    return db_files
+
+
+def test_round_trip(databases, tmp_path):
+    checkpoint_file = str(tmp_path / 'run.checkpoint')
+    fasta_lib.Checkpoint(checkpoint_file, databases).save({'db': 1, 'prot_read': 5})
+    saved = fasta_lib.Checkpoint(checkpoint_file, databases).load()
+    assert saved['state'] == {'db': 1, 'prot_read': 5}
+
+
+@pytest.mark.parametrize('changed', [0, 1])
+def test_any_changed_database(databases, tmp_path, changed):
+    checkpoint_file = str(tmp_path / 'run.checkpoint')
+    fasta_lib.Checkpoint(checkpoint_file, databases).save({'db': 1})
+    with open(databases[changed], 'ab') as fout:
+        fout.write(b'more')
+    assert fasta_lib.Checkpoint(checkpoint_file, databases).load() is None
@@ -0,0 +1,314 @@
+"""'tests/test_downloader.py' part of the fasta_utilities collection, OHSU.
+
+Checks fasta_lib.Downloader against local HTTP (http.server) and FTP
+(a small socketserver stand-in) servers running in threads, so no network
+access is needed.  Run with "python -m pytest tests".
+"""
+import os
+import sys
+import socket
+import time
+import hashlib
+import threading
+import socketserver
+import http.server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fasta_lib
+
+import pytest
+
+DATA = bytes(range(256)) * 400     # 102,400 bytes
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serves the server's "files" dictionary (path: bytes) with Range support.
+    Paths in the server's "truncate" set send a short body (the
+    Content-Length is for the whole file).  The (path, Range header) of each
+    request is saved in the server's "requests" list.  Each response waits
+    for the server's "delay" seconds.
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        files = self.server.files
+        header = self.headers.get('Range')
+        self.server.requests.append((self.path, header))
+        time.sleep(self.server.delay)
+        if self.path not in files:
+            self.send_error(404)
+            return
+        data = files[self.path]
+        start = 0
+        if header:
+            start = int(header.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %s-%s/%s' % (start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        if self.path in self.server.truncate:
+            self.wfile.write(data[start:start + (len(data) - start) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(data[start:])
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.files = {}
+    httpd.truncate = set()
+    httpd.requests = []
+    httpd.delay = 0
+    httpd.url = 'http://127.0.0.1:%s' % (httpd.server_address[1],)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class FTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of an FTP server for ftplib and Downloader (USER, PASS,
+    TYPE, SIZE, PASV, REST, RETR, QUIT).  Serves the server's "files"
+    dictionary (path: bytes); paths in "truncate" send half of the data
+    (with a normal 226 reply).  Commands are saved in "commands".
+    """
+    def reply(self, text):
+        self.wfile.write((text + '\r\n').encode('ascii'))
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        self.reply('220 test server ready')
+        rest = 0
+        listener = None
+        for raw in self.rfile:
+            line = raw.decode('ascii').rstrip('\r\n')
+            server.commands.append(line)
+            (command, _, arg) = line.partition(' ')
+            command = command.upper()
+            if command == 'USER':
+                self.reply('331 password please')
+            elif command == 'PASS':
+                self.reply('230 logged in')
+            elif command == 'TYPE':
+                self.reply('200 type set')
+            elif command == 'SIZE':
+                if arg in server.files:
+                    self.reply('213 %s' % (len(server.files[arg]),))
+                else:
+                    self.reply('550 %s: no such file' % (arg,))
+            elif command == 'PASV':
+                listener = socket.create_server(('127.0.0.1', 0))
+                port = listener.getsockname()[1]
+                self.reply('227 Entering Passive Mode (127,0,0,1,%s,%s)' % (port >> 8, port & 255))
+            elif command == 'REST':
+                rest = int(arg)
+                self.reply('350 restarting at %s' % (rest,))
+            elif command == 'RETR':
+                if arg not in server.files:
+                    listener.close()
+                    self.reply('550 %s: no such file' % (arg,))
+                    continue
+                data = server.files[arg][rest:]
+                if arg in server.truncate:
+                    data = data[:len(data) // 2]
+                self.reply('150 sending %s' % (arg,))
+                (conn, address) = listener.accept()
+                conn.sendall(data)
+                conn.close()
+                listener.close()
+                rest = 0
+                self.reply('226 transfer complete')
+            elif command == 'QUIT':
+                self.reply('221 goodbye')
+                break
+            else:
+                self.reply('502 %s not implemented' % (command,))
+
+
+@pytest.fixture
+def ftp_server():
+    ftpd = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FTPHandler)
+    ftpd.daemon_threads = True
+    ftpd.files = {}
+    ftpd.truncate = set()
+    ftpd.commands = []
+    ftpd.url = 'ftp://127.0.0.1:%s' % (ftpd.server_address[1],)
+    thread = threading.Thread(target=ftpd.serve_forever, daemon=True)
+    thread.start()
+    yield ftpd
+    ftpd.shutdown()
+    ftpd.server_close()
+
+
+class FakeTime:
+    """fasta_lib's "time" module with a "sleep" that only saves the wait
+    (the test servers still sleep for real)."""
+    def __init__(self, waits):
+        self.sleep = waits.append
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@pytest.fixture(autouse=True)
+def sleeps(monkeypatch):
+    """No backoff waits in the tests (the requested waits are saved).
+    """
+    waits = []
+    monkeypatch.setattr(fasta_lib, 'time', FakeTime(waits))
+    return waits
+
+
+def test_download_and_md5(server, tmp_path):
+    server.files['/db.fasta.gz'] = DATA
+    server.files['/db.fasta.gz.md5'] = ('%s  db.fasta.gz\n' % hashlib.md5(DATA).hexdigest()).encode()
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert fasta_lib.Downloader(retries=2, md5=True).fetch(server.url + '/db.fasta.gz', file_name)
+    with open(file_name, 'rb') as fin:
+        assert fin.read() == DATA
+    assert not os.path.exists(file_name + '.part')
+
+
+def test_resume_from_part(server, tmp_path):
+    server.files['/db.fasta.gz'] = DATA
+    file_name = str(tmp_path / 'db.fasta.gz')
+    with open(file_name + '.part', 'wb') as fout:
+        fout.write(DATA[:40000])
+    assert fasta_lib.Downloader(retries=1).fetch(server.url + '/db.fasta.gz', file_name)
+    assert server.requests == [('/db.fasta.gz', 'bytes=40000-')]
+    with open(file_name, 'rb') as fin:
+        assert fin.read() == DATA
+
+
+def test_size_mismatch(server, tmp_path):
+    server.files['/db.fasta.gz'] = DATA
+    server.truncate.add('/db.fasta.gz')
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert not fasta_lib.Downloader(retries=2).fetch(server.url + '/db.fasta.gz', file_name)
+    assert not os.path.exists(file_name)
+    # the second attempt continued the partial file (kept for a later resume)
+    assert server.requests == [('/db.fasta.gz', None), ('/db.fasta.gz', 'bytes=%s-' % (len(DATA) // 2,))]
+    assert 0 < os.path.getsize(file_name + '.part') < len(DATA)
+
+
+def test_no_wait_after_last_attempt(server, tmp_path, sleeps):
+    server.files['/db.fasta.gz'] = DATA
+    server.truncate.add('/db.fasta.gz')
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert not fasta_lib.Downloader(retries=3).fetch(server.url + '/db.fasta.gz', file_name)
+    assert len(sleeps) == 2
+
+
+def test_md5_mismatch(server, tmp_path):
+    server.files['/db.fasta.gz'] = DATA
+    server.files['/db.fasta.gz.md5'] = b'0' * 32 + b'  db.fasta.gz\n'
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert not fasta_lib.Downloader(retries=2, md5=True).fetch(server.url + '/db.fasta.gz', file_name)
+    assert not os.path.exists(file_name)
+    assert not os.path.exists(file_name + '.part')
+    assert server.requests == [('/db.fasta.gz.md5', None), ('/db.fasta.gz', None), ('/db.fasta.gz', None)]
+
+
+def test_missing_file_is_not_retried(server, tmp_path):
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert not fasta_lib.Downloader(retries=3).fetch(server.url + '/db.fasta.gz', file_name)
+    assert server.requests == [('/db.fasta.gz', None)]
+
+
+def retrs(ftp_server):
+    return [c for c in ftp_server.commands if c.split()[0] in ('REST', 'RETR')]
+
+
+def test_ftp_download_and_md5(ftp_server, tmp_path):
+    ftp_server.files['/pub/db.fasta.gz'] = DATA
+    ftp_server.files['/pub/db.fasta.gz.md5'] = ('%s  db.fasta.gz\n' % hashlib.md5(DATA).hexdigest()).encode()
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert fasta_lib.Downloader(retries=2, md5=True).fetch(ftp_server.url + '/pub/db.fasta.gz', file_name)
+    with open(file_name, 'rb') as fin:
+        assert fin.read() == DATA
+    assert 'SIZE /pub/db.fasta.gz' in ftp_server.commands
+
+
+def test_ftp_resume_from_part(ftp_server, tmp_path):
+    ftp_server.files['/pub/db.fasta.gz'] = DATA
+    file_name = str(tmp_path / 'db.fasta.gz')
+    with open(file_name + '.part', 'wb') as fout:
+        fout.write(DATA[:40000])
+    assert fasta_lib.Downloader(retries=1).fetch(ftp_server.url + '/pub/db.fasta.gz', file_name)
+    assert retrs(ftp_server) == ['REST 40000', 'RETR /pub/db.fasta.gz']
+    with open(file_name, 'rb') as fin:
+        assert fin.read() == DATA
+
+
+def test_ftp_short_file(ftp_server, tmp_path):
+    ftp_server.files['/pub/db.fasta.gz'] = DATA
+    ftp_server.truncate.add('/pub/db.fasta.gz')
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert not fasta_lib.Downloader(retries=2).fetch(ftp_server.url + '/pub/db.fasta.gz', file_name)
+    assert not os.path.exists(file_name)
+    # SIZE says the file is short, so the second attempt continues it with REST
+    half = len(DATA) // 2
+    assert retrs(ftp_server) == ['RETR /pub/db.fasta.gz', 'REST %s' % (half,), 'RETR /pub/db.fasta.gz']
+    assert os.path.getsize(file_name + '.part') == half + (len(DATA) - half) // 2
+
+
+def test_ftp_missing_file_is_not_retried(ftp_server, tmp_path, sleeps):
+    file_name = str(tmp_path / 'db.fasta.gz')
+    assert not fasta_lib.Downloader(retries=3).fetch(ftp_server.url + '/pub/db.fasta.gz', file_name)
+    assert retrs(ftp_server) == ['RETR /pub/db.fasta.gz']
+    assert sleeps == []
+    assert not os.path.exists(file_name + '.part')
+
+
+class CancelSink:
+    """Cancels the downloads when the first block arrives."""
+    def __init__(self, downloader):
+        self.downloader = downloader
+
+    def write(self, block):
+        self.downloader.cancel()
+
+    def close(self):
+        pass
+
+
+def test_cancel(server, tmp_path, sleeps):
+    server.files['/db.fasta.gz'] = DATA
+    file_name = str(tmp_path / 'db.fasta.gz')
+    downloader = fasta_lib.Downloader(retries=3)
+    downloader.block_size = 1024
+    assert not downloader.fetch(server.url + '/db.fasta.gz', file_name, lambda: CancelSink(downloader))
+    assert server.requests == [('/db.fasta.gz', None)]
+    assert sleeps == []
+    assert not os.path.exists(file_name)
+    # later fetches return at once
+    assert not downloader.fetch(server.url + '/db.fasta.gz', file_name)
+    assert len(server.requests) == 1
+
+
+def processed(name):
+    return '...%s processed' % (name,)
+
+
+def test_pipeline_stop(server, tmp_path):
+    server.delay = 0.3
+    jobs = []
+    for i in range(20):
+        server.files['/db%s.fasta.gz' % i] = DATA
+        jobs.append(('db%s' % i, [(str(tmp_path / ('db%s.fasta.gz' % i)), server.url + '/db%s.fasta.gz' % i)],
+                     processed, ('db%s' % i,)))
+    pipeline = fasta_lib.DownloadPipeline(fasta_lib.Downloader(workers=2), processes=1)
+    pipeline.start(jobs)
+    while len(server.requests) < 2:
+        time.sleep(0.05)
+    pipeline.stop()
+    pipeline._thread.join(30)
+    assert not pipeline.is_alive()
+    assert len(server.requests) < 10
+    assert len(pipeline.completed) + len(pipeline.failed) == 20
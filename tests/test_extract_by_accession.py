@@ -0,0 +1,106 @@
+"""'tests/test_extract_by_accession.py' part of the fasta_utilities collection, OHSU.
+
+The index, ".fbin", and streaming modes have to write the same entries,
+including keys that are shared by several entries.  Blank header lines
+(or empty chr(1) segments) are skipped by all of the extractors.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fasta_lib
+import extract_by_accession
+
+import pytest
+
+FASTA = """>sp|P11111|ABC_HUMAN ABC protein OS=Homo sapiens
+MKTAYIAKQRQISFVKSHFSRQ
+>sp|P22222|XYZ_HUMAN XYZ protein OS=Homo sapiens
+MSSHEGGKKKALKQPKKQAKEMDEEEKAFKQKQKEEQKKLEVLKAK
+>sp|P11111-2|ABC_HUMAN Isoform 2 of ABC protein OS=Homo sapiens
+MKTAYIAKQRQISFVKSHF
+>WP_000001.1 protein one\x01WP_000002.2 protein two
+MAAAAK
+>WP_000001.2 protein one, new version
+MCCCCK
+"""
+
+
+def extract(mode, db_file, accessions, order, tmp_path):
+    out_name = str(tmp_path / ('%s_%s.fasta' % (mode, order)))
+    with open(out_name, 'w') as out_obj:
+        if mode == 'index':
+            missing = extract_by_accession.extract_with_index(db_file, accessions, order, out_obj)
+        elif mode == 'fbin':
+            missing = extract_by_accession.extract_with_fbin(db_file, accessions, order, out_obj)
+        else:
+            missing = extract_by_accession.extract_by_streaming(db_file, accessions, order, out_obj)
+    with open(out_name) as fin:
+        accs = [line.split()[0][1:] for line in fin if line.startswith('>')]
+    return accs, missing
+
+
+@pytest.mark.parametrize('order', ['file', 'input'])
+def test_modes_agree_on_shared_keys(tmp_path, order, capsys):
+    fasta = str(tmp_path / 'db.fasta')
+    with open(fasta, 'w') as fout:
+        fout.write(FASTA)
+    fbin = fasta_lib.write_fbin(fasta)
+    accessions = ['WP_000001', 'ABC_HUMAN', 'P22222', 'P11111', 'nothing']
+    results = [extract(mode, db, accessions, order, tmp_path)
+               for (mode, db) in [('index', fasta), ('fbin', fbin), ('streaming', fasta)]]
+    assert results[0] == results[1] == results[2]
+    (accs, missing) = results[0]
+    assert missing == ['nothing']
+    if order == 'file':
+        assert accs == ['sp|P11111|ABC_HUMAN', 'sp|P22222|XYZ_HUMAN', 'sp|P11111-2|ABC_HUMAN',
+                        'WP_000001.1', 'WP_000001.2']
+    else:
+        assert accs == ['WP_000001.1', 'WP_000001.2', 'sp|P11111|ABC_HUMAN', 'sp|P11111-2|ABC_HUMAN',
+                        'sp|P22222|XYZ_HUMAN']
+
+
+def test_find_all(tmp_path):
+    fasta = str(tmp_path / 'db.fasta')
+    with open(fasta, 'w') as fout:
+        fout.write(FASTA)
+    table = fasta_lib.ProteinTable.from_fasta(fasta)
+    assert table.find_all('ABC_HUMAN') == [0, 2]
+    assert table.find('ABC_HUMAN') == 0
+    assert table.find_all('WP_000002') == [3]
+    assert table.find_all('nothing') == []
+
+
+BLANK = """>
+MKKKK
+>sp|P33333|DEF_HUMAN DEF protein\x01\x01WP_000003.1 protein three
+MDDDDK
+>  
+MEEEE
+"""
+
+
+@pytest.mark.parametrize('mode', ['index', 'fbin', 'streaming'])
+def test_blank_headers(tmp_path, mode, capsys):
+    fasta = str(tmp_path / 'db.fasta')
+    with open(fasta, 'w') as fout:
+        fout.write(BLANK)
+    db = fasta_lib.write_fbin(fasta) if mode == 'fbin' else fasta
+    (accs, missing) = extract(mode, db, ['WP_000003', 'P33333', 'nothing'], 'file', tmp_path)
+    assert accs == ['sp|P33333|DEF_HUMAN']
+    assert missing == ['nothing']
+
+
+def test_multi_extractor_blank_headers(tmp_path, capsys):
+    fasta = str(tmp_path / 'db.fasta')
+    with open(fasta, 'w') as fout:
+        fout.write(BLANK)
+    queries = [fasta_lib.ExtractionQuery('accs', accessions={'WP_000003'}),
+               fasta_lib.ExtractionQuery('strings', strings=['protein']),
+               fasta_lib.ExtractionQuery('all')]
+    out_names = dict((q.name, str(tmp_path / (q.name + '.fasta'))) for q in queries)
+    out_files = dict((name, open(out_name, 'w')) for (name, out_name) in out_names.items())
+    assert fasta_lib.MultiExtractor(queries).extract(fasta, out_files) == 3
+    for out_obj in out_files.values():
+        out_obj.close()
+    assert [q.count for q in queries] == [1, 1, 3]
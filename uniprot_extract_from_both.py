@@ -77,8 +77,35 @@ taxon_dict = { 9606:'human',
 ##taxon_dict = { 145481:'Physcomitrella_patens'}
 
 
-def main(taxon_dict):
+def print_db_stats(stats, write):
+    """Prints the extraction counts for one database ("stats" dictionary).
+    """
+    for obj in write:
+        print('...%s protein entries in %s' %
+              ("{0:,d}".format(stats['prot_read']), stats['db_name']), file=obj)
+        print('...%s proteins had unknown taxon numbers' %
+              ("{0:,d}".format(stats['not_found']),), file=obj)
+        number_counter = stats['number_counter']
+        numbers = list(number_counter.keys())
+        numbers.sort()
+        if VERBOSE:
+            for j, number in enumerate(numbers):
+                if number_counter[number] > 0:
+                    print('......(%s) taxon %s had %s proteins' %
+                          (j+1, number, "{0:,d}".format(number_counter[number])), file=obj)
+        name_counter = stats['name_counter']
+        names = list(name_counter.keys())
+        names.sort()
+        for j, name in enumerate(names):
+            print('......(%s) %s %s proteins extracted' %
+                  (j+1, "{0:,d}".format(name_counter[name]), name), file=obj)
+    return
+
+@fasta_lib.profile_entry
+def main(taxon_dict, resume=False):
     """Extracts entries by taxon ID from both Sprot and Trembl databases.
+    Progress is checkpointed and, if "resume" is set, an interrupted
+    extraction restarts from its last checkpoint.
     """
     print('=============================================================================')
     print(' uniprot_extract_from_both.py, v.1.1.0, written by Phil Wilmarth, OHSU, 2017 ')
@@ -104,6 +131,7 @@ def main(taxon_dict):
     log_obj = open(os.path.join(uniprot_folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: uniprot_extract_from_both.py', log_obj)
+    metrics = fasta_lib.RunMetrics('uniprot_extract_from_both.py', log_obj)
 
     # make the smaller uniprot dictionaries
     (sci_to_taxon, id_to_taxon) = fasta_lib.make_uniprot_to_taxon(uniprot_folder)
@@ -134,9 +162,29 @@ def main(taxon_dict):
         taxon_count[taxon] = 0
         name_count[name] = 0
 
+    # restart from a checkpoint (truncate outputs to saved lengths) or start new.
+    # The stamp covers both databases because the saved position can be in either.
+    checkpoint = fasta_lib.Checkpoint(os.path.join(uniprot_folder, 'uniprot_extract_from_both.checkpoint'),
+                                      DB)
+    saved = checkpoint.load() if resume else None
+    mode = 'w'
+    first_db = 0
+    db_stats = []   # counts for the databases that are finished
+    if saved:
+        checkpoint.restore_outputs(saved, taxon_files)
+        mode = 'a'
+        first_db = saved['state']['db']
+        db_stats = saved['state'].get('db_stats', [])
+        metrics.stages = saved['state'].get('stages', [])
+        metrics.counters = saved['state'].get('counters', {})
+        for stats in db_stats:
+            for obj in write:
+                print('...%s was finished before the restart:' % (stats['db_name'],), file=obj)
+            print_db_stats(stats, write)
+
     # open the output filenames
     for name in taxon_files.keys():
-        taxon_files[name] = open(taxon_files[name], 'w')
+        taxon_files[name] = open(taxon_files[name], mode)
 
     # want to count extracted sequences from each database
     name_counter = {}
@@ -144,7 +192,7 @@ def main(taxon_dict):
 
     # loop over both databases and extract species
     duplicates = {}
-    for i in range(len(DB)):
+    for i in range(first_db, len(DB)):
         prot_read = 0
         not_found = 0
         for value in taxon_dict.values():
@@ -156,17 +204,28 @@ def main(taxon_dict):
         uniprot_file = DB[i]
         x = fasta_lib.FastaReader(uniprot_file)
         prot = fasta_lib.Protein()
+        if saved and i == first_db:
+            state = saved['state']
+            x.set_position(state['position'])
+            prot_read, not_found, duplicates = state['prot_read'], state['not_found'], state['duplicates']
+            name_counter, number_counter = state['name_counter'], state['number_counter']
+            taxon_count, name_count = state['taxon_count'], state['name_count']
+            for obj in write:
+                print('...resuming from checkpoint after %s proteins' % ("{0:,d}".format(prot_read),), file=obj)
         for obj in write:
             print('...reading %s and extracting entries...' % (os.path.split(uniprot_file)[1],), file=obj)
+        metrics.start_stage(os.path.split(uniprot_file)[1], x, prot_read)
+        lookups = 0
 
         # NOTE: checking for errors will slow program execution, use if needed
         while x.readNextProtein(prot, check_for_errs=False):
             prot_read += 1
             if (prot_read % 500000) == 0:
-                print('......(%s proteins read...)' % ("{0:,d}".format(prot_read),))
+                metrics.progress(prot_read)
             (spec_id, spec_name) = fasta_lib.uniprot_parse_line(prot.accession + ' ' + prot.description)
             taxon = sci_to_taxon.get(spec_name, 0) # first choice mapping
             taxon2 = name_to_taxon.get(spec_name, 0) # alternative mapping
+            lookups += 2
             if taxon == 0: # first choice not present
                 if taxon2 == 0:
                     not_found += 1
@@ -187,30 +246,29 @@ def main(taxon_dict):
                 number_counter[taxon] += 1
                 f = taxon_files[name]
                 prot.printProtein(f)
+                metrics.add('records_written')
 
-        # print extraction stats for each database
-        for obj in write:
-            print('...%s protein entries in %s' %
-                  ("{0:,d}".format(prot_read), os.path.split(DB[0])[1]), file=obj)
-            print('...%s proteins had unknown taxon numbers' %
-                  ("{0:,d}".format(not_found),), file=obj)
-            numbers = list(number_counter.keys())
-            numbers.sort()
-            if VERBOSE:
-                for j, number in enumerate(numbers):
-                    if number_counter[number] > 0:
-                        print('......(%s) taxon %s had %s proteins' %
-                              (j+1, number, "{0:,d}".format(number_counter[number])), file=obj)
-            names = list(name_counter.keys())
-            names.sort()
-            db_name = os.path.split(DB[i])[1]
-            for j, name in enumerate(names):
-                print('......(%s) %s %s proteins extracted' %
-                      (j+1, "{0:,d}".format(name_counter[name]), name), file=obj)
+            # save progress now and then so a crash or reboot can be resumed
+            if (prot_read % 10000) == 0 and checkpoint.due():
+                checkpoint.save({'db': i, 'position': x.get_position(), 'prot_read': prot_read,
+                                 'not_found': not_found, 'duplicates': duplicates,
+                                 'name_counter': name_counter, 'number_counter': number_counter,
+                                 'taxon_count': taxon_count, 'name_count': name_count,
+                                 'db_stats': db_stats, 'stages': metrics.stages,
+                                 'counters': metrics.counters}, taxon_files)
+
+        metrics.add('taxon_lookups', lookups)
+        metrics.end_stage(prot_read)
+
+        # print extraction stats for each database (saved for resumed runs)
+        db_stats.append({'db_name': os.path.split(DB[i])[1], 'prot_read': prot_read, 'not_found': not_found,
+                         'number_counter': dict(number_counter), 'name_counter': dict(name_counter)})
+        print_db_stats(db_stats[-1], write)
 
     # close the extracted database files
     for f in taxon_files.values():
         f.close()
+    checkpoint.remove()
 
     # print list of mis-matched taxon number warnings
     if MISMATCHES:
@@ -229,11 +287,14 @@ def main(taxon_dict):
                     print('......(%s) taxon %s had %s proteins' %
                           (i+1, number, "{0:,d}".format(taxon_count[number])), file=obj)
         print('...combined output file counts...', file=obj)
+        names = list(name_count.keys())
+        names.sort()
         for i, name in enumerate(names):
             print('......(%s) %s total proteins written to %s' %
                   (i+1, "{0:,d}".format(name_count[name]),
                    uniprot_db+'_'+version+'_'+name+'.fasta'), file=obj)
 
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: uniprot_extract_from_both.py', log_obj)
     log_obj.close()
     return
@@ -241,13 +302,16 @@ def main(taxon_dict):
 
 # check for command line launch and see if any arguments passed
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    # "--resume" restarts an interrupted extraction from its last checkpoint
+    resume = fasta_lib.resume_flag(sys.argv)
     if len(sys.argv) > 1:
         arg_dict = fasta_lib.taxon_cmd_line_checker(sys.argv)
         if arg_dict:
-            main(arg_dict)
+            main(arg_dict, resume)
         else:
             sys.exit()
     else:
-        main(taxon_dict)
+        main(taxon_dict, resume)
 
 # end
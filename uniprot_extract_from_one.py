@@ -68,9 +68,12 @@ taxon_dict = { 9606: 'human',
                7227:'Drosophila.melanogaster'}
 
 
-def main(taxon_dict):
+@fasta_lib.profile_entry
+def main(taxon_dict, resume=False):
     """Main program to extract entries by taxon ID from uniprot databases.
     Extraction is from a single downloaded Sprot or Trembl database.
+    Progress is checkpointed and, if "resume" is set, an interrupted
+    extraction restarts from its last checkpoint.
     """
     print('============================================================================')
     print(' uniprot_extract_from_one.py, v.1.1.0, written by Phil Wilmarth, OHSU, 2017 ')
@@ -94,6 +97,7 @@ def main(taxon_dict):
     log_obj = open(os.path.join(uniprot_folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: uniprot_extract_from_one.py', log_obj)
+    metrics = fasta_lib.RunMetrics('uniprot_extract_from_one.py', log_obj)
 
     # make the smaller uniprot dictionaries
     (sci_to_taxon, id_to_taxon) = fasta_lib.make_uniprot_to_taxon(uniprot_folder)
@@ -123,9 +127,17 @@ def main(taxon_dict):
         taxon_count[taxon] = 0
         name_count[name] = 0
 
+    # restart from a checkpoint (truncate outputs to saved lengths) or start new
+    checkpoint = fasta_lib.Checkpoint(uniprot_file + '.extract.checkpoint', uniprot_file)
+    saved = checkpoint.load() if resume else None
+    mode = 'w'
+    if saved:
+        checkpoint.restore_outputs(saved, taxon_files)
+        mode = 'a'
+
     # open the output filenames
     for name in taxon_files.keys():
-        taxon_files[name] = open(taxon_files[name], 'w')
+        taxon_files[name] = open(taxon_files[name], mode)
 
     # create a FastaReader object, initialize counters, and start reading
     x = fasta_lib.FastaReader(uniprot_file)
@@ -133,17 +145,27 @@ def main(taxon_dict):
     prot_read = 0
     not_found = 0
     duplicates = {}
+    if saved:
+        state = saved['state']
+        x.set_position(state['position'])
+        prot_read, not_found, duplicates = state['prot_read'], state['not_found'], state['duplicates']
+        taxon_count, name_count = state['taxon_count'], state['name_count']
+        for obj in write:
+            print('...resuming from checkpoint after %s proteins' % ("{0:,d}".format(prot_read),), file=obj)
     for obj in write:
         print('...reading %s and extracting entries...' % (uniprot_name,), file=obj)
+    metrics.start_stage(uniprot_name, x, prot_read)
+    lookups = 0
 
     # checking for errors in sequences slows program execution, use as needed
     while x.readNextProtein(prot, check_for_errs=False):
         prot_read += 1
         if (prot_read % 500000) == 0:
-            print('......(%s proteins read...)' % ("{0:,d}".format(prot_read),))
+            metrics.progress(prot_read)
         (spec_id, spec_name) = fasta_lib.uniprot_parse_line(prot.accession + ' ' + prot.description)
         taxon = sci_to_taxon.get(spec_name, 0) # first choice mapping
         taxon2 = name_to_taxon.get(spec_name, 0) # alternative mapping
+        lookups += 2
         if taxon == 0:  # first choice not present
             if taxon2 == 0:
                 not_found += 1
@@ -162,10 +184,21 @@ def main(taxon_dict):
             taxon_count[taxon] += 1
             f = taxon_files[name]
             prot.printProtein(f)
+            metrics.add('records_written')
+
+        # save progress now and then so a crash or reboot can be resumed
+        if (prot_read % 10000) == 0 and checkpoint.due():
+            checkpoint.save({'position': x.get_position(), 'prot_read': prot_read,
+                             'not_found': not_found, 'duplicates': duplicates,
+                             'taxon_count': taxon_count, 'name_count': name_count}, taxon_files)
+
+    metrics.add('taxon_lookups', lookups)
+    metrics.end_stage(prot_read)
 
     # close the extracted database files
     for f in taxon_files.values():
         f.close()
+    checkpoint.remove()
 
     # print list of mis-matching taxon number warnings
     if MISMATCHES:
@@ -192,19 +225,23 @@ def main(taxon_dict):
                   (i+1, "{0:,d}".format(name_count[name]),
                    uniprot_db + '_' + version + '_' + name + '.fasta'), file=obj)
 
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: uniprot_extract_from_one.py', log_obj)
     log_obj.close()
     return
 
 # check for command line launch and see if any arguments passed
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
+    # "--resume" restarts an interrupted extraction from its last checkpoint
+    resume = fasta_lib.resume_flag(sys.argv)
     if len(sys.argv) > 1:
         arg_dict = fasta_lib.taxon_cmd_line_checker(sys.argv)
         if arg_dict:
-            main(arg_dict)
+            main(arg_dict, resume)
         else:
             sys.exit()
     else:
-        main(taxon_dict)
+        main(taxon_dict, resume)
 
 # end
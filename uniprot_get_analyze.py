@@ -37,12 +37,14 @@ import fasta_lib
 min_sequence_count = [0, 10]     # [sprot, trembl]
 
 
-def main(DB, folder, versions):
+@fasta_lib.profile_entry
+def main(DB, folder, versions, resume=False):
     """Analyzes the species names in both UniProt databases.
 
     Arguments:
     "folder" is full path name to UniProt DBs.  "versions" is
     a dictionary of version numbers for file naming.  No return values.
+    If "resume" is set, database scans restart from any checkpoints.
 
     Saves a summary text file that can be loaded into EXCEL.
     """
@@ -54,6 +56,7 @@ def main(DB, folder, versions):
     log_obj = open(os.path.join(folder, 'fasta_utilities.log'), 'a')
     write = [None, log_obj]
     fasta_lib.time_stamp_logfile('\n>>> starting: uniprot_get_analyze.py', log_obj)
+    metrics = fasta_lib.RunMetrics('uniprot_get_analyze.py', log_obj)
 
     # make sure the files are present or download if not
     for db in DB:
@@ -69,7 +72,7 @@ def main(DB, folder, versions):
     for i in range(len(DB)):
         fname = 'uniprot_%s_%s.fasta.gz' % (DB[i], versions[DB[i]],)
         db_name = os.path.join(folder, fname)
-        (name_freq, name_to_id, prot_count) = fasta_lib.uniprot_species_frequency(db_name)
+        (name_freq, name_to_id, prot_count) = fasta_lib.uniprot_species_frequency(db_name, resume, metrics)
 
         # sort the species names and write to file
         fasta_lib.save_species_info(DB[i], folder, name_freq, name_to_taxon, sci_to_taxon,
@@ -83,14 +86,18 @@ def main(DB, folder, versions):
 
     fasta_lib.combine_analysis_files(folder)
 
+    metrics.summary()
     fasta_lib.time_stamp_logfile('>>> ending: uniprot_get_analyze.py', log_obj)
     log_obj.close()
     return
 
 
 if __name__ == '__main__':
+    fasta_lib.profile_flag(sys.argv)   # "--profile" (see fasta_lib.profile_entry)
     # get path to uniprot databases and call main function to download, etc.
     # check if folder path is passed on command line
+    # ("--resume" restarts an interrupted scan from its last checkpoint)
+    resume = fasta_lib.resume_flag(sys.argv)
     versions = fasta_lib.get_uniprot_version()
     if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
         container = sys.argv[1]
@@ -112,6 +119,6 @@ if __name__ == '__main__':
         os.mkdir(folder)
 
     # pass in both databases for combined extraction
-    main(['sprot', 'trembl'], folder, versions)
+    main(['sprot', 'trembl'], folder, versions, resume)
 
 # end